@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, g, send_file
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -9,14 +9,39 @@ from tqdm import tqdm
 import asyncio
 import aiohttp
 import threading
-from queue import Queue, Empty
+import importlib
+import hmac
+import hashlib
+import secrets
+from queue import Empty
 import json
 from flask import Response, stream_with_context, Flask, request, jsonify, render_template
 from cache_manager import (
     process_and_cache_series_data, process_and_cache_movies_data,
-    search_series, search_movies, search_all_content,
-    get_cached_data, get_series_count_by_category, get_movies_count_by_category
+    prefetch_catalog_covers, catalog_cover_urls,
+    search_page, SEARCH_PAGE_SIZE, refresh_cached_category,
+    get_movie_facets,
+    get_catalog, get_cache_metadata,
+    get_series_count_by_category, get_movies_count_by_category,
+    set_cache_partition, cache_build_lock,
+    get_cached_categories, get_cached_category_items,
+    listing_page, paginate_listing, sort_listing_items, LISTING_SORTS,
+    get_catalog_age_hours, LISTING_MAX_AGE_HOURS, get_cache_version, get_cache_dir
 )
+from suggest_index import get_suggestions, get_suggest_index
+from info_cache import series_info_cache, movie_info_cache
+from prefetch import info_prefetcher, cover_prefetcher
+from upstream_guard import guard_for, guards_status, UpstreamUnavailable
+from page_cache import cached_page, page_cache
+from json_api import json_response, api_error, make_etag, not_modified
+from image_cache import image_cache
+from stream_server import StreamProxyServer
+from library import (
+    DOWNLOADS_DIR, MOVIES_DIR, movie_download_info, movie_path, season_dir, episode_path,
+    partial_path, library
+)
+from refresh_scheduler import RefreshScheduler
+from shared_state import SharedQueue, shared_state, jobs, claim_services
 import config
 from config import BASE_URL, USERNAME, PASSWORD
 
@@ -25,7 +50,8 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-app.config['TEMPLATES_AUTO_RELOAD'] = True
+# Template stat checks on every render are for development; rendered pages are cached otherwise
+app.config['TEMPLATES_AUTO_RELOAD'] = os.environ.get('TEMPLATES_AUTO_RELOAD', '').lower() in ('1', 'true', 'yes')
 app.secret_key = 'your-secret-key'
 
 # Add JSON filter for Jinja2 templates
@@ -35,13 +61,113 @@ def tojsonfilter(obj):
 
 app.jinja_env.filters['tojsonfilter'] = tojsonfilter
 
+# Key signing /img and /stream_proxy URLs so the proxies only fetch URLs this app rendered
+# (default: generated once)
+IMAGE_URL_SECRET = os.environ.get('IMAGE_URL_SECRET')
+_url_key = None
+
+def url_signature(url):
+    global _url_key
+    if _url_key is None:
+        # Shared through the state database so every worker accepts the others' URLs
+        secret = IMAGE_URL_SECRET or shared_state.setdefault('image_url_secret', secrets.token_hex(32))
+        _url_key = secret.encode('utf-8')
+    return hmac.new(_url_key, url.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+def cover_src(url, width=150):
+    """Routes a provider cover URL through the local /img cache at a thumbnail width."""
+    if not url or not str(url).startswith(('http://', 'https://')):
+        return url or ''
+    url = str(url)
+    return url_for('image_proxy', url=url, w=width, sig=url_signature(url))
+
+app.jinja_env.filters['cover'] = cover_src
+
+def proxied_stream(stream_url):
+    """Player URL for a stream: the async proxy when it is running, else the Flask route."""
+    # With several workers the proxy runs in the one that owns background services
+    if stream_server.running or (stream_server.port and shared_state.get('stream_proxy') == 'running'):
+        return stream_server.public_url(stream_url, request.scheme, request.host)
+    return url_for('stream_proxy', url=stream_url, sig=url_signature(stream_url))
+
+app.jinja_env.filters['proxied_stream'] = proxied_stream
+
 # Context processor to make current user available in all templates
 @app.context_processor
 def inject_user():
-    return dict(current_user=get_current_user())
+    library.refresh()  # Badges include downloads other worker processes recorded
+    return dict(current_user=get_current_user(), downloaded=downloaded)
+
+def library_server():
+    """Server the current user's downloads are indexed under."""
+    user = get_current_user()
+    return (user['server'] if user else config.BASE_URL).rstrip('/')
+
+def downloaded(kind, item_id):
+    """True for a downloaded movie or episode; for a series, its number of downloaded episodes."""
+    if kind == 'series':
+        return library.series_count(library_server(), item_id)
+    return library.has(library_server(), kind, item_id)
+
+def library_version():
+    return library.refresh()
+
+# Point the cache at the current user's server; accounts on one server share it
+@app.before_request
+def select_cache_partition():
+    use_saved_account()
+    start_background_services()
+
+def use_saved_account():
+    """Reloads config.py if another worker changed it and selects the current account's cache partition."""
+    sync_config()
+    user = get_current_user()
+    if user:
+        set_cache_partition(user.get('server'), user.get('username'))
+    else:
+        set_cache_partition(config.BASE_URL, config.USERNAME)
+
+def start_background_services():
+    """Starts the refresh scheduler, stream proxy and library scan in the one process that owns them."""
+    if not claim_services():
+        return False
+    refresh_scheduler.start()
+    if stream_server.port:
+        shared_state.set('stream_proxy', 'running' if stream_server.start() else 'failed')
+    library.start()
+    return True
+
+_config_mtime = None
 
+def sync_config():
+    """Reloads config.py after another worker process rewrote it (users added, removed or switched)."""
+    global _config_mtime
+    try:
+        mtime = os.stat(config.__file__).st_mtime_ns
+    except OSError:
+        return
+    if _config_mtime is not None and mtime != _config_mtime:
+        try:
+            importlib.reload(config)
+        except Exception as e:
+            logger.error(f"Error reloading config: {str(e)}")
+            return
+    _config_mtime = mtime
+
+def write_config(content):
+    """Writes config.py atomically so other workers never load a partial file."""
+    temp_path = 'config.py.tmp'
+    try:
+        with open(temp_path, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, 'config.py')
+    except OSError:
+        # A bind-mounted config.py cannot be replaced; write it in place instead
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        with open('config.py', 'w') as f:
+            f.write(content)
 
-DOWNLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
 
 # Configure session for requests with more robust settings
 session = requests.Session()
@@ -65,6 +191,22 @@ session.headers.update({
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 })
 
+# player_api calls go through upstream_guard, which backs off on 429/503 itself,
+# so this session only retries transient gateway errors once
+api_session = requests.Session()
+api_adapter = HTTPAdapter(
+    max_retries=Retry(total=1, backoff_factor=0.5, status_forcelist=[500, 502, 504],
+                      allowed_methods=["GET"], raise_on_status=False),
+    pool_connections=10,
+    pool_maxsize=20
+)
+api_session.mount("http://", api_adapter)
+api_session.mount("https://", api_adapter)
+api_session.headers.update(session.headers)
+
+# Playback goes through its own asyncio proxy when STREAM_PROXY_PORT is set
+stream_server = StreamProxyServer(headers=session.headers, signer=url_signature)
+
 # Authentication helper functions
 def get_current_user():
     """Get current user configuration."""
@@ -170,8 +312,7 @@ PASSWORD = ""'''
         
         new_content = "# Multi-user configuration\n" + users_str + current_user_str + helper_functions
         
-        with open('config.py', 'w') as f:
-            f.write(new_content)
+        write_config(new_content)
             
         return True
         
@@ -224,8 +365,7 @@ PASSWORD = ""'''
             
             new_content = "# Multi-user configuration\n" + users_str + current_user_str + helper_functions
             
-            with open('config.py', 'w') as f:
-                f.write(new_content)
+            write_config(new_content)
             
             return True
         except Exception as e:
@@ -233,8 +373,8 @@ PASSWORD = ""'''
             return False
     return False
 
-def get_categories():
-    """Fetch all series categories with improved error handling"""
+def fetch_series_categories():
+    """Fetch all series categories from the provider; raises on any upstream error"""
     user = get_current_user()
     if not user:
         logger.error("No current user configured")
@@ -249,25 +389,36 @@ def get_categories():
         "action": "get_series_categories"
     }
     
+    logger.debug(f"Fetching categories from: {url}")
+    response = guard_for(user).get(api_session, url, params=params, timeout=(5, 15))
+    response.raise_for_status()
+    categories = response.json()
+    logger.debug(f"Retrieved {len(categories)} categories")
+    return categories
+
+def get_categories():
+    """Series categories for pages: from the provider, or the cached ones while it is failing"""
     try:
-        logger.debug(f"Fetching categories from: {url}")
-        response = session.get(url, params=params, timeout=(5, 15))
-        response.raise_for_status()
-        categories = response.json()
-        logger.debug(f"Retrieved {len(categories)} categories")
-        return categories
+        return fetch_series_categories()
+    except UpstreamUnavailable as e:
+        logger.warning(f"{str(e)}; using cached categories")
+        return get_cached_categories('series')
     except requests.exceptions.Timeout:
         logger.error("Request timed out while fetching categories")
-        return []
+        return get_cached_categories('series')
     except requests.exceptions.ConnectionError as e:
         logger.error(f"Connection error: {str(e)}")
-        return []
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        return []
-
-def get_series_by_category(category_id):
-    """Fetch all series in a category"""
+        return get_cached_categories('series')
+    except requests.exceptions.RequestException as e:
+        # HTTP errors and malformed responses
+        logger.error(f"Upstream error: {str(e)}")
+        return get_cached_categories('series')
+    except Exception:
+        logger.exception("Unexpected error fetching categories")
+        raise
+
+def fetch_series_list(category_id):
+    """Fetch all series in a category from the provider; raises on any upstream error"""
     user = get_current_user()
     if not user:
         logger.error("No current user configured")
@@ -283,16 +434,24 @@ def get_series_by_category(category_id):
         "category_id": category_id
     }
     
-    try:
-        response = session.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error fetching series list: {str(e)}")
-        return []
+    response = guard_for(user).get(api_session, url, params=params, timeout=(5, 60))
+    response.raise_for_status()
+    return response.json()
 
-def get_series_info(series_id):
-    """Fetch series information"""
+def get_series_by_category(category_id):
+    """Series in a category for pages: from the provider, or the cached ones while it is failing"""
+    try:
+        return fetch_series_list(category_id)
+    except requests.exceptions.RequestException as e:
+        # Network, HTTP and malformed-response errors, and the open circuit breaker
+        print(f"Error fetching series list: {str(e)}; using cached series")
+        return get_cached_category_items('series', category_id)
+    except Exception:
+        logger.exception(f"Unexpected error fetching series for category {category_id}")
+        raise
+
+def fetch_series_info(series_id):
+    """Fetch series information from the server"""
     user = get_current_user()
     if not user:
         logger.error("No current user configured")
@@ -309,15 +468,19 @@ def get_series_info(series_id):
     }
     
     try:
-        response = session.get(url, params=params)
+        response = guard_for(user).get(api_session, url, params=params, timeout=(5, 30))
         response.raise_for_status()
         return response.json()
     except Exception as e:
         print(f"Error fetching series info: {str(e)}")
         return None
 
-def get_movie_categories():
-    """Fetch all movie categories"""
+def get_series_info(series_id):
+    """Series information from the local cache, fetched or revalidated as needed"""
+    return series_info_cache.get(series_id, fetch_series_info)
+
+def fetch_movie_categories():
+    """Fetch all movie categories from the provider; raises on any upstream error"""
     user = get_current_user()
     if not user:
         logger.error("No current user configured")
@@ -332,25 +495,36 @@ def get_movie_categories():
         "action": "get_vod_categories"
     }
     
+    logger.debug(f"Fetching movie categories from: {url}")
+    response = guard_for(user).get(api_session, url, params=params, timeout=(5, 15))
+    response.raise_for_status()
+    categories = response.json()
+    logger.debug(f"Retrieved {len(categories)} movie categories")
+    return categories
+
+def get_movie_categories():
+    """Movie categories for pages: from the provider, or the cached ones while it is failing"""
     try:
-        logger.debug(f"Fetching movie categories from: {url}")
-        response = session.get(url, params=params, timeout=(5, 15))
-        response.raise_for_status()
-        categories = response.json()
-        logger.debug(f"Retrieved {len(categories)} movie categories")
-        return categories
+        return fetch_movie_categories()
+    except UpstreamUnavailable as e:
+        logger.warning(f"{str(e)}; using cached movie categories")
+        return get_cached_categories('movies')
     except requests.exceptions.Timeout:
         logger.error("Request timed out while fetching movie categories")
-        return []
+        return get_cached_categories('movies')
     except requests.exceptions.ConnectionError as e:
         logger.error(f"Connection error: {str(e)}")
-        return []
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        return []
-
-def get_movies_by_category(category_id):
-    """Fetch all movies in a category"""
+        return get_cached_categories('movies')
+    except requests.exceptions.RequestException as e:
+        # HTTP errors and malformed responses
+        logger.error(f"Upstream error: {str(e)}")
+        return get_cached_categories('movies')
+    except Exception:
+        logger.exception("Unexpected error fetching categories")
+        raise
+
+def fetch_movies_list(category_id):
+    """Fetch all movies in a category from the provider; raises on any upstream error"""
     user = get_current_user()
     if not user:
         logger.error("No current user configured")
@@ -366,16 +540,24 @@ def get_movies_by_category(category_id):
         "category_id": category_id
     }
     
-    try:
-        response = session.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error fetching movies list: {str(e)}")
-        return []
+    response = guard_for(user).get(api_session, url, params=params, timeout=(5, 60))
+    response.raise_for_status()
+    return response.json()
 
-def get_movie_info(vod_id):
-    """Fetch movie information"""
+def get_movies_by_category(category_id):
+    """Movies in a category for pages: from the provider, or the cached ones while it is failing"""
+    try:
+        return fetch_movies_list(category_id)
+    except requests.exceptions.RequestException as e:
+        # Network, HTTP and malformed-response errors, and the open circuit breaker
+        print(f"Error fetching movies list: {str(e)}; using cached movies")
+        return get_cached_category_items('movies', category_id)
+    except Exception:
+        logger.exception(f"Unexpected error fetching movies for category {category_id}")
+        raise
+
+def fetch_movie_info(vod_id):
+    """Fetch movie information from the server"""
     user = get_current_user()
     if not user:
         logger.error("No current user configured")
@@ -393,7 +575,7 @@ def get_movie_info(vod_id):
     
     try:
         logger.debug(f"Fetching movie info from: {url} with params: {params}")
-        response = session.get(url, params=params)
+        response = guard_for(user).get(api_session, url, params=params, timeout=(5, 30))
         response.raise_for_status()
         movie_data = response.json()
         logger.debug(f"Movie API response: {movie_data}")
@@ -402,6 +584,25 @@ def get_movie_info(vod_id):
         logger.error(f"Error fetching movie info: {str(e)}")
         return None
 
+def get_movie_info(vod_id):
+    """Movie information from the local cache, fetched or revalidated as needed"""
+    return movie_info_cache.get(vod_id, fetch_movie_info)
+
+def from_upstream(fetch):
+    """Wraps a provider fetcher for cache builds: any upstream error aborts the build, keeping the old cache.
+
+    Builds must never use the cached fallback of the page getters, or a failed
+    build would be saved as a fresh full fetch of the old data.
+    """
+    def fetch_or_abort(*args):
+        try:
+            return fetch(*args)
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, UpstreamUnavailable):
+                raise
+            raise UpstreamUnavailable(f"Provider request failed during the cache build: {str(e)}") from e
+    return fetch_or_abort
+
 def download_movie_file(movie_info, output_path, stream_id=None):
     """Download a single movie file with enhanced progress tracking"""
     # Try multiple ways to get the stream_id
@@ -448,6 +649,18 @@ def download_movie_file(movie_info, output_path, stream_id=None):
                 # Reset the response by making a new request
                 response = session.get(url, stream=True, allow_redirects=True)
         
+        # Same stream and size already downloaded (another category or account): link it instead
+        reused = library.reuse(base_url, 'movie', stream_id, file_size, output_path)
+        if reused:
+            response.close()
+            sse_queue.put({
+                'movie': title,
+                'progress': 100,
+                'status': 'complete',
+                'message': reuse_message(reused)
+            })
+            return True
+        
         # Set up CLI progress bar
         progress_bar = tqdm(
             total=file_size,
@@ -464,7 +677,8 @@ def download_movie_file(movie_info, output_path, stream_id=None):
         # If file_size is 0, we'll update progress based on downloaded bytes
         use_size_based_progress = file_size > 0
         
-        with open(output_path, 'wb') as f:
+        # Written under a temporary name so a file at output_path is always complete
+        with open(partial_path(output_path), 'wb') as f:
             for data in response.iter_content(chunk_size=8192):
                 if data:
                     size = f.write(data)
@@ -524,6 +738,7 @@ def download_movie_file(movie_info, output_path, stream_id=None):
                         last_update_time = current_time
         
         progress_bar.close()
+        os.replace(partial_path(output_path), output_path)
         
         # Send final completion update
         final_time = time.time() - start_time
@@ -548,8 +763,8 @@ def download_movie_file(movie_info, output_path, stream_id=None):
         return True
     except Exception as e:
         logger.error(f"Error downloading {title}: {str(e)}")
-        if os.path.exists(output_path):
-            os.remove(output_path)
+        if os.path.exists(partial_path(output_path)):
+            os.remove(partial_path(output_path))
         
         # Send error progress update
         error_progress = {
@@ -561,6 +776,11 @@ def download_movie_file(movie_info, output_path, stream_id=None):
         sse_queue.put(error_progress)
         return False
 
+def reuse_message(reused):
+    if reused == 'linked':
+        return 'Already downloaded elsewhere in the library; linked the existing copy'
+    return 'Already downloaded'
+
 def format_bytes(bytes_value):
     """Convert bytes to human readable format"""
     if bytes_value == 0:
@@ -605,6 +825,19 @@ def download_episode_file(episode, output_path, episode_num=1, total_episodes=1)
         file_size = int(response.headers.get('content-length', 0))
         logger.debug(f"File size: {file_size} bytes")
         
+        reused = library.reuse(base_url, 'episode', episode['id'], file_size, output_path)
+        if reused:
+            response.close()
+            sse_queue.put({
+                'episode': episode['title'],
+                'episode_num': episode_num,
+                'total_episodes': total_episodes,
+                'progress': 100,
+                'status': 'episode_complete',
+                'message': reuse_message(reused)
+            })
+            return True
+        
         # Set up CLI progress bar
         progress_bar = tqdm(
             total=file_size,
@@ -619,7 +852,8 @@ def download_episode_file(episode, output_path, episode_num=1, total_episodes=1)
         last_downloaded = 0
         update_interval = 0.5  # Update every 0.5 seconds
         
-        with open(output_path, 'wb') as f:
+        # Written under a temporary name so a file at output_path is always complete
+        with open(partial_path(output_path), 'wb') as f:
             for data in response.iter_content(chunk_size=8192):
                 if data:
                     size = f.write(data)
@@ -673,6 +907,7 @@ def download_episode_file(episode, output_path, episode_num=1, total_episodes=1)
                         last_downloaded = downloaded
         
         progress_bar.close()
+        os.replace(partial_path(output_path), output_path)
         
         # Send final completion update for this episode
         final_time = time.time() - start_time
@@ -698,8 +933,8 @@ def download_episode_file(episode, output_path, episode_num=1, total_episodes=1)
         return True
     except Exception as e:
         logger.error(f"Error downloading {episode['title']}: {str(e)}")
-        if os.path.exists(output_path):
-            os.remove(output_path)
+        if os.path.exists(partial_path(output_path)):
+            os.remove(partial_path(output_path))
         
         # Send error progress update
         error_progress = {
@@ -902,8 +1137,7 @@ PASSWORD = ""'''
         
         new_content = "# Multi-user configuration\n" + users_str + current_user_str + helper_functions
         
-        with open('config.py', 'w') as f:
-            f.write(new_content)
+        write_config(new_content)
             
     except Exception as e:
         logger.error(f"Error during logout: {str(e)}")
@@ -943,8 +1177,7 @@ BASE_URL = ""
 USERNAME = ""
 PASSWORD = ""'''
         
-        with open('config.py', 'w') as f:
-            f.write(new_content)
+        write_config(new_content)
             
         return jsonify({'success': True, 'message': 'All users cleared successfully'})
             
@@ -965,8 +1198,22 @@ def get_users():
         })
     return jsonify({'users': users})
 
+def load_categories(content_type):
+    """Categories from the local catalog while it is fresh (making the page cacheable), else from upstream"""
+    age = get_catalog_age_hours(content_type)
+    if age is not None and age <= LISTING_MAX_AGE_HOURS:
+        categories = get_cached_categories(content_type)
+        if categories:
+            g.page_cacheable = True
+            return categories
+    return get_categories() if content_type == 'series' else get_movie_categories()
+
+def current_account():
+    return config.CURRENT_USER
+
 @app.route('/series')
 @app.route('/series/page/<int:page>')
+@cached_page('series', current_account)
 def series_index(page=1):
     # Get per_page from query parameter, default to 50
     per_page = request.args.get('per_page', 50, type=int)
@@ -974,7 +1221,7 @@ def series_index(page=1):
     if per_page not in [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]:
         per_page = 50
     
-    categories = get_categories()
+    categories = load_categories('series')
     if not categories:
         return render_template('error.html', 
                             message="Unable to fetch categories. Please try again later."), 503
@@ -995,8 +1242,49 @@ def series_index(page=1):
                          category_counts=category_counts,
                          per_page=per_page)
 
+def category_listing(content_type, category_id, per_page, page):
+    """Loads one page of a category for the listing routes.
+
+    Pages come from the local catalog (sorted by ?sort=, resumed with the
+    ?after= keyset cursor); the category is fetched upstream only when the
+    catalog is stale or does not have it.
+    """
+    sort = request.args.get('sort', 'default')
+    if sort not in LISTING_SORTS:
+        sort = 'default'
+    cursor = request.args.get('after')
+
+    local = listing_page(content_type, category_id, sort, per_page, page, cursor)
+    if local:
+        items, total, start, next_cursor = local
+        next_page = (listing_page(content_type, category_id, sort, per_page, cursor=next_cursor)
+                     if next_cursor and info_prefetcher.enabled else None)
+        next_items = next_page[0] if next_page else []
+        categories = get_cached_categories(content_type)
+        g.page_cacheable = True
+    else:
+        fetch_items = get_series_by_category if content_type == 'series' else get_movies_by_category
+        keys, all_items = sort_listing_items(fetch_items(category_id), content_type, sort)
+        start, next_cursor = paginate_listing(keys, per_page, page, cursor)
+        items, total = all_items[start:start + per_page], len(all_items)
+        next_items = all_items[start + per_page:start + 2 * per_page]
+        categories = get_categories() if content_type == 'series' else get_movie_categories()
+
+    category_name = next((cat['category_name'] for cat in categories
+                          if str(cat['category_id']) == str(category_id)), 'Unknown Category')
+    return {
+        'items': items,
+        'next_items': next_items,
+        'page': start // per_page + 1,
+        'pages': (total + per_page - 1) // per_page,
+        'next_cursor': next_cursor,
+        'sort': sort,
+        'category_name': category_name
+    }
+
 @app.route('/series/<category_id>')
 @app.route('/series/<category_id>/page/<int:page>')
+@cached_page('series', current_account, library_version)
 def series(category_id, page=1):
     # Get per_page from query parameter, default to 50
     per_page = request.args.get('per_page', 50, type=int)
@@ -1004,24 +1292,21 @@ def series(category_id, page=1):
     if per_page not in [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]:
         per_page = 50
     
-    series_list = get_series_by_category(category_id)
+    listing = category_listing('series', category_id, per_page, page)
     
-    # Get category name
-    categories = get_categories()
-    category_name = next((cat['category_name'] for cat in categories if cat['category_id'] == category_id), 'Unknown Category')
-    
-    # Calculate pagination
-    total = len(series_list)
-    pages = (total + per_page - 1) // per_page
-    start = (page - 1) * per_page
-    end = start + per_page
+    # Warm series info for this page and the next so opening a title is instant
+    info_prefetcher.enqueue(series_info_cache,
+                            [item.get('series_id') for item in listing['items'] + listing['next_items']],
+                            fetch_series_info)
     
     return render_template('series.html', 
-                         series_list=series_list[start:end],
-                         current_page=page,
-                         total_pages=pages,
+                         series_list=listing['items'],
+                         current_page=listing['page'],
+                         total_pages=listing['pages'],
+                         next_cursor=listing['next_cursor'],
+                         sort=listing['sort'],
                          category_id=category_id,
-                         category_name=category_name,
+                         category_name=listing['category_name'],
                          per_page=per_page)
 
 @app.route('/download', methods=['POST'])
@@ -1074,11 +1359,13 @@ def download_episodes():
             return jsonify({'error': 'No episodes found in selected range'}), 400
         
         # Create downloads directory if it doesn't exist
-        series_dir = os.path.join(DOWNLOADS_DIR, f"{series_data['info']['name']} - S{season}")
+        series_dir = season_dir(series_data, season)
         os.makedirs(series_dir, exist_ok=True)
+        server = library_server()
         
         # Start download process in background thread
         def download_worker():
+            job_id = jobs.start('episodes', f"{series_data['info']['name']} - S{season}")
             try:
                 total = len(episodes_to_download)
                 successful_downloads = 0
@@ -1103,10 +1390,11 @@ def download_episodes():
                         'message': f'Starting episode {i} of {total}: {episode["title"]}'
                     })
                     
-                    output_path = os.path.join(series_dir, f"{episode['title']}.{episode['container_extension']}")
+                    output_path = episode_path(series_data, season, episode)
                     success = download_episode_file(episode, output_path, i, total)
                     
                     if success:
+                        library.record(output_path, 'episode', episode['id'], server, series_id)
                         successful_downloads += 1
                     else:
                         failed_downloads += 1
@@ -1141,10 +1429,12 @@ def download_episodes():
                     'total_time': total_time,
                     'formatted_total_time': format_time(total_time)
                 })
+                jobs.finish(job_id, 'complete', completion_message)
                 # Send sentinel to close connection
                 sse_queue.put(None)
             except Exception as e:
                 logger.error(f"Download worker error: {str(e)}")
+                jobs.finish(job_id, 'failed', str(e))
                 sse_queue.put({
                     'status': 'error',
                     'error': str(e),
@@ -1169,7 +1459,8 @@ def download_episodes():
         return jsonify({'error': str(e)}), 500
 
 # Add SSE route for progress updates
-sse_queue = Queue()
+# Shared by every worker process, so progress reaches whichever one serves the stream
+sse_queue = SharedQueue(shared_state, 'progress')
 
 @app.route('/progress')
 def progress():
@@ -1182,7 +1473,7 @@ def progress():
                     if progress is None:  # Use None as sentinel to stop
                         break
                     yield f"data: {json.dumps(progress)}\n\n"
-                except Queue.Empty:
+                except Empty:
                     # Send keep-alive message every 30 seconds
                     yield ": keep-alive\n\n"
         except GeneratorExit:
@@ -1205,39 +1496,255 @@ def progress():
 def test_base_html():
     return render_template('base.html')
 
+def parse_movie_filters(args):
+    """Reads movie facet filters (genre, category, year_min, year_max, min_rating) from request args."""
+    filters = {}
+    genres = [genre for genre in args.getlist('genre') if genre]
+    if genres:
+        filters['genres'] = genres
+    categories = [category for category in args.getlist('category') if category]
+    if categories:
+        filters['categories'] = categories
+    year_min = args.get('year_min', type=int)
+    if year_min:
+        filters['year_min'] = year_min
+    year_max = args.get('year_max', type=int)
+    if year_max:
+        filters['year_max'] = year_max
+    min_rating = args.get('min_rating', type=float)
+    if min_rating:
+        filters['min_rating'] = min_rating
+    return filters
+
+def movie_filter_args(filters):
+    """Turns parsed filters back into query arguments for pagination links."""
+    return {
+        'genre': filters.get('genres', []),
+        'category': filters.get('categories', []),
+        'year_min': filters.get('year_min'),
+        'year_max': filters.get('year_max'),
+        'min_rating': filters.get('min_rating')
+    }
+
 @app.route('/search')
 def search():
     query = request.args.get('query')
     content_type = request.args.get('content_type', 'all')  # 'series', 'movies', or 'all'
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', 1, type=int)
+    # Get per_page from query parameter, default to SEARCH_PAGE_SIZE
+    per_page = request.args.get('per_page', SEARCH_PAGE_SIZE, type=int)
+    # Validate per_page to be within allowed range
+    if per_page not in [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]:
+        per_page = SEARCH_PAGE_SIZE
+    
+    filters = parse_movie_filters(request.args)
+    if filters:
+        content_type = 'movies'
     
     results = []
+    next_cursor = None
+    total_results = 0
+    facets = None
     series_last_fetch_date = None
     movies_last_fetch_date = None
 
     # Get cached data dates
-    series_cached_data = get_cached_data('series')
-    movies_cached_data = get_cached_data('movies')
-    
-    if series_cached_data:
-        series_last_fetch_date = series_cached_data.get("last_fetch_date")
-    if movies_cached_data:
-        movies_last_fetch_date = movies_cached_data.get("last_fetch_date")
-
-    if query:
-        if content_type == 'series':
-            results, _ = search_series(query)
-        elif content_type == 'movies':
-            results, _ = search_movies(query)
-        else:  # 'all'
-            results, _ = search_all_content(query)
+    series_catalog = get_catalog('series')
+    movies_catalog = get_catalog('movies')
+    
+    if series_catalog:
+        series_last_fetch_date = series_catalog.last_fetch_date
+    if movies_catalog:
+        movies_last_fetch_date = movies_catalog.last_fetch_date
+
+    if query or filters:
+        if content_type not in ('series', 'movies'):
+            content_type = 'all'
+        results, next_cursor, total_results, _ = search_page(query, content_type, per_page, cursor, filters)
+    
+    # Facet counts for the movie filter panel
+    if content_type == 'movies':
+        facets = get_movie_facets(query, filters)
+        if facets['category']:
+            movies_metadata = get_cache_metadata('movies') or {}
+            facets['category_names'] = {c['category_id']: c.get('category_name') or c['category_id']
+                                        for c in movies_metadata.get('categories', [])}
 
     return render_template('search.html', 
                          query=query, 
                          results=results, 
                          content_type=content_type,
+                         total_results=total_results,
+                         next_cursor=next_cursor,
+                         filters=filters,
+                         filter_args=movie_filter_args(filters),
+                         facets=facets,
+                         current_page=page,
+                         per_page=per_page,
                          series_last_fetch_date=series_last_fetch_date,
                          movies_last_fetch_date=movies_last_fetch_date)
 
+@app.route('/api/movies/facets')
+def movie_facets_api():
+    """Faceted movie filtering as JSON: matching movies plus facet counts."""
+    query = request.args.get('query', '').strip()
+    cursor = request.args.get('cursor')
+    per_page = request.args.get('per_page', SEARCH_PAGE_SIZE, type=int)
+    per_page = max(1, min(per_page, 100))
+    filters = parse_movie_filters(request.args)
+
+    results, next_cursor, total_results, last_fetch_date = search_page(
+        query, 'movies', per_page, cursor, filters or None) if (query or filters) else ([], None, 0, None)
+
+    return jsonify({
+        'query': query,
+        'filters': filters,
+        'total': total_results,
+        'results': results,
+        'next_cursor': next_cursor,
+        'facets': get_movie_facets(query, filters),
+        'last_fetch_date': last_fetch_date
+    })
+
+# Versioned JSON API for lightweight clients. Responses are streamed, gzipped
+# when accepted, and tagged with ETags derived from the catalog version.
+API_CONTENT_TYPES = ('series', 'movies')
+
+def api_content_type():
+    content_type = request.args.get('type', 'series')
+    return content_type if content_type in API_CONTENT_TYPES else None
+
+def catalog_etag(*content_types):
+    """ETag for responses built only from local catalogs, or None when any of them is stale."""
+    versions = []
+    for content_type in content_types:
+        age = get_catalog_age_hours(content_type)
+        if age is None or age > LISTING_MAX_AGE_HOURS:
+            return None
+        versions.append(get_cache_version(content_type))
+    return make_etag(config.CURRENT_USER, get_cache_dir(), request.full_path, *versions)
+
+@app.route('/api/v1/categories')
+def api_categories():
+    """Categories of a content type with their item counts."""
+    content_type = api_content_type()
+    if not content_type:
+        return api_error('type must be series or movies', 400)
+
+    def payload():
+        counts = get_series_count_by_category() if content_type == 'series' else get_movies_count_by_category()
+        return {
+            'type': content_type,
+            'categories': [dict(category, count=counts.get(str(category['category_id']), 0))
+                           for category in load_categories(content_type)]
+        }
+    return json_response(payload, catalog_etag(content_type))
+
+@app.route('/api/v1/categories/<category_id>/items')
+def api_category_items(category_id):
+    """One page of a category; pass next_cursor back as ?after= for the following page."""
+    content_type = api_content_type()
+    if not content_type:
+        return api_error('type must be series or movies', 400)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 100))
+
+    def payload():
+        listing = category_listing(content_type, category_id, limit, request.args.get('page', 1, type=int))
+        return {
+            'type': content_type,
+            'category_id': category_id,
+            'category_name': listing['category_name'],
+            'sort': listing['sort'],
+            'page': listing['page'],
+            'pages': listing['pages'],
+            'items': listing['items'],
+            'next_cursor': listing['next_cursor']
+        }
+    return json_response(payload, catalog_etag(content_type))
+
+@app.route('/api/v1/search')
+def api_search():
+    """Ranked search over the local catalog; movie facet filters use the /search parameters."""
+    query = request.args.get('q', '').strip()
+    content_type = request.args.get('type', 'all')
+    if content_type not in API_CONTENT_TYPES:
+        content_type = 'all'
+    filters = parse_movie_filters(request.args)
+    if filters:
+        content_type = 'movies'
+    if not (query or filters):
+        return api_error('q or a filter is required', 400)
+    limit = max(1, min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 100))
+
+    def payload():
+        results, next_cursor, total, last_fetch_date = search_page(
+            query, content_type, limit, request.args.get('cursor'), filters or None)
+        return {
+            'query': query,
+            'type': content_type,
+            'filters': filters,
+            'total': total,
+            'results': results,
+            'next_cursor': next_cursor,
+            'last_fetch_date': last_fetch_date
+        }
+    searched = API_CONTENT_TYPES if content_type == 'all' else (content_type,)
+    return json_response(payload, make_etag(config.CURRENT_USER, get_cache_dir(), request.full_path,
+                                            *[get_cache_version(ct) for ct in searched]))
+
+def api_item(content_type, item_id, info_cache, get_info):
+    """Catalog record plus cached player_api info for one title.
+
+    The ETag is checked against the locally cached info first, so a client
+    that is already current gets 304 without anything being fetched upstream.
+    """
+    def item_etag(fetched_at):
+        return make_etag(config.CURRENT_USER, get_cache_dir(), request.path, get_cache_version(content_type),
+                         fetched_at)
+
+    _, fetched_at = info_cache.peek(item_id)
+    response = not_modified(item_etag(fetched_at))
+    if response is not None:
+        if fetched_at is not None:
+            get_info(item_id)  # Already cached, so this only schedules a revalidation once it has expired
+        return response
+
+    info = get_info(item_id)
+    catalog = get_catalog(content_type)
+    index = catalog.index_of(item_id) if catalog else None
+    record = catalog.record(index) if index is not None else None
+    if not info and not record:
+        return api_error('Not found', 404)
+    _, fetched_at = info_cache.peek(item_id)
+    return json_response({'type': content_type, 'id': str(item_id), 'record': record, 'info': info},
+                         item_etag(fetched_at))
+
+@app.route('/api/v1/series/<series_id>')
+def api_series(series_id):
+    return api_item('series', series_id, series_info_cache, get_series_info)
+
+@app.route('/api/v1/movies/<vod_id>')
+def api_movie(vod_id):
+    return api_item('movies', vod_id, movie_info_cache, get_movie_info)
+
+@app.route('/suggest')
+def suggest():
+    """Typeahead suggestions for titles and actor names from the cached catalog."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'query': query, 'suggestions': []})
+
+    start_time = time.perf_counter()
+    suggestions = get_suggestions(query)
+    took_ms = (time.perf_counter() - start_time) * 1000
+
+    return jsonify({
+        'query': query,
+        'suggestions': suggestions,
+        'took_ms': round(took_ms, 3)
+    })
+
 @app.route('/cache_progress')
 def cache_progress():
     def generate():
@@ -1277,7 +1784,21 @@ def cache_data():
     """Endpoint to trigger the caching of data in a background thread."""
     cache_type = request.args.get('cache_type', 'both')  # 'series', 'movies', or 'both'
     
+    if not cache_build_lock.acquire(blocking=False):
+        # The progress stream belongs to the running build; only this response reports the conflict
+        return jsonify({"status": "error",
+                        "message": "A cache refresh is already running. Please try again when it finishes."}), 409
+
+    lock_held = True
+    def release_build_lock():
+        nonlocal lock_held
+        if lock_held:
+            lock_held = False
+            cache_build_lock.release()
+
     def caching_worker(app_context):
+        job_id = jobs.start('cache_build', cache_type)
+        status, error = 'complete', None
         with app_context:
             try:
                 def progress_callback(progress, message, status, details=None):
@@ -1307,7 +1828,9 @@ def cache_data():
                             'eta_seconds': details.get('eta_seconds', 0),
                             'formatted_elapsed': format_cache_time(details.get('elapsed_time', 0)),
                             'formatted_eta': format_cache_time(details.get('eta_seconds', 0)) if details.get('eta_seconds', 0) > 0 else '--:--',
-                            'avg_time_per_category': details.get('avg_time_per_category', 0)
+                            'avg_time_per_category': details.get('avg_time_per_category', 0),
+                            'covers_done': details.get('covers_done', 0),
+                            'covers_total': details.get('covers_total', 0)
                         })
                         
                         # Calculate processing rate
@@ -1323,35 +1846,56 @@ def cache_data():
                     
                     sse_queue.put(progress_data)
                 
-                # Cache based on type
-                if cache_type == 'series':
-                    process_and_cache_series_data(get_categories, get_series_by_category, progress_callback)
-                elif cache_type == 'movies':
-                    process_and_cache_movies_data(get_movie_categories, get_movies_by_category, progress_callback)
-                else:  # 'both'
-                    # Cache series first
-                    sse_queue.put({
-                        'status': 'starting',
-                        'message': 'Starting series caching...',
-                        'cache_type': 'series'
-                    })
-                    process_and_cache_series_data(get_categories, get_series_by_category, progress_callback)
-                    
-                    # Then cache movies
-                    sse_queue.put({
-                        'status': 'starting',
-                        'message': 'Starting movies caching...',
-                        'cache_type': 'movies'
-                    })
-                    process_and_cache_movies_data(get_movie_categories, get_movies_by_category, progress_callback)
-                
+                # Catalogs are built under the lock; their covers are fetched once it is released
+                built = []
+                held = []  # 'complete' updates, sent after the covers stage so the page stays on the stream
+                def build_progress(progress, message, status, details=None):
+                    if status == 'complete' and cover_prefetcher.enabled:
+                        held.append((progress, message, status, details))
+                    else:
+                        progress_callback(progress, message, status, details)
+
+                try:
+                    if cache_type in ('series', 'both'):
+                        if cache_type == 'both':
+                            sse_queue.put({
+                                'status': 'starting',
+                                'message': 'Starting series caching...',
+                                'cache_type': 'series'
+                            })
+                        if process_and_cache_series_data(from_upstream(fetch_series_categories), from_upstream(fetch_series_list), build_progress):
+                            built.append('series')
+                    if cache_type in ('movies', 'both'):
+                        if cache_type == 'both':
+                            sse_queue.put({
+                                'status': 'starting',
+                                'message': 'Starting movies caching...',
+                                'cache_type': 'movies'
+                            })
+                        if process_and_cache_movies_data(from_upstream(fetch_movie_categories), from_upstream(fetch_movies_list), build_progress):
+                            built.append('movies')
+                finally:
+                    release_build_lock()
+
+                for content_type in built:
+                    prefetch_catalog_covers(cover_prefetcher, catalog_cover_urls(content_type),
+                                            'series' if content_type == 'series' else 'movie',
+                                            progress_callback, wait=True)
+                for update in held:
+                    progress_callback(*update)
+
             except Exception as e:
                 logger.error(f"Error during caching process: {str(e)}")
+                status, error = 'failed', str(e)
                 sse_queue.put({
                     'status': 'error',
                     'message': f'Caching failed: {str(e)}'
                 })
             finally:
+                release_build_lock()
+                jobs.finish(job_id, status, error)
+                # Start rebuilding typeahead now rather than on the first /suggest request
+                get_suggest_index()
                 sse_queue.put(None) # Sentinel to close the SSE connection
 
     # Start the caching process in a new thread
@@ -1362,6 +1906,99 @@ def cache_data():
 
     return jsonify({"status": "success", "message": "Caching process initiated in background."})
 
+@app.route('/refresh_category/<content_type>/<category_id>', methods=['POST'])
+def refresh_category(content_type, category_id):
+    """Re-fetches one category into the local catalog without rebuilding the rest."""
+    if content_type not in ('series', 'movies'):
+        return jsonify({"status": "error", "message": "Unknown content type."}), 400
+    if not cache_build_lock.acquire(blocking=False):
+        return jsonify({"status": "error", "message": "A cache refresh is already running."}), 409
+    try:
+        fetch = fetch_series_list if content_type == 'series' else fetch_movies_list
+        names = {category['category_id']: category['category_name']
+                 for category in get_cached_categories(content_type)}
+        delta = refresh_cached_category(content_type, category_id, names.get(str(category_id)),
+                                        from_upstream(fetch))
+    except UpstreamUnavailable as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    finally:
+        cache_build_lock.release()
+    if delta is None:
+        return jsonify({"status": "error", "message": "No local catalog yet; build the cache first."}), 404
+    return jsonify({"status": "success", **delta})
+
+# Scheduled refresh of stale catalogs (see refresh_scheduler.py for the settings)
+refresh_scheduler = RefreshScheduler(get_current_user, {
+    'series': (from_upstream(fetch_series_categories), from_upstream(fetch_series_list)),
+    'movies': (from_upstream(fetch_movie_categories), from_upstream(fetch_movies_list))
+}, cover_prefetcher=cover_prefetcher, select_account=use_saved_account)
+
+@app.route('/api/jobs')
+def jobs_status():
+    """JSON list of downloads and cache builds started in any worker process."""
+    return jsonify({'jobs': jobs.list(), 'pid': os.getpid()})
+
+@app.route('/api/refresh/status')
+def refresh_status():
+    """JSON view of the refresh schedule, catalog ages and recent runs."""
+    return jsonify(refresh_scheduler.status())
+
+@app.route('/api/upstream/status')
+def upstream_status():
+    """JSON view of each account's circuit breaker and adaptive concurrency limit."""
+    return jsonify(guards_status())
+
+@app.route('/api/page_cache/status')
+def page_cache_status():
+    """JSON counters for the rendered page cache."""
+    return jsonify(page_cache.status())
+
+@app.route('/api/prefetch/status')
+def prefetch_status():
+    """JSON counters for the listing page info prefetcher."""
+    return jsonify(info_prefetcher.status())
+
+@app.route('/api/stream/status')
+def stream_proxy_status():
+    """JSON counters for the async stream proxy."""
+    return jsonify(stream_server.status())
+
+@app.route('/api/library/status')
+def library_status():
+    """JSON summary of the downloads library index."""
+    return jsonify(library.status())
+
+@app.route('/api/library/verify')
+def library_verify():
+    """Checks downloaded files against the library manifest; ?deep=1 re-hashes every file."""
+    return jsonify(library.verify(deep=request.args.get('deep', type=int) == 1))
+
+@app.route('/img')
+def image_proxy():
+    """Serves a cover from the local image cache, fetching and resizing it on first use."""
+    url = request.args.get('url', '')
+    if not url.startswith(('http://', 'https://')):
+        return "Invalid image URL", 400
+    # Only URLs signed by the cover filter, so /img cannot be used to fetch arbitrary addresses
+    if not hmac.compare_digest(request.args.get('sig', ''), url_signature(url)):
+        return "Invalid image signature", 403
+    cached = image_cache.get(url, request.args.get('w', type=int))
+    if not cached:
+        # Broken covers are negatively cached server side; let browsers skip them for a while too
+        response = Response("Image unavailable", status=404)
+        response.headers['Cache-Control'] = 'public, max-age=3600'
+        return response
+    data, mimetype = cached
+    response = Response(data, mimetype=mimetype or 'application/octet-stream')
+    response.set_etag(make_etag(url, request.args.get('w')))
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
+@app.route('/api/images/status')
+def image_cache_status():
+    """JSON counters for the cover image cache and its catalog prefetcher."""
+    return jsonify(dict(image_cache.status(), prefetch=cover_prefetcher.status()))
+
 # Streaming routes
 @app.route('/watch/movie/<vod_id>')
 def watch_movie(vod_id):
@@ -1389,10 +2026,16 @@ def watch_movie(vod_id):
     base_url = user['server'].rstrip('/')
     stream_url = f"{base_url}/movie/{user['username']}/{user['password']}/{stream_id}.{container_extension}"
     
+    # Already downloaded: play from disk instead of using a provider connection
+    local_path = locate_movie(movie_data, vod_id)
+    player_src = url_for('local_movie', vod_id=vod_id) if local_path else proxied_stream(stream_url)
+    
     return render_template('watch_movie.html', 
                          movie=movie_data, 
                          vod_id=vod_id,
                          stream_url=stream_url,
+                         player_src=player_src,
+                         is_local=bool(local_path),
                          referrer=referrer,
                          search_query=search_query,
                          content_type=content_type)
@@ -1405,29 +2048,17 @@ def watch_series(series_id, episode_id):
     content_type = request.args.get('content_type', 'all')
     season = request.args.get('season', '1')
     
-    series_data = get_series_info(series_id)
+    # Locate the episode through the episode index (scans the series only on a miss)
+    series_data, current_season, episode_info = series_info_cache.find_episode(
+        episode_id, fetch_series_info, series_id=series_id)
     if not series_data:
         return render_template('error.html', 
                              message="Could not fetch series information"), 503
     
-    # Find the episode info
-    episode_info = None
-    current_season = None
-    episode_list = []
-    
-    for season_num, episodes in series_data.get('episodes', {}).items():
-        for episode in episodes:
-            if str(episode.get('id')) == str(episode_id):
-                episode_info = episode
-                current_season = season_num
-                episode_list = episodes
-                break
-        if episode_info:
-            break
-    
     if not episode_info:
         return render_template('error.html', 
                              message="Episode not found"), 404
+    episode_list = series_data['episodes'][current_season]
     
     # Construct stream URL using current user
     user = get_current_user()
@@ -1439,6 +2070,10 @@ def watch_series(series_id, episode_id):
     container_extension = episode_info.get('container_extension', 'mp4')
     stream_url = f"{base_url}/series/{user['username']}/{user['password']}/{episode_id}.{container_extension}"
     
+    local_path = locate_episode(series_id, series_data, current_season, episode_info)
+    player_src = (url_for('local_episode', series_id=series_id, episode_id=episode_id)
+                  if local_path else proxied_stream(stream_url))
+    
     return render_template('watch_series.html', 
                          series=series_data,
                          series_id=series_id,
@@ -1447,16 +2082,54 @@ def watch_series(series_id, episode_id):
                          current_season=current_season,
                          episode_list=episode_list,
                          stream_url=stream_url,
+                         player_src=player_src,
+                         is_local=bool(local_path),
                          referrer=referrer,
                          search_query=search_query,
                          content_type=content_type)
 
+def locate_movie(movie_data, vod_id):
+    """Path of a downloaded movie, found through the library index."""
+    stream_id = movie_download_info(movie_data, vod_id)[0]
+    return library.locate(library_server(), 'movie', stream_id, movie_path(movie_data, vod_id))
+
+def locate_episode(series_id, series_data, season, episode):
+    return library.locate(library_server(), 'episode', episode['id'],
+                          episode_path(series_data, season, episode), series_id)
+
+def send_local_video(path):
+    """Serves a downloaded file with Range, ETag and Last-Modified support."""
+    if not path:
+        return "Not downloaded", 404
+    response = send_file(path, conditional=True, etag=True, max_age=0)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+@app.route('/local/movie/<vod_id>')
+def local_movie(vod_id):
+    """Plays a downloaded movie from DOWNLOADS_DIR."""
+    movie_data = get_movie_info(vod_id)
+    if not movie_data:
+        return "Could not fetch movie information", 503
+    return send_local_video(locate_movie(movie_data, vod_id))
+
+@app.route('/local/series/<series_id>/<episode_id>')
+def local_episode(series_id, episode_id):
+    """Plays a downloaded episode from DOWNLOADS_DIR."""
+    series_data, season, episode = series_info_cache.find_episode(
+        episode_id, fetch_series_info, series_id=series_id)
+    if not episode:
+        return "Episode not found", 404
+    return send_local_video(locate_episode(series_id, series_data, season, episode))
+
 @app.route('/stream_proxy')
 def stream_proxy():
     """Proxy streaming requests to handle CORS and authentication"""
     stream_url = request.args.get('url')
     if not stream_url:
         return "No stream URL provided", 400
+    if not hmac.compare_digest(request.args.get('sig', ''), url_signature(stream_url)):
+        return "Invalid stream signature", 403
     
     try:
         # Add range support for video seeking
@@ -1468,9 +2141,13 @@ def stream_proxy():
         response = session.get(stream_url, stream=True, headers=headers)
         
         def generate():
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    yield chunk
+            try:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    if chunk:
+                        yield chunk
+            finally:
+                # Hand the pooled connection back as soon as the viewer goes away
+                response.close()
         
         return Response(
             generate(),
@@ -1498,39 +2175,26 @@ def main():
     series_stats = {'categories': 0, 'total_items': 0, 'last_cached': None}
     movies_stats = {'categories': 0, 'total_items': 0, 'last_cached': None}
     
-    # Get series statistics
-    series_cached_data = get_cached_data('series')
-    if series_cached_data:
-        series_stats['last_cached'] = series_cached_data.get('last_fetch_date')
-        series_stats['total_items'] = len(series_cached_data.get('series', {}))
-        
-        # Count unique categories
-        series_categories = set()
-        for series_data in series_cached_data.get('series', {}).values():
-            category_id = series_data.get('category_ID')
-            if category_id:
-                series_categories.add(category_id)
-        series_stats['categories'] = len(series_categories)
+    # Get series statistics (precomputed when the cache was built)
+    series_metadata = get_cache_metadata('series')
+    if series_metadata:
+        series_stats['last_cached'] = series_metadata.get('last_fetch_date')
+        series_stats['total_items'] = series_metadata['stats']['total_items']
+        series_stats['categories'] = series_metadata['stats']['total_categories']
     
     # Get movies statistics  
-    movies_cached_data = get_cached_data('movies')
-    if movies_cached_data:
-        movies_stats['last_cached'] = movies_cached_data.get('last_fetch_date')
-        movies_stats['total_items'] = len(movies_cached_data.get('movies', {}))
-        
-        # Count unique categories
-        movies_categories = set()
-        for movie_data in movies_cached_data.get('movies', {}).values():
-            category_id = movie_data.get('category_ID')
-            if category_id:
-                movies_categories.add(category_id)
-        movies_stats['categories'] = len(movies_categories)
+    movies_metadata = get_cache_metadata('movies')
+    if movies_metadata:
+        movies_stats['last_cached'] = movies_metadata.get('last_fetch_date')
+        movies_stats['total_items'] = movies_metadata['stats']['total_items']
+        movies_stats['categories'] = movies_metadata['stats']['total_categories']
     
     return render_template('main.html', series_stats=series_stats, movies_stats=movies_stats)
 
 # Movie routes
 @app.route('/movies')
 @app.route('/movies/page/<int:page>')
+@cached_page('movies', current_account)
 def movies_index(page=1):
     # Get per_page from query parameter, default to 50
     per_page = request.args.get('per_page', 50, type=int)
@@ -1538,7 +2202,7 @@ def movies_index(page=1):
     if per_page not in [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]:
         per_page = 50
     
-    categories = get_movie_categories()
+    categories = load_categories('movies')
     if not categories:
         return render_template('error.html', 
                             message="Unable to fetch movie categories. Please try again later."), 503
@@ -1562,6 +2226,7 @@ def movies_index(page=1):
 
 @app.route('/movies/<category_id>')
 @app.route('/movies/<category_id>/page/<int:page>')
+@cached_page('movies', current_account, library_version)
 def movies(category_id, page=1):
     # Get per_page from query parameter, default to 50
     per_page = request.args.get('per_page', 50, type=int)
@@ -1569,24 +2234,21 @@ def movies(category_id, page=1):
     if per_page not in [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]:
         per_page = 50
     
-    movies_list = get_movies_by_category(category_id)
+    listing = category_listing('movies', category_id, per_page, page)
     
-    # Get category name
-    categories = get_movie_categories()
-    category_name = next((cat['category_name'] for cat in categories if cat['category_id'] == category_id), 'Unknown Category')
-    
-    # Calculate pagination
-    total = len(movies_list)
-    pages = (total + per_page - 1) // per_page
-    start = (page - 1) * per_page
-    end = start + per_page
+    # Warm movie info for this page and the next so opening a title is instant
+    info_prefetcher.enqueue(movie_info_cache,
+                            [item.get('stream_id') for item in listing['items'] + listing['next_items']],
+                            fetch_movie_info)
     
     return render_template('movies.html', 
-                         movies_list=movies_list[start:end],
-                         current_page=page,
-                         total_pages=pages,
+                         movies_list=listing['items'],
+                         current_page=listing['page'],
+                         total_pages=listing['pages'],
+                         next_cursor=listing['next_cursor'],
+                         sort=listing['sort'],
                          category_id=category_id,
-                         category_name=category_name,
+                         category_name=listing['category_name'],
                          per_page=per_page)
 
 @app.route('/movie_download', methods=['POST'])
@@ -1623,11 +2285,12 @@ def download_movie():
         
     try:
         # Create downloads directory if it doesn't exist
-        movie_dir = os.path.join(DOWNLOADS_DIR, "Movies")
-        os.makedirs(movie_dir, exist_ok=True)
+        os.makedirs(MOVIES_DIR, exist_ok=True)
+        server = library_server()
         
         # Start download process in background thread
         def download_worker():
+            job_id = jobs.start('movie', movie_download_info(movie_data, vod_id)[1])
             try:
                 # Debug: Log the movie data structure
                 logger.debug(f"Movie data structure: {movie_data}")
@@ -1637,26 +2300,10 @@ def download_movie():
                 logger.debug(f"Movie info structure: {movie_info}")
                 logger.debug(f"Movie data info structure: {movie_data_info}")
                 
-                # Try to get stream_id from different possible locations
-                stream_id = (movie_data_info.get('stream_id') or 
-                           movie_info.get('stream_id') or 
-                           movie_info.get('id') or 
-                           movie_data.get('stream_id') or 
-                           movie_data.get('id') or
-                           vod_id)  # Use the original vod_id as fallback
-                
+                # stream_id, name and extension may sit in movie_data or info
+                stream_id, movie_name, container_extension = movie_download_info(movie_data, vod_id)
                 logger.debug(f"Resolved stream_id: {stream_id}")
                 
-                # Get movie name from movie_data section first, then fallback to info
-                movie_name = (movie_data_info.get('name') or 
-                            movie_info.get('name') or 
-                            'Unknown Movie')
-                
-                # Get container extension from movie_data section first
-                container_extension = (movie_data_info.get('container_extension') or 
-                                     movie_info.get('container_extension') or 
-                                     'mp4')
-                
                 # Send starting status
                 sse_queue.put({
                     'status': 'starting',
@@ -1672,10 +2319,12 @@ def download_movie():
                     **movie_data_info  # Include all movie_data, overriding info if conflicts
                 }
                 
-                output_path = os.path.join(movie_dir, f"{movie_name}.{container_extension}")
+                output_path = movie_path(movie_data, vod_id)
                 success = download_movie_file(combined_movie_info, output_path, stream_id)
                 
                 if success:
+                    library.record(output_path, 'movie', stream_id, server)
+                    jobs.finish(job_id)
                     # Send completion message
                     sse_queue.put({
                         'progress': 100,
@@ -1683,6 +2332,7 @@ def download_movie():
                         'message': 'Movie download completed successfully!'
                     })
                 else:
+                    jobs.finish(job_id, 'failed')
                     sse_queue.put({
                         'status': 'error',
                         'error': 'Movie download failed'
@@ -1693,6 +2343,7 @@ def download_movie():
                 
             except Exception as e:
                 logger.error(f"Download worker error: {str(e)}")
+                jobs.finish(job_id, 'failed', str(e))
                 sse_queue.put({
                     'status': 'error',
                     'error': str(e),
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from urllib.parse import urlsplit
+
+from cache_manager import CACHE_DIR
+
+STREAM_CACHE_DIR = os.environ.get('STREAM_CACHE_DIR') or os.path.join(CACHE_DIR, 'streams')
+# 0 disables the block cache
+STREAM_CACHE_MAX_BYTES = int(os.environ.get('STREAM_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+STREAM_BLOCK_SIZE = int(os.environ.get('STREAM_BLOCK_SIZE', 1024 * 1024))
+
+# /movie/<user>/<pass>/<id>.<ext> and /series/<user>/<pass>/<id>.<ext>
+_STREAM_PATH = re.compile(r'^/(movie|series)/[^/]+/[^/]+/([^/]+)$')
+
+def stream_cache_key(url):
+    """Cache key for a VOD stream URL, or None for live and unrecognised URLs.
+
+    Credentials are left out so every account on a server shares one copy.
+    """
+    parts = urlsplit(url)
+    match = _STREAM_PATH.match(parts.path)
+    if not match:
+        return None
+    return f"{parts.netloc}/{match.group(1)}/{match.group(2)}"
+
+def parse_range(header):
+    """Parses a single 'bytes=' range into (start, end) with None for open ends.
+
+    Returns None when there is no usable single range (absent, multi-range or malformed).
+    """
+    match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header or '')
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    start = int(match.group(1)) if match.group(1) else None
+    end = int(match.group(2)) if match.group(2) else None
+    if start is not None and end is not None and end < start:
+        return None
+    return start, end
+
+def resolve_range(byte_range, size):
+    """Turns a parsed range into absolute (start, end) for a file of `size` bytes, or None if unsatisfiable."""
+    start, end = byte_range
+    if start is None:
+        start, end = max(0, size - end), size - 1
+    elif end is None or end >= size:
+        end = size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+class BlockCache:
+    """Disk cache of fixed-size, aligned stream blocks, evicted LRU by total size."""
+
+    def __init__(self, directory=STREAM_CACHE_DIR, max_bytes=STREAM_CACHE_MAX_BYTES, block_size=STREAM_BLOCK_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.enabled = max_bytes > 0
+        self.size = None
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0, 'invalidated': 0}
+        self._lock = threading.Lock()
+
+    def _stream_dir(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _block_path(self, key, index):
+        return os.path.join(self._stream_dir(key), f"{index}.blk")
+
+    def block_count(self, size):
+        return (size + self.block_size - 1) // self.block_size
+
+    def block_length(self, index, size):
+        """Length of block `index` in a stream of `size` bytes (the last block is short)."""
+        return min(self.block_size, size - index * self.block_size)
+
+    def meta(self, key):
+        """Returns {size, content_type} recorded for a stream, or None."""
+        try:
+            with open(os.path.join(self._stream_dir(key), 'meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set_meta(self, key, size, content_type):
+        meta = {'size': size, 'content_type': content_type, 'block_size': self.block_size}
+        self._write(os.path.join(self._stream_dir(key), 'meta.json'), json.dumps(meta).encode('utf-8'))
+        return meta
+
+    def has_block(self, key, index):
+        return os.path.exists(self._block_path(key, index))
+
+    def read_block(self, key, index):
+        """Returns a cached block's bytes, or None if it is not cached."""
+        path = self._block_path(key, index)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.stats['misses'] += 1
+            return None
+        # mtime doubles as the LRU clock
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats['hits'] += 1
+        return data
+
+    def store_block(self, key, index, data):
+        self._write(self._block_path(key, index), data)
+        self.stats['stored'] += 1
+
+    def invalidate(self, key):
+        """Drops every block of a stream whose upstream file changed."""
+        stream_dir = self._stream_dir(key)
+        removed = 0
+        try:
+            names = os.listdir(stream_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(stream_dir, name)
+            try:
+                removed += os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                pass
+        self.stats['invalidated'] += 1
+        with self._lock:
+            if self.size is not None:
+                self.size -= removed
+
+    def _scan_size(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self.size is None:
+                self.size = self._scan_size()
+            else:
+                self.size += len(data)
+            over = self.size > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        """Deletes least recently used blocks until the cache is back under 90% of its limit."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                total += stat.st_size
+                if name.endswith('.blk'):
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats['evicted'] += 1
+            except OSError:
+                pass
+        with self._lock:
+            self.size = total
+
+    def status(self):
+        with self._lock:
+            size = self.size
+        return dict(self.stats, enabled=self.enabled, bytes=size, max_bytes=self.max_bytes,
+                    block_size=self.block_size)
+
+block_cache = BlockCache()
@@ -1,18 +1,160 @@
+import base64
+import hashlib
+import heapq
 import json
 import os
+import re
+import threading
 import time
 from datetime import datetime
 
+from bisect import bisect_right
+
+from catalog import CompactCatalog, CatalogStats, NAME_FIELDS, normalize_year
+from facets import FacetIndex, bitset_from_rows, has_row, iter_rows
+from snapshot import SnapshotReader, SnapshotWriter, SnapshotMapping
+from shared_state import ProcessLock
+
 # Assuming these functions are available from app.py or a shared utility
 # For now, we'll assume they are passed in or imported from a common source.
 # In the final implementation, we'll ensure proper import paths.
 
+# Directory holding the cache files; mount a directory (not single files) in
+# Docker so the atomic os.replace() in CacheWriter works.
+CACHE_DIR = os.environ.get('CACHE_DIR', '')
+
 SERIES_CACHE_FILE = 'cached_series_data.json'
 MOVIES_CACHE_FILE = 'cached_movies_data.json'
+SERIES_SNAPSHOT_FILE = 'cached_series_data.snap'
+MOVIES_SNAPSHOT_FILE = 'cached_movies_data.snap'
+ACCOUNTS_FILE = 'accounts.json'
+CACHE_FILES = (SERIES_CACHE_FILE, MOVIES_CACHE_FILE, SERIES_SNAPSHOT_FILE, MOVIES_SNAPSHOT_FILE)
+
+# Caches are partitioned per provider server: CACHE_DIR/<server key>/.
+# Accounts on the same server share one catalog; accounts.json lists them.
+_partition_dir = CACHE_DIR
+_partition_account = None
+_partition_lock = threading.Lock()
+
+def server_cache_key(server):
+    """Returns a filesystem-safe directory name identifying a provider server."""
+    normalized = server.strip().rstrip('/').lower()
+    readable = re.sub(r'[^a-z0-9]+', '_', re.sub(r'^[a-z]+://', '', normalized)).strip('_')
+    digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:8]
+    return f"{readable[:48]}-{digest}"
+
+def _write_json_atomic(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def _adopt_legacy_cache(directory):
+    """Moves caches written before partitioning into the first partition that is activated."""
+    if any(os.path.exists(os.path.join(directory, name)) for name in CACHE_FILES):
+        return
+    for name in CACHE_FILES:
+        legacy_path = os.path.join(CACHE_DIR, name)
+        if os.path.exists(legacy_path):
+            os.replace(legacy_path, os.path.join(directory, name))
+            print(f"Moved legacy cache {legacy_path} into {directory}")
+
+def _record_account(directory, server, username):
+    accounts_path = os.path.join(directory, ACCOUNTS_FILE)
+    try:
+        with open(accounts_path, 'r', encoding='utf-8') as f:
+            accounts = json.load(f)
+    except (OSError, ValueError):
+        accounts = {"server": server, "accounts": {}}
+    accounts.setdefault("accounts", {})[username] = {"last_used": datetime.now().isoformat()}
+    _write_json_atomic(accounts_path, accounts)
+
+def set_cache_partition(server, username=None):
+    """Selects the cache partition for an account; accounts on one server share it."""
+    global _partition_dir, _partition_account
+    if not server:
+        with _partition_lock:
+            _partition_dir, _partition_account = CACHE_DIR, None
+        return _partition_dir
+
+    directory = os.path.join(CACHE_DIR, server_cache_key(server))
+    with _partition_lock:
+        if (directory, username) == (_partition_dir, _partition_account):
+            return directory
+        os.makedirs(directory, exist_ok=True)
+        _adopt_legacy_cache(directory)
+        if username:
+            _record_account(directory, server, username)
+        _partition_dir, _partition_account = directory, username
+    print(f"Using cache partition {directory} for {username or 'unknown user'}@{server}")
+    return directory
+
+def get_cache_dir():
+    """Returns the directory of the active cache partition."""
+    return _partition_dir
+
+def _cache_files(content_type, directory=None):
+    """Returns the (JSON file, binary snapshot file) paths for a content type."""
+    directory = _partition_dir if directory is None else directory
+    if content_type == 'series':
+        return os.path.join(directory, SERIES_CACHE_FILE), os.path.join(directory, SERIES_SNAPSHOT_FILE)
+    return os.path.join(directory, MOVIES_CACHE_FILE), os.path.join(directory, MOVIES_SNAPSHOT_FILE)
+
+def _cache_key(content_type):
+    """Key for in-memory state, so each partition's loaded data survives account switches."""
+    return (_partition_dir, content_type)
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+def _use_snapshot(content_type):
+    """True when the snapshot exists and is at least as new as the JSON cache."""
+    cache_file, snapshot_file = _cache_files(content_type)
+    snapshot_mtime = _mtime(snapshot_file)
+    json_mtime = _mtime(cache_file)
+    return snapshot_mtime is not None and (json_mtime is None or snapshot_mtime >= json_mtime)
+
+# Held while a full catalog build runs so scheduled and manual builds never overlap,
+# in any worker process
+cache_build_lock = ProcessLock(os.path.join(CACHE_DIR, '.cache_build.lock'))
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def get_snapshot(content_type='series'):
+    """Returns a memory-mapped reader for the current snapshot, or None."""
+    if not _use_snapshot(content_type):
+        return None
+    _, snapshot_file = _cache_files(content_type)
+    version = _mtime(snapshot_file)
+    key = _cache_key(content_type)
+    with _snapshots_lock:
+        loaded = _snapshots.get(key)
+        if loaded and loaded[0] == version:
+            return loaded[1]
+        try:
+            reader = SnapshotReader(snapshot_file)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not open snapshot {snapshot_file}: {e}. Falling back to JSON.")
+            return None
+        _snapshots[key] = (version, reader)
+        return reader
 
 def get_cached_data(content_type='series'):
-    """Loads cached data from a JSON file."""
-    cache_file = SERIES_CACHE_FILE if content_type == 'series' else MOVIES_CACHE_FILE
+    """Loads cached data, preferring the binary snapshot over the JSON file."""
+    reader = get_snapshot(content_type)
+    if reader:
+        cached_data = dict(reader.metadata)
+        cached_data[content_type] = SnapshotMapping(reader)
+        return cached_data
+    return get_cached_json(content_type)
+
+def get_cached_json(content_type='series'):
+    """Loads the JSON cache file as plain dicts, ignoring any snapshot."""
+    cache_file, _ = _cache_files(content_type)
     if os.path.exists(cache_file):
         try:
             with open(cache_file, 'r', encoding='utf-8') as f:
@@ -22,22 +164,330 @@ def get_cached_data(content_type='series'):
             return None
     return None
 
+def get_cache_version(content_type='series'):
+    """Returns a version stamp for the cache files, or None if neither exists."""
+    cache_file, snapshot_file = _cache_files(content_type)
+    version = (_mtime(snapshot_file), _mtime(cache_file))
+    return version if any(version) else None
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def get_catalog(content_type='series'):
+    """Returns the compact in-memory catalog for a cache, reloading it when the files change."""
+    version = get_cache_version(content_type)
+    if version is None:
+        return None
+    key = _cache_key(content_type)
+    with _catalogs_lock:
+        loaded = _catalogs.get(key)
+        if loaded and loaded[0] == version:
+            return loaded[1]
+        catalog = None
+        reader = get_snapshot(content_type)
+        if reader:
+            catalog = reader.load_catalog(content_type)
+        if catalog is None:
+            cached_data = get_cached_data(content_type)
+            if not cached_data:
+                return None
+            catalog = CompactCatalog.from_cache(content_type, cached_data)
+        _catalogs[key] = (version, catalog)
+        return catalog
+
+_facet_indexes = {}
+_facet_indexes_lock = threading.Lock()
+
+def get_facet_index(content_type='movies'):
+    """Returns the facet bitsets for the current catalog, building them on first use."""
+    catalog = get_catalog(content_type)
+    if not catalog:
+        return None
+    key = _cache_key(content_type)
+    with _facet_indexes_lock:
+        loaded = _facet_indexes.get(key)
+        if loaded and loaded[0] is catalog:
+            return loaded[1]
+        facet_index = FacetIndex(catalog)
+        _facet_indexes[key] = (catalog, facet_index)
+        return facet_index
+
+_metadata = {}
+_metadata_lock = threading.Lock()
+
+def get_cache_metadata(content_type='series'):
+    """Returns cache metadata (last_fetch_date, categories, stats, last_fetch) without scanning items.
+
+    Snapshots carry precomputed aggregates in their manifest. Caches written
+    before aggregates existed get them computed once from the catalog.
+    """
+    reader = get_snapshot(content_type)
+    if reader and "stats" in reader.metadata:
+        return reader.metadata
+
+    version = get_cache_version(content_type)
+    if version is None:
+        return None
+    key = _cache_key(content_type)
+    with _metadata_lock:
+        loaded = _metadata.get(key)
+        if loaded and loaded[0] == version:
+            return loaded[1]
+    catalog = get_catalog(content_type)
+    if not catalog:
+        return None
+    stats = CatalogStats.from_catalog(catalog).to_dict()
+    metadata = {
+        "last_fetch_date": catalog.last_fetch_date,
+        "categories": _summarize_categories([], stats["category_counts"]),
+        "stats": stats
+    }
+    with _metadata_lock:
+        _metadata[key] = (version, metadata)
+    return metadata
+
+def get_catalog_age_hours(content_type='series'):
+    """Hours since the last full fetch of a catalog, or None if it was never cached."""
+    metadata = get_cache_metadata(content_type) or {}
+    last_fetch = metadata.get('last_fetch') or {}
+    fetched = last_fetch.get('date') if last_fetch.get('scope') == 'full' else None
+    fetched = fetched or metadata.get('last_fetch_date')
+    if not fetched:
+        return None
+    try:
+        return (datetime.now() - datetime.fromisoformat(fetched)).total_seconds() / 3600
+    except ValueError:
+        return None
+
+def get_cache_stats(content_type='series'):
+    """Returns the precomputed aggregates for a cache, or None if there is no cache."""
+    metadata = get_cache_metadata(content_type)
+    return metadata.get("stats") if metadata else None
+
+def _release_snapshot(key):
+    """Closes the cached snapshot reader so its file can be replaced (needed on Windows)."""
+    with _snapshots_lock:
+        loaded = _snapshots.pop(key, None)
+    if loaded:
+        loaded[1].close()
+
+def _replace_file(temp_path, path, key):
+    try:
+        os.replace(temp_path, path)
+    except PermissionError:
+        # Windows refuses to replace a memory-mapped file
+        _release_snapshot(key)
+        os.replace(temp_path, path)
+
+class CacheWriter:
+    """Streams cache items to temp files and atomically swaps them in on commit.
+
+    Items are written as they are produced, so the full cache never has to be
+    held as a dict. Readers only ever see the previous or the new complete file.
+    """
+
+    def __init__(self, content_type, last_fetch_date=None):
+        self.content_type = content_type
+        # Bound to the partition active when the build started
+        self.cache_key = _cache_key(content_type)
+        self.cache_file, self.snapshot_file = _cache_files(content_type, self.cache_key[0])
+        self.temp_cache_file = f"{self.cache_file}.tmp"
+        self.last_fetch_date = last_fetch_date or datetime.now().isoformat()
+        self.catalog = CompactCatalog(content_type, self.last_fetch_date)
+        self.stats = CatalogStats()
+        self._seen_ids = set()
+        self._snapshot = SnapshotWriter(self.snapshot_file)
+        self._json = open(self.temp_cache_file, 'w', encoding='utf-8')
+        self._json.write('{\n')
+        self._json.write(f'    "last_fetch_date": {json.dumps(self.last_fetch_date)},\n')
+        self._json.write(f'    "{content_type}": {{')
+        self._first_item = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+    def __len__(self):
+        return len(self._seen_ids)
+
+    def add(self, item_id, record):
+        """Writes one item; returns False if the id was already written."""
+        item_id = str(item_id)
+        if item_id in self._seen_ids:
+            return False
+        self._seen_ids.add(item_id)
+
+        separator = '\n' if self._first_item else ',\n'
+        self._first_item = False
+        self._json.write(f'{separator}        {json.dumps(item_id)}: {json.dumps(record, ensure_ascii=False)}')
+        self._snapshot.add(item_id, record)
+        self.catalog.add(item_id, record)
+        self.stats.add(record)
+        return True
+
+    def commit(self, metadata=None, categories=None):
+        """Finishes both files, fsyncs them and moves them over the live cache.
+
+        Aggregates gathered while writing are stored as "stats", and
+        `categories` ([{category_id, category_name}]) is saved with item counts.
+        """
+        metadata = dict(metadata or {})
+        stats = self.stats.to_dict()
+        if categories is None:
+            categories = metadata.get("categories") or []
+        metadata["categories"] = _summarize_categories(categories, stats["category_counts"])
+        metadata["stats"] = stats
+        metadata["last_fetch_date"] = self.last_fetch_date
+
+        self._json.write('\n    }')
+        for key, value in metadata.items():
+            if key != "last_fetch_date":
+                self._json.write(f',\n    {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}')
+        self._json.write('\n}\n')
+        self._json.flush()
+        os.fsync(self._json.fileno())
+        self._json.close()
+        self._snapshot.finish(metadata, self.catalog.freeze())
+
+        # JSON first so the snapshot ends up at least as new and is preferred
+        _replace_file(self.temp_cache_file, self.cache_file, self.cache_key)
+        _replace_file(self._snapshot.temp_path, self.snapshot_file, self.cache_key)
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        if hasattr(os, 'O_DIRECTORY'):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def abort(self):
+        """Discards the temp files, leaving the live cache untouched."""
+        if not self._json.closed:
+            self._json.close()
+        if os.path.exists(self.temp_cache_file):
+            os.remove(self.temp_cache_file)
+        self._snapshot.abort()
+
+def _summarize_categories(categories, category_counts):
+    """Returns [{category_id, category_name, count}] covering every category with items."""
+    summary = []
+    seen = set()
+    for category in categories:
+        category_id = str(category.get("category_id"))
+        if category_id in seen:
+            continue
+        seen.add(category_id)
+        summary.append({
+            "category_id": category_id,
+            "category_name": category.get("category_name"),
+            "count": category_counts.get(category_id, 0)
+        })
+    for category_id, count in category_counts.items():
+        if category_id not in seen:
+            summary.append({"category_id": category_id, "category_name": None, "count": count})
+    return summary
+
 def save_cached_data(data, content_type='series'):
-    """Saves data to a JSON file."""
-    cache_file = SERIES_CACHE_FILE if content_type == 'series' else MOVIES_CACHE_FILE
-    with open(cache_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    """Atomically replaces the cache with the contents of a cache-shaped dict."""
+    with CacheWriter(content_type, data.get("last_fetch_date")) as writer:
+        for item_id, record in data.get(content_type, {}).items():
+            writer.add(item_id, record)
+        writer.commit({key: value for key, value in data.items() if key != content_type})
+
+def build_series_record(series, category_id):
+    """Returns (series_id, cache record) for an upstream series, or (None, None) if unusable."""
+    series_id = series.get("series_id")
+    series_name = series.get("name")
+    if not (series_id and series_name):
+        return None, None
+    actors = series.get("cast")
+    plot = series.get("plot")
+    cover_url = series.get("cover")
+    genre = series.get("genre")
+    rating = series.get("rating")
+    year = series.get("year") or (series.get("releaseDate") or "")[:4]
+    added = series.get("last_modified")
+    return str(series_id), {
+        "series_name": series_name,
+        "category_ID": category_id,
+        "actors": actors.split(', ') if actors else [],
+        "plot": plot if plot else "",
+        "cover_url": cover_url if cover_url else "",
+        "genre": genre if genre else "",
+        "rating": rating if rating else "",
+        "year": year if year else "",
+        "added": str(added) if added else ""
+    }
+
+def build_movie_record(movie, category_id):
+    """Returns (movie_id, cache record) for an upstream movie, or (None, None) if unusable."""
+    movie_id = movie.get("stream_id") or movie.get("id")
+    movie_name = movie.get("name")
+    if not (movie_id and movie_name):
+        return None, None
+    actors = movie.get("cast")
+    plot = movie.get("plot")
+    cover_url = movie.get("stream_icon")
+    genre = movie.get("genre")
+    rating = movie.get("rating")
+    year = movie.get("year")
+    added = movie.get("added")
+    return str(movie_id), {
+        "movie_name": movie_name,
+        "category_ID": category_id,
+        "actors": actors.split(', ') if actors else [],
+        "plot": plot if plot else "",
+        "cover_url": cover_url if cover_url else "",
+        "genre": genre if genre else "",
+        "rating": rating if rating else "",
+        "year": year if year else "",
+        "added": str(added) if added else ""
+    }
+
+def catalog_cover_urls(content_type):
+    """Distinct cover URLs in the local catalog."""
+    catalog = get_catalog(content_type)
+    if not catalog:
+        return []
+    return list(dict.fromkeys(url for url in (catalog.value(index, 'cover_url') for index in range(len(catalog)))
+                              if url))
 
-def process_and_cache_series_data(get_categories_func, get_series_by_category_func, progress_callback=None):
+def prefetch_catalog_covers(cover_prefetcher, cover_urls, label, progress_callback=None, details=None, wait=False):
+    """Optional build stage: hands a catalog's covers to the cover prefetcher.
+
+    By default covers are queued in the background and any that do not fit
+    wait for the next build. With wait=True the whole batch is fetched before
+    returning, reporting covers_done/covers_total through progress_callback;
+    interactive builds run this after releasing the build lock.
+    """
+    if cover_prefetcher is None or not cover_prefetcher.enabled or not cover_urls:
+        return 0
+    report = None
+    if progress_callback:
+        start_time = time.time()
+        def report(done, total):
+            elapsed_time = time.time() - start_time
+            progress_callback(int(done * 100 / total) if total else 100,
+                              f"Prefetching {label} covers: {done}/{total}", "in_progress", dict(details or {},
+                                  covers_done=done,
+                                  covers_total=total,
+                                  elapsed_time=elapsed_time,
+                                  eta_seconds=elapsed_time / done * (total - done) if done else 0,
+                                  start_time=start_time))
+    queued = cover_prefetcher.prefetch(list(cover_urls), report, wait=wait)
+    if queued:
+        print(f"{'Prefetched' if wait else 'Queued'} {queued} new {label} covers")
+    return queued
+
+def process_and_cache_series_data(get_categories_func, get_series_by_category_func, progress_callback=None,
+                                  cover_prefetcher=None):
     """Fetches, processes, and caches series data with detailed progress tracking."""
     print("Starting series data caching process...")
     start_time = time.time()
-    
-    cached_data = {
-        "last_fetch_date": datetime.now().isoformat(),
-        "categories": [],
-        "series": {}
-    }
 
     # Initial progress update
     if progress_callback:
@@ -61,6 +511,7 @@ def process_and_cache_series_data(get_categories_func, get_series_by_category_fu
     total_series_processed = 0
     failed_series_count = 0
     processed_categories = 0
+    cover_urls = {}
 
     # Send initial category count
     if progress_callback:
@@ -73,86 +524,93 @@ def process_and_cache_series_data(get_categories_func, get_series_by_category_fu
             'start_time': start_time
         })
 
-    for i, category in enumerate(categories):
-        category_id = category.get("category_id")
-        category_name = category.get("category_name")
+    with CacheWriter('series') as writer:
+        for i, category in enumerate(categories):
+            category_id = category.get("category_id")
+            category_name = category.get("category_name")
         
-        current_time = time.time()
-        elapsed_time = current_time - start_time
+            current_time = time.time()
+            elapsed_time = current_time - start_time
         
-        if category_id and category_name:
-            print(f"Processing category: {category_name} (ID: {category_id})")
+            if category_id and category_name:
+                print(f"Processing category: {category_name} (ID: {category_id})")
             
-            # Update progress before processing category
-            if progress_callback:
-                progress = int((i / total_categories) * 100)
-                progress_callback(progress, f"Processing category: {category_name}", "in_progress", {
-                    'total_categories': total_categories,
-                    'processed_categories': processed_categories,
-                    'current_category': category_name,
-                    'total_series': total_series_processed,
-                    'processed_series': total_series_processed,
-                    'failed_series': failed_series_count,
-                    'elapsed_time': elapsed_time,
-                    'start_time': start_time
-                })
+                # Update progress before processing category
+                if progress_callback:
+                    progress = int((i / total_categories) * 100)
+                    progress_callback(progress, f"Processing category: {category_name}", "in_progress", {
+                        'total_categories': total_categories,
+                        'processed_categories': processed_categories,
+                        'current_category': category_name,
+                        'total_series': total_series_processed,
+                        'processed_series': total_series_processed,
+                        'failed_series': failed_series_count,
+                        'elapsed_time': elapsed_time,
+                        'start_time': start_time
+                    })
             
-            series_list = get_series_by_category_func(category_id)
-            category_series_count = 0
+                series_list = get_series_by_category_func(category_id)
+                category_series_count = 0
             
-            if series_list:
-                for series in series_list:
-                    series_id = series.get("series_id")
-                    series_name = series.get("name")
-                    actors = series.get("cast")
-                    plot = series.get("plot")
-                    cover_url = series.get("cover")
+                if series_list:
+                    for series in series_list:
+                        series_id, record = build_series_record(series, category_id)
                     
-                    if series_id and series_name:
-                        cached_data["series"][str(series_id)] = {
-                            "series_name": series_name,
-                            "category_ID": category_id,
-                            "actors": actors.split(', ') if actors else [],
-                            "plot": plot if plot else "",
-                            "cover_url": cover_url if cover_url else ""
-                        }
-                        total_series_processed += 1
-                        category_series_count += 1
-                        print(f"  Cached series: {series_name} (Total processed: {total_series_processed})")
-                    else:
-                        failed_series_count += 1
-                        print(f"  Skipping series due to missing ID or name: {series} (Failed: {failed_series_count})")
-            else:
-                print(f"  No series found for category: {category_name}")
+                        if series_id:
+                            writer.add(series_id, record)
+                            total_series_processed += 1
+                            category_series_count += 1
+                            if record['cover_url']:
+                                cover_urls[record['cover_url']] = None
+                            print(f"  Cached series: {record['series_name']} (Total processed: {total_series_processed})")
+                        else:
+                            failed_series_count += 1
+                            print(f"  Skipping series due to missing ID or name: {series} (Failed: {failed_series_count})")
+                else:
+                    print(f"  No series found for category: {category_name}")
             
-            processed_categories += 1
+                processed_categories += 1
             
-            # Update progress after processing category
-            if progress_callback:
-                progress = int(((i + 1) / total_categories) * 100)
-                elapsed_time = time.time() - start_time
-                avg_time_per_category = elapsed_time / (i + 1) if i > 0 else 0
-                eta_seconds = avg_time_per_category * (total_categories - (i + 1))
+                # Update progress after processing category
+                if progress_callback:
+                    progress = int(((i + 1) / total_categories) * 100)
+                    elapsed_time = time.time() - start_time
+                    avg_time_per_category = elapsed_time / (i + 1) if i > 0 else 0
+                    eta_seconds = avg_time_per_category * (total_categories - (i + 1))
                 
-                progress_callback(progress, f"Completed category: {category_name} ({category_series_count} series)", "in_progress", {
-                    'total_categories': total_categories,
-                    'processed_categories': processed_categories,
-                    'current_category': category_name,
-                    'category_series_count': category_series_count,
-                    'total_series': total_series_processed,
-                    'processed_series': total_series_processed,
-                    'failed_series': failed_series_count,
-                    'elapsed_time': elapsed_time,
-                    'eta_seconds': eta_seconds,
-                    'avg_time_per_category': avg_time_per_category,
-                    'start_time': start_time
-                })
-        else:
-            failed_series_count += 1
-            print(f"Skipping category due to missing ID or name: {category}")
+                    progress_callback(progress, f"Completed category: {category_name} ({category_series_count} series)", "in_progress", {
+                        'total_categories': total_categories,
+                        'processed_categories': processed_categories,
+                        'current_category': category_name,
+                        'category_series_count': category_series_count,
+                        'total_series': total_series_processed,
+                        'processed_series': total_series_processed,
+                        'failed_series': failed_series_count,
+                        'elapsed_time': elapsed_time,
+                        'eta_seconds': eta_seconds,
+                        'avg_time_per_category': avg_time_per_category,
+                        'start_time': start_time
+                    })
+            else:
+                failed_series_count += 1
+                print(f"Skipping category due to missing ID or name: {category}")
 
-    # Save the cached data
-    save_cached_data(cached_data)
+        # Move the streamed cache into place along with its aggregates
+        writer.commit({
+            "last_fetch": {
+                "scope": "full",
+                "date": writer.last_fetch_date,
+                "duration_seconds": round(time.time() - start_time, 2),
+                "total_categories": total_categories,
+                "processed_categories": processed_categories,
+                "processed_items": total_series_processed,
+                "failed_items": failed_series_count,
+                "cached_items": len(writer)
+            }
+        }, categories=categories)
+
+    # The new catalog is live; warm its covers before anyone browses
+    prefetch_catalog_covers(cover_prefetcher, cover_urls, 'series')
     
     total_time = time.time() - start_time
     print(f"Caching process completed. Total series processed: {total_series_processed}, Failed series: {failed_series_count}.")
@@ -170,16 +628,11 @@ def process_and_cache_series_data(get_categories_func, get_series_by_category_fu
     
     return True
 
-def process_and_cache_movies_data(get_movie_categories_func, get_movies_by_category_func, progress_callback=None):
+def process_and_cache_movies_data(get_movie_categories_func, get_movies_by_category_func, progress_callback=None,
+                                  cover_prefetcher=None):
     """Fetches, processes, and caches movies data with detailed progress tracking."""
     print("Starting movies data caching process...")
     start_time = time.time()
-    
-    cached_data = {
-        "last_fetch_date": datetime.now().isoformat(),
-        "categories": [],
-        "movies": {}
-    }
 
     # Initial progress update
     if progress_callback:
@@ -203,6 +656,7 @@ def process_and_cache_movies_data(get_movie_categories_func, get_movies_by_categ
     total_movies_processed = 0
     failed_movies_count = 0
     processed_categories = 0
+    cover_urls = {}
 
     # Send initial category count
     if progress_callback:
@@ -215,92 +669,93 @@ def process_and_cache_movies_data(get_movie_categories_func, get_movies_by_categ
             'start_time': start_time
         })
 
-    for i, category in enumerate(categories):
-        category_id = category.get("category_id")
-        category_name = category.get("category_name")
+    with CacheWriter('movies') as writer:
+        for i, category in enumerate(categories):
+            category_id = category.get("category_id")
+            category_name = category.get("category_name")
         
-        current_time = time.time()
-        elapsed_time = current_time - start_time
+            current_time = time.time()
+            elapsed_time = current_time - start_time
         
-        if category_id and category_name:
-            print(f"Processing movie category: {category_name} (ID: {category_id})")
+            if category_id and category_name:
+                print(f"Processing movie category: {category_name} (ID: {category_id})")
             
-            # Update progress before processing category
-            if progress_callback:
-                progress = int((i / total_categories) * 100)
-                progress_callback(progress, f"Processing movie category: {category_name}", "in_progress", {
-                    'total_categories': total_categories,
-                    'processed_categories': processed_categories,
-                    'current_category': category_name,
-                    'total_movies': total_movies_processed,
-                    'processed_movies': total_movies_processed,
-                    'failed_movies': failed_movies_count,
-                    'elapsed_time': elapsed_time,
-                    'start_time': start_time
-                })
+                # Update progress before processing category
+                if progress_callback:
+                    progress = int((i / total_categories) * 100)
+                    progress_callback(progress, f"Processing movie category: {category_name}", "in_progress", {
+                        'total_categories': total_categories,
+                        'processed_categories': processed_categories,
+                        'current_category': category_name,
+                        'total_movies': total_movies_processed,
+                        'processed_movies': total_movies_processed,
+                        'failed_movies': failed_movies_count,
+                        'elapsed_time': elapsed_time,
+                        'start_time': start_time
+                    })
             
-            movies_list = get_movies_by_category_func(category_id)
-            category_movies_count = 0
+                movies_list = get_movies_by_category_func(category_id)
+                category_movies_count = 0
             
-            if movies_list:
-                for movie in movies_list:
-                    movie_id = movie.get("stream_id") or movie.get("id")
-                    movie_name = movie.get("name")
-                    actors = movie.get("cast")
-                    plot = movie.get("plot")
-                    cover_url = movie.get("stream_icon")
-                    genre = movie.get("genre")
-                    rating = movie.get("rating")
-                    year = movie.get("year")
+                if movies_list:
+                    for movie in movies_list:
+                        movie_id, record = build_movie_record(movie, category_id)
                     
-                    if movie_id and movie_name:
-                        cached_data["movies"][str(movie_id)] = {
-                            "movie_name": movie_name,
-                            "category_ID": category_id,
-                            "actors": actors.split(', ') if actors else [],
-                            "plot": plot if plot else "",
-                            "cover_url": cover_url if cover_url else "",
-                            "genre": genre if genre else "",
-                            "rating": rating if rating else "",
-                            "year": year if year else ""
-                        }
-                        total_movies_processed += 1
-                        category_movies_count += 1
-                        print(f"  Cached movie: {movie_name} (Total processed: {total_movies_processed})")
-                    else:
-                        failed_movies_count += 1
-                        print(f"  Skipping movie due to missing ID or name: {movie} (Failed: {failed_movies_count})")
-            else:
-                print(f"  No movies found for category: {category_name}")
+                        if movie_id:
+                            writer.add(movie_id, record)
+                            total_movies_processed += 1
+                            category_movies_count += 1
+                            if record['cover_url']:
+                                cover_urls[record['cover_url']] = None
+                            print(f"  Cached movie: {record['movie_name']} (Total processed: {total_movies_processed})")
+                        else:
+                            failed_movies_count += 1
+                            print(f"  Skipping movie due to missing ID or name: {movie} (Failed: {failed_movies_count})")
+                else:
+                    print(f"  No movies found for category: {category_name}")
             
-            processed_categories += 1
+                processed_categories += 1
             
-            # Update progress after processing category
-            if progress_callback:
-                progress = int(((i + 1) / total_categories) * 100)
-                elapsed_time = time.time() - start_time
-                avg_time_per_category = elapsed_time / (i + 1) if i > 0 else 0
-                eta_seconds = avg_time_per_category * (total_categories - (i + 1))
+                # Update progress after processing category
+                if progress_callback:
+                    progress = int(((i + 1) / total_categories) * 100)
+                    elapsed_time = time.time() - start_time
+                    avg_time_per_category = elapsed_time / (i + 1) if i > 0 else 0
+                    eta_seconds = avg_time_per_category * (total_categories - (i + 1))
                 
-                progress_callback(progress, f"Completed movie category: {category_name} ({category_movies_count} movies)", "in_progress", {
-                    'total_categories': total_categories,
-                    'processed_categories': processed_categories,
-                    'current_category': category_name,
-                    'category_movies_count': category_movies_count,
-                    'total_movies': total_movies_processed,
-                    'processed_movies': total_movies_processed,
-                    'failed_movies': failed_movies_count,
-                    'elapsed_time': elapsed_time,
-                    'eta_seconds': eta_seconds,
-                    'avg_time_per_category': avg_time_per_category,
-                    'start_time': start_time
-                })
-        else:
-            failed_movies_count += 1
-            print(f"Skipping movie category due to missing ID or name: {category}")
+                    progress_callback(progress, f"Completed movie category: {category_name} ({category_movies_count} movies)", "in_progress", {
+                        'total_categories': total_categories,
+                        'processed_categories': processed_categories,
+                        'current_category': category_name,
+                        'category_movies_count': category_movies_count,
+                        'total_movies': total_movies_processed,
+                        'processed_movies': total_movies_processed,
+                        'failed_movies': failed_movies_count,
+                        'elapsed_time': elapsed_time,
+                        'eta_seconds': eta_seconds,
+                        'avg_time_per_category': avg_time_per_category,
+                        'start_time': start_time
+                    })
+            else:
+                failed_movies_count += 1
+                print(f"Skipping movie category due to missing ID or name: {category}")
+
+        # Move the streamed cache into place along with its aggregates
+        writer.commit({
+            "last_fetch": {
+                "scope": "full",
+                "date": writer.last_fetch_date,
+                "duration_seconds": round(time.time() - start_time, 2),
+                "total_categories": total_categories,
+                "processed_categories": processed_categories,
+                "processed_items": total_movies_processed,
+                "failed_items": failed_movies_count,
+                "cached_items": len(writer)
+            }
+        }, categories=categories)
 
-    # Save the cached data
-    save_cached_data(cached_data, 'movies')
+    # The new catalog is live; warm its covers before anyone browses
+    prefetch_catalog_covers(cover_prefetcher, cover_urls, 'movie')
     
     total_time = time.time() - start_time
     print(f"Movies caching process completed. Total movies processed: {total_movies_processed}, Failed movies: {failed_movies_count}.")
@@ -320,55 +775,104 @@ def process_and_cache_movies_data(get_movie_categories_func, get_movies_by_categ
 
 def search_series(query):
     """Searches cached series data for matching series names, actors, or plot."""
-    cached_data = get_cached_data('series')
-    if not cached_data:
+    catalog = get_catalog('series')
+    if not catalog:
         return [], None
 
-    results = []
-    query_lower = query.lower()
-    last_fetch_date = cached_data.get("last_fetch_date")
-
-    for series_id, series_data in cached_data.get("series", {}).items():
-        series_name_lower = series_data.get('series_name', '').lower()
-        actors_lower = ' '.join(series_data.get('actors', [])).lower()
-        plot_lower = series_data.get('plot', '').lower()
-
-        if query_lower in series_name_lower or \
-           query_lower in actors_lower or \
-           query_lower in plot_lower:
-            # Add series_id and content_type to the dictionary before appending to results
-            series_data['series_id'] = series_id
-            series_data['content_type'] = 'series'
-            results.append(series_data)
-            
-    return results, last_fetch_date
+    results = [catalog.record(index) for index in catalog.search(query)]
+    return results, catalog.last_fetch_date
 
 def search_movies(query):
     """Searches cached movies data for matching movie names, actors, plot, or genre."""
-    cached_data = get_cached_data('movies')
-    if not cached_data:
+    catalog = get_catalog('movies')
+    if not catalog:
         return [], None
 
+    results = [catalog.record(index) for index in catalog.search(query)]
+    return results, catalog.last_fetch_date
+
+SEARCH_PAGE_SIZE = 50
+
+def _encode_search_cursor(key):
+    score, rating, rank, position = key
+    return f"{score}:{rating!r}:{-rank}:{-position}"
+
+def _decode_search_cursor(cursor):
+    try:
+        score, rating, rank, position = cursor.split(':')
+        return (int(score), float(rating), -int(rank), -int(position))
+    except (AttributeError, ValueError):
+        return None
+
+def search_page(query, content_type='all', page_size=SEARCH_PAGE_SIZE, cursor=None, filters=None):
+    """Returns one page of search results ranked by relevance, then rating.
+
+    Only the best `page_size` matches after the cursor are kept, using a
+    bounded heap, so the full match set is never materialized or sorted.
+    Movie facet `filters` (see facets.FacetIndex) restrict results to movies;
+    with filters the query may be empty. Returns
+    (results, next_cursor, total_matches, last_fetch_date).
+    """
+    catalogs = []
+    if filters:
+        catalogs.append(None)
+        catalogs.append(get_catalog('movies'))
+    else:
+        if content_type in ('all', 'series'):
+            catalogs.append(get_catalog('series'))
+        if content_type in ('all', 'movies'):
+            catalogs.append(get_catalog('movies'))
+
+    after = _decode_search_cursor(cursor) if cursor else None
+    total = 0
+    last_fetch_date = None
+    candidates = []
+    for rank, catalog in enumerate(catalogs):
+        if not catalog:
+            continue
+        if catalog.last_fetch_date and (not last_fetch_date or catalog.last_fetch_date > last_fetch_date):
+            last_fetch_date = catalog.last_fetch_date
+        if query:
+            scores = catalog.score_matches(query)
+        else:
+            scores = None
+        if filters:
+            mask = get_facet_index('movies').filter(filters).to_bytes((len(catalog) + 7) // 8, 'little')
+            if scores is None:
+                scores = {index: 0 for index in iter_rows(int.from_bytes(mask, 'little'))}
+            else:
+                scores = {index: score for index, score in scores.items() if has_row(mask, index)}
+        if scores is None:
+            continue
+        total += len(scores)
+        ratings = catalog.rating_values()
+        rating_codes = catalog.columns['rating'].codes
+        # Ties go to the catalog order: series before movies, earlier rows first
+        keys = ((score, ratings[rating_codes[index]], -rank, -index) for index, score in scores.items())
+        if after:
+            keys = (key for key in keys if key < after)
+        candidates.append(keys)
+
+    # One extra row tells us whether another page exists
+    top = heapq.nlargest(page_size + 1, (key for keys in candidates for key in keys))
+    page = top[:page_size]
     results = []
-    query_lower = query.lower()
-    last_fetch_date = cached_data.get("last_fetch_date")
-
-    for movie_id, movie_data in cached_data.get("movies", {}).items():
-        movie_name_lower = movie_data.get('movie_name', '').lower()
-        actors_lower = ' '.join(movie_data.get('actors', [])).lower()
-        plot_lower = movie_data.get('plot', '').lower()
-        genre_lower = movie_data.get('genre', '').lower()
-
-        if query_lower in movie_name_lower or \
-           query_lower in actors_lower or \
-           query_lower in plot_lower or \
-           query_lower in genre_lower:
-            # Add movie_id and content_type to the dictionary before appending to results
-            movie_data['movie_id'] = movie_id
-            movie_data['content_type'] = 'movie'
-            results.append(movie_data)
-            
-    return results, last_fetch_date
+    for key in page:
+        catalog = catalogs[-key[2]]
+        results.append(catalog.record(-key[3]))
+    next_cursor = _encode_search_cursor(page[-1]) if len(top) > page_size else None
+    return results, next_cursor, total, last_fetch_date
+
+def get_movie_facets(query=None, filters=None):
+    """Returns facet value counts for movies matching the query and filters."""
+    facet_index = get_facet_index('movies')
+    if not facet_index:
+        return {'genre': {}, 'year': {}, 'category': {}}
+    base = None
+    if query:
+        catalog = get_catalog('movies')
+        base = bitset_from_rows(catalog.score_matches(query), len(catalog))
+    return facet_index.facet_counts(filters or {}, base)
 
 def search_all_content(query):
     """Searches both series and movies data."""
@@ -392,28 +896,199 @@ def search_all_content(query):
 
 def get_series_count_by_category():
     """Returns a dictionary mapping category IDs to their series count."""
-    cached_data = get_cached_data('series')
-    if not cached_data:
-        return {}
-        
-    category_counts = {}
-    for series_data in cached_data.get("series", {}).values():
-        category_id = series_data.get("category_ID")
-        if category_id:
-            category_counts[category_id] = category_counts.get(category_id, 0) + 1
-            
-    return category_counts
+    stats = get_cache_stats('series')
+    return dict(stats["category_counts"]) if stats else {}
 
 def get_movies_count_by_category():
     """Returns a dictionary mapping category IDs to their movies count."""
-    cached_data = get_cached_data('movies')
+    stats = get_cache_stats('movies')
+    return dict(stats["category_counts"]) if stats else {}
+
+def get_cached_categories(content_type='series'):
+    """Returns the categories stored with the cache, shaped like the player_api category list."""
+    metadata = get_cache_metadata(content_type)
+    if not metadata:
+        return []
+    return [{"category_id": category["category_id"],
+             "category_name": category["category_name"] or f"Category {category['category_id']}"}
+            for category in metadata.get("categories", [])]
+
+def to_listing_item(record, content_type='series'):
+    """Maps a cache record to the player_api list fields the listing templates use."""
+    if content_type == 'series':
+        return {"series_id": record["series_id"], "name": record["series_name"],
+                "cover": record["cover_url"], "plot": record["plot"], "rating": record["rating"],
+                "genre": record["genre"], "year": record["year"], "category_id": record["category_ID"],
+                "last_modified": record.get("added", "")}
+    return {"stream_id": record["movie_id"], "name": record["movie_name"],
+            "stream_icon": record["cover_url"], "plot": record["plot"], "rating": record["rating"],
+            "genre": record["genre"], "year": record["year"], "category_id": record["category_ID"],
+            "added": record.get("added", "")}
+
+def get_cached_category_items(content_type, category_id):
+    """Returns a category's items from the local catalog in player_api list shape, in cache order."""
+    catalog = get_catalog(content_type)
+    if not catalog:
+        return []
+    facet_index = get_facet_index(content_type)
+    rows = iter_rows(facet_index.bitsets['category'].get(str(category_id), 0))
+    return [to_listing_item(catalog.record(index), content_type) for index in rows]
+
+# Listing pages are served from the local catalog unless it is older than this
+LISTING_MAX_AGE_HOURS = float(os.environ.get('LISTING_MAX_AGE_HOURS', 48))
+LISTING_SORTS = ('default', 'name', 'rating', 'year', 'added')
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def listing_sort_key(sort, item_id, position, name, rating, year, added):
+    """Unique sort key for a listing row: name ascending, the rest newest/best first."""
+    if sort == 'name':
+        primary = (name or '').casefold()
+    elif sort == 'rating':
+        primary = -_number(rating)
+    elif sort == 'year':
+        primary = -int(normalize_year(year) or 0)
+    elif sort == 'added':
+        primary = -_number(added)
+    else:
+        primary = position  # Provider order
+    return (primary, str(item_id))
+
+def encode_listing_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_listing_cursor(cursor):
+    try:
+        primary, item_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return (primary, item_id)
+    except (TypeError, ValueError):
+        return None
+
+def paginate_listing(keys, page_size, page=1, cursor=None):
+    """Returns (start, next_cursor) for a page of a sorted key list.
+
+    A cursor resumes right after the last key of the previous page (keyset
+    pagination), so pages stay stable while the catalog changes underneath.
+    """
+    key = decode_listing_cursor(cursor) if cursor else None
+    try:
+        start = bisect_right(keys, key) if key is not None else (max(page, 1) - 1) * page_size
+    except TypeError:
+        start = 0  # Cursor from a different sort order
+    end = start + page_size
+    next_cursor = encode_listing_cursor(keys[end - 1]) if end < len(keys) else None
+    return start, next_cursor
+
+_listing_orders = {}
+_listing_orders_lock = threading.Lock()
+
+def get_listing_order(content_type, category_id, sort='default'):
+    """Returns (catalog, sorted keys, row indexes) for a category of the local catalog, or None."""
+    catalog = get_catalog(content_type)
+    if not catalog:
+        return None
+    bits = get_facet_index(content_type).bitsets['category'].get(str(category_id))
+    if not bits:
+        return None
+    key = (_cache_key(content_type), str(category_id), sort)
+    with _listing_orders_lock:
+        loaded = _listing_orders.get(key)
+        if loaded and loaded[0] is catalog:
+            return loaded
+    columns = catalog.columns
+    name_column = columns[NAME_FIELDS[content_type]]
+    keyed = sorted((listing_sort_key(sort, catalog.ids[row], position, name_column[row], columns['rating'][row],
+                                     columns['year'][row], columns['added'][row]), row)
+                   for position, row in enumerate(iter_rows(bits)))
+    order = (catalog, [k for k, _ in keyed], [row for _, row in keyed])
+    with _listing_orders_lock:
+        _listing_orders[key] = order
+    return order
+
+def listing_page(content_type, category_id, sort='default', page_size=50, page=1, cursor=None):
+    """Serves one listing page from the local catalog.
+
+    Returns (items, total, start, next_cursor), or None when the catalog is
+    missing, older than LISTING_MAX_AGE_HOURS or lacks the category.
+    """
+    age = get_catalog_age_hours(content_type)
+    if age is None or age > LISTING_MAX_AGE_HOURS:
+        return None
+    order = get_listing_order(content_type, category_id, sort)
+    if order is None:
+        return None
+    catalog, keys, rows = order
+    start, next_cursor = paginate_listing(keys, page_size, page, cursor)
+    items = [to_listing_item(catalog.record(row), content_type) for row in rows[start:start + page_size]]
+    return items, len(keys), start, next_cursor
+
+def sort_listing_items(items, content_type, sort='default'):
+    """Sorts upstream list items like get_listing_order does; returns (keys, items)."""
+    id_field = 'series_id' if content_type == 'series' else 'stream_id'
+    added_field = 'last_modified' if content_type == 'series' else 'added'
+    keyed = sorted(((listing_sort_key(sort, item.get(id_field), position, item.get('name'), item.get('rating'),
+                                      item.get('year') or item.get('releaseDate'), item.get(added_field)), position)
+                    for position, item in enumerate(items)))
+    return [k for k, _ in keyed], [items[position] for _, position in keyed]
+
+def refresh_cached_category(content_type, category_id, category_name, get_items_by_category_func):
+    """Re-fetches one category and rewrites the cache with it, keeping everything else.
+
+    Refreshed items take the place of the category's old items, and the
+    aggregates are recomputed by the writer so they stay consistent.
+    Returns {"added", "removed", "kept"} item counts, or None if nothing is cached.
+    """
+    cached_data = get_cached_data(content_type)
     if not cached_data:
-        return {}
-        
-    category_counts = {}
-    for movie_data in cached_data.get("movies", {}).values():
-        category_id = movie_data.get("category_ID")
-        if category_id:
-            category_counts[category_id] = category_counts.get(category_id, 0) + 1
-            
-    return category_counts
\ No newline at end of file
+        return None
+
+    category_id = str(category_id)
+    build_record = build_series_record if content_type == 'series' else build_movie_record
+    fresh_items = []
+    for item in get_items_by_category_func(category_id) or []:
+        item_id, record = build_record(item, category_id)
+        if item_id:
+            fresh_items.append((item_id, record))
+
+    start_time = time.time()
+    old_ids = set()
+    inserted = False
+    with CacheWriter(content_type, cached_data.get("last_fetch_date")) as writer:
+        for item_id, record in cached_data[content_type].items():
+            if str(record.get("category_ID")) == category_id:
+                old_ids.add(item_id)
+                if not inserted:
+                    for fresh_id, fresh_record in fresh_items:
+                        writer.add(fresh_id, fresh_record)
+                    inserted = True
+            else:
+                writer.add(item_id, record)
+        if not inserted:
+            for fresh_id, fresh_record in fresh_items:
+                writer.add(fresh_id, fresh_record)
+
+        new_ids = {item_id for item_id, _ in fresh_items}
+        delta = {
+            "added": len(new_ids - old_ids),
+            "removed": len(old_ids - new_ids),
+            "kept": len(new_ids & old_ids)
+        }
+        categories = [c for c in cached_data.get("categories", []) if isinstance(c, dict)]
+        if not any(str(c.get("category_id")) == category_id for c in categories):
+            categories.append({"category_id": category_id, "category_name": category_name})
+        writer.commit({
+            "last_fetch": {
+                "scope": "category",
+                "category_id": category_id,
+                "date": datetime.now().isoformat(),
+                "duration_seconds": round(time.time() - start_time, 2),
+                "processed_items": len(fresh_items),
+                "cached_items": len(writer),
+                **delta
+            }
+        }, categories=categories)
+    return delta
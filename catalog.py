@@ -0,0 +1,399 @@
+import sys
+from array import array
+from bisect import bisect_right
+from collections import Counter
+
+# Separator between values inside a text blob; never part of a search query.
+SEPARATOR = '\x00'
+
+# Column layout per content type: (field name, column kind, searchable)
+CATALOG_FIELDS = {
+    'series': [
+        ('series_name', 'text', True),
+        ('category_ID', 'interned', False),
+        ('actors', 'actors', True),
+        ('plot', 'text', True),
+        ('cover_url', 'text', False),
+        ('genre', 'interned', False),
+        ('rating', 'interned', False),
+        ('year', 'interned', False),
+        ('added', 'text', False),
+    ],
+    'movies': [
+        ('movie_name', 'text', True),
+        ('category_ID', 'interned', False),
+        ('actors', 'actors', True),
+        ('plot', 'text', True),
+        ('cover_url', 'text', False),
+        ('genre', 'interned', True),
+        ('rating', 'interned', False),
+        ('year', 'interned', False),
+        ('added', 'text', False),
+    ],
+}
+
+ID_FIELDS = {'series': 'series_id', 'movies': 'movie_id'}
+NAME_FIELDS = {'series': 'series_name', 'movies': 'movie_name'}
+
+# Relevance of a match in each searchable field, plus bonuses for how the
+# query matches the title.
+FIELD_WEIGHTS = {'series_name': 100, 'movie_name': 100, 'actors': 30, 'genre': 20, 'plot': 10}
+EXACT_NAME_BONUS = 300
+PREFIX_NAME_BONUS = 200
+WORD_NAME_BONUS = 50
+CONTENT_TYPE_LABELS = {'series': 'series', 'movies': 'movie'}
+
+class TextColumn:
+    """Strings stored back to back in one blob, sliced out by offset on access."""
+
+    __slots__ = ('_pieces', '_length', 'blob', 'offsets')
+
+    def __init__(self):
+        self._pieces = []
+        self._length = 0
+        self.blob = ''
+        self.offsets = array('Q', [0])
+
+    def append(self, value):
+        value = (value or '').replace(SEPARATOR, ' ')
+        self._pieces.append(value)
+        self._length += len(value) + 1
+        self.offsets.append(self._length)
+
+    def freeze(self):
+        self.blob = SEPARATOR.join(self._pieces) + SEPARATOR if self._pieces else ''
+        self._pieces = []
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.blob[self.offsets[index]:self.offsets[index + 1] - 1]
+
+    def find_all(self, needle):
+        """Yields the index of every value containing the needle, once each."""
+        blob = self.blob
+        offsets = self.offsets
+        position = blob.find(needle)
+        while position != -1:
+            index = bisect_right(offsets, position) - 1
+            yield index
+            position = blob.find(needle, offsets[index + 1])
+
+class InternedColumn:
+    """Repeated values stored once in a table and referenced by integer code."""
+
+    __slots__ = ('table', 'codes', '_lookup')
+
+    def __init__(self):
+        self.table = []
+        self.codes = array('I')
+        self._lookup = {}
+
+    def append(self, value):
+        value = value if value is not None else ''
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.table)
+            self._lookup[value] = code
+            self.table.append(value)
+        self.codes.append(code)
+
+    def freeze(self):
+        self._lookup = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.table[self.codes[index]]
+
+    def value_counts(self):
+        """Returns a {value: count} mapping computed without touching records."""
+        return {self.table[code]: count for code, count in Counter(self.codes).items()}
+
+    def find_all(self, needle):
+        matching = {code for code, value in enumerate(self.table) if needle in str(value).lower()}
+        if not matching:
+            return
+        for index, code in enumerate(self.codes):
+            if code in matching:
+                yield index
+
+class ActorsColumn:
+    """Per-item actor lists as ranges into a shared actor string table."""
+
+    __slots__ = ('names', 'ranges', 'refs', '_lookup', 'search_text')
+
+    def __init__(self):
+        self.names = []
+        self.ranges = array('I', [0])
+        self.refs = array('I')
+        self._lookup = {}
+        # Lowercased "actor one actor two" per item, matching the original
+        # ' '.join(actors).lower() search semantics.
+        self.search_text = TextColumn()
+
+    def append(self, actors):
+        actors = actors or []
+        for actor in actors:
+            actor_id = self._lookup.get(actor)
+            if actor_id is None:
+                actor_id = len(self.names)
+                self._lookup[actor] = actor_id
+                self.names.append(actor)
+            self.refs.append(actor_id)
+        self.ranges.append(len(self.refs))
+        self.search_text.append(' '.join(actors).lower())
+
+    def freeze(self):
+        self._lookup = {}
+        self.search_text.freeze()
+
+    def __len__(self):
+        return len(self.ranges) - 1
+
+    def __getitem__(self, index):
+        return [self.names[actor_id] for actor_id in self.refs[self.ranges[index]:self.ranges[index + 1]]]
+
+    def find_all(self, needle):
+        return self.search_text.find_all(needle)
+
+COLUMN_TYPES = {'text': TextColumn, 'interned': InternedColumn, 'actors': ActorsColumn}
+
+class CompactCatalog:
+    """Columnar, read-only view of a series or movies cache."""
+
+    def __init__(self, content_type, last_fetch_date=None):
+        self.content_type = content_type
+        self.last_fetch_date = last_fetch_date
+        self.fields = CATALOG_FIELDS[content_type]
+        self.ids = TextColumn()
+        self.columns = {name: COLUMN_TYPES[kind]() for name, kind, _ in self.fields}
+        # Lowercased copies of searchable text columns
+        self.search_columns = {name: TextColumn() for name, kind, searchable in self.fields
+                               if searchable and kind == 'text'}
+        self._id_positions = None
+
+    def add(self, item_id, record):
+        """Appends one cache record; call freeze() once all records are added."""
+        self.ids.append(str(item_id))
+        for name, _, _ in self.fields:
+            value = record.get(name)
+            self.columns[name].append(value)
+            if name in self.search_columns:
+                self.search_columns[name].append((value or '').lower())
+
+    def freeze(self):
+        self.ids.freeze()
+        for column in self.columns.values():
+            column.freeze()
+        for column in self.search_columns.values():
+            column.freeze()
+        return self
+
+    @classmethod
+    def from_cache(cls, content_type, cached_data):
+        """Builds a catalog from the dict returned by get_cached_data."""
+        catalog = cls(content_type, cached_data.get('last_fetch_date'))
+        for item_id, record in cached_data.get(content_type, {}).items():
+            catalog.add(item_id, record)
+        return catalog.freeze()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, item_id):
+        """Returns the row index for an item id, or None."""
+        if self._id_positions is None:
+            self._id_positions = {self.ids[i]: i for i in range(len(self))}
+        return self._id_positions.get(str(item_id))
+
+    def value(self, index, field):
+        return self.columns[field][index]
+
+    def record(self, index):
+        """Materializes one row as a cache-style dict for templates."""
+        record = {name: self.columns[name][index] for name, _, _ in self.fields}
+        record[ID_FIELDS[self.content_type]] = self.ids[index]
+        record['content_type'] = CONTENT_TYPE_LABELS[self.content_type]
+        return record
+
+    def search(self, query):
+        """Returns row indexes (in cache order) whose searchable fields contain the query."""
+        needle = query.lower().replace(SEPARATOR, '')
+        if not needle:
+            return []
+        matches = set()
+        for name, kind, searchable in self.fields:
+            if not searchable:
+                continue
+            column = self.search_columns.get(name, self.columns[name])
+            matches.update(column.find_all(needle))
+        return sorted(matches)
+
+    def score_matches(self, query):
+        """Returns {row index: relevance score} for every row matching the query."""
+        needle = query.lower().replace(SEPARATOR, '')
+        if not needle:
+            return {}
+        scores = {}
+        for name, kind, searchable in self.fields:
+            if not searchable:
+                continue
+            column = self.search_columns.get(name, self.columns[name])
+            weight = FIELD_WEIGHTS.get(name, 1)
+            for index in column.find_all(needle):
+                scores[index] = scores.get(index, 0) + weight
+
+        name_column = self.search_columns[NAME_FIELDS[self.content_type]]
+        for index in name_column.find_all(needle):
+            title = name_column[index]
+            if title == needle:
+                scores[index] += EXACT_NAME_BONUS
+            elif title.startswith(needle):
+                scores[index] += PREFIX_NAME_BONUS
+            elif f' {needle}' in title:
+                scores[index] += WORD_NAME_BONUS
+        return scores
+
+    def rating_values(self):
+        """Returns the numeric rating of each interned rating code."""
+        values = []
+        for rating in self.columns['rating'].table:
+            try:
+                values.append(float(rating))
+            except (TypeError, ValueError):
+                values.append(0.0)
+        return values
+
+    def category_counts(self):
+        """Returns a {category_id: item count} mapping."""
+        counts = self.columns['category_ID'].value_counts()
+        counts.pop('', None)
+        return counts
+
+def split_genres(genre):
+    """Splits a provider genre string ("Action, Drama / Crime") into genre names."""
+    if not genre:
+        return []
+    parts = str(genre).replace('/', ',').replace('&', ',').split(',')
+    return [part.strip() for part in parts if part.strip()]
+
+def normalize_year(year):
+    """Returns a four digit year string from a year or release date, or ''."""
+    year = str(year or '').strip()[:4]
+    return year if len(year) == 4 and year.isdigit() else ''
+
+def rating_bucket(rating):
+    """Rounds a rating down to its whole-number histogram bucket, or ''."""
+    try:
+        return str(int(float(rating)))
+    except (TypeError, ValueError):
+        return ''
+
+class CatalogStats:
+    """Per-category counts and genre/year/rating histograms, updated item by item."""
+
+    def __init__(self):
+        self.total_items = 0
+        self.category_counts = Counter()
+        self.genre_counts = Counter()
+        self.year_counts = Counter()
+        self.rating_counts = Counter()
+
+    def add(self, record, sign=1):
+        self.total_items += sign
+        category_id = record.get('category_ID')
+        if category_id:
+            self.category_counts[str(category_id)] += sign
+        for genre in split_genres(record.get('genre')):
+            self.genre_counts[genre] += sign
+        year = normalize_year(record.get('year'))
+        if year:
+            self.year_counts[year] += sign
+        bucket = rating_bucket(record.get('rating'))
+        if bucket:
+            self.rating_counts[bucket] += sign
+
+    def remove(self, record):
+        self.add(record, sign=-1)
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """Computes stats for a catalog whose cache predates persisted stats."""
+        stats = cls()
+        for index in range(len(catalog)):
+            stats.add({name: catalog.value(index, name)
+                       for name in ('category_ID', 'genre', 'year', 'rating')})
+        return stats
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.total_items = data.get('total_items', 0)
+        stats.category_counts = Counter(data.get('category_counts', {}))
+        stats.genre_counts = Counter(data.get('genre_counts', {}))
+        stats.year_counts = Counter(data.get('year_counts', {}))
+        stats.rating_counts = Counter(data.get('rating_counts', {}))
+        return stats
+
+    def to_dict(self):
+        # Drop zero counts left behind by remove()
+        positive = lambda counter: {key: count for key, count in sorted(counter.items()) if count > 0}
+        category_counts = positive(self.category_counts)
+        return {
+            'total_items': self.total_items,
+            'total_categories': len(category_counts),
+            'category_counts': category_counts,
+            'genre_counts': positive(self.genre_counts),
+            'year_counts': positive(self.year_counts),
+            'rating_counts': positive(self.rating_counts)
+        }
+
+def deep_sizeof(obj, seen=None):
+    """Approximates the memory held by an object graph of dicts, lists and scalars."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+def memory_report(content_type, cached_data, catalog=None):
+    """Compares the memory of the nested-dict cache with its compact catalog."""
+    if catalog is None:
+        catalog = CompactCatalog.from_cache(content_type, cached_data)
+    dict_bytes = deep_sizeof(cached_data.get(content_type, {}))
+    compact_bytes = deep_sizeof(catalog)
+    return {
+        'content_type': content_type,
+        'items': len(catalog),
+        'dict_bytes': dict_bytes,
+        'compact_bytes': compact_bytes,
+        'ratio': round(dict_bytes / compact_bytes, 2) if compact_bytes else None
+    }
+
+if __name__ == '__main__':
+    # The JSON file, not the snapshot-backed mapping, is the nested-dict baseline
+    from cache_manager import get_cached_json
+
+    for content_type in ('series', 'movies'):
+        cached_data = get_cached_json(content_type)
+        if not cached_data:
+            print(f"No {content_type} cache found.")
+            continue
+        report = memory_report(content_type, cached_data)
+        print(f"{content_type}: {report['items']} items, "
+              f"dicts {report['dict_bytes'] / 1048576:.1f} MB, "
+              f"compact {report['compact_bytes'] / 1048576:.1f} MB "
+              f"({report['ratio']}x smaller)")
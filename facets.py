@@ -0,0 +1,105 @@
+from catalog import split_genres, normalize_year
+
+FACET_FIELDS = ('genre', 'year', 'category', 'rating')
+
+def bitset_from_rows(indexes, size):
+    """Builds an int bitset with the given row indexes set."""
+    bits = bytearray((size + 7) // 8)
+    for index in indexes:
+        bits[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(bits, 'little')
+
+def has_row(bitset_bytes, index):
+    """Tests a row in a bitset converted with bits.to_bytes(..., 'little')."""
+    byte_index = index >> 3
+    return byte_index < len(bitset_bytes) and bitset_bytes[byte_index] >> (index & 7) & 1
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+def iter_rows(bits):
+    """Yields the row indexes set in a bitset, in ascending order."""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for byte_index, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            yield (byte_index << 3) + low.bit_length() - 1
+            byte ^= low
+
+class FacetIndex:
+    """Per-value bitsets over a catalog so facet filters become set intersections."""
+
+    def __init__(self, catalog):
+        self.size = len(catalog)
+        self.all_rows = (1 << self.size) - 1
+        postings = {field: {} for field in FACET_FIELDS}
+        genres = catalog.columns['genre']
+        years = catalog.columns['year']
+        categories = catalog.columns['category_ID']
+        ratings = catalog.columns['rating']
+        rating_values = catalog.rating_values()
+
+        # Interned columns let us resolve each distinct value once
+        genre_names = [split_genres(genre) for genre in genres.table]
+        year_names = [normalize_year(year) for year in years.table]
+        for index in range(self.size):
+            for genre in genre_names[genres.codes[index]]:
+                postings['genre'].setdefault(genre, []).append(index)
+            year = year_names[years.codes[index]]
+            if year:
+                postings['year'].setdefault(year, []).append(index)
+            category_id = categories[index]
+            if category_id:
+                postings['category'].setdefault(str(category_id), []).append(index)
+            postings['rating'].setdefault(rating_values[ratings.codes[index]], []).append(index)
+
+        self.bitsets = {field: {value: bitset_from_rows(indexes, self.size) for value, indexes in values.items()}
+                        for field, values in postings.items()}
+
+    def _union(self, field, values):
+        bits = 0
+        for value in values:
+            bits |= self.bitsets[field].get(value, 0)
+        return bits
+
+    def facet_mask(self, field, filters):
+        """Returns the rows allowed by one facet's filter, or None if it is unfiltered."""
+        if field == 'genre' and filters.get('genres'):
+            return self._union('genre', filters['genres'])
+        if field == 'category' and filters.get('categories'):
+            return self._union('category', [str(c) for c in filters['categories']])
+        if field == 'year' and (filters.get('year_min') or filters.get('year_max')):
+            year_min = filters.get('year_min') or 0
+            year_max = filters.get('year_max') or 9999
+            return self._union('year', [year for year in self.bitsets['year']
+                                        if year_min <= int(year) <= year_max])
+        if field == 'rating' and filters.get('min_rating'):
+            return self._union('rating', [rating for rating in self.bitsets['rating']
+                                          if rating >= filters['min_rating']])
+        return None
+
+    def filter(self, filters, base=None):
+        """Intersects every active facet filter (and an optional base bitset)."""
+        mask = self.all_rows if base is None else base
+        for field in FACET_FIELDS:
+            facet = self.facet_mask(field, filters)
+            if facet is not None:
+                mask &= facet
+        return mask
+
+    def facet_counts(self, filters, base=None):
+        """Counts rows per facet value under all filters except that facet's own."""
+        masks = {field: self.facet_mask(field, filters) for field in FACET_FIELDS}
+        counts = {}
+        for field in ('genre', 'year', 'category'):
+            mask = self.all_rows if base is None else base
+            for other, facet in masks.items():
+                if other != field and facet is not None:
+                    mask &= facet
+            field_counts = {}
+            for value, bits in self.bitsets[field].items():
+                count = popcount(bits & mask)
+                if count:
+                    field_counts[value] = count
+            counts[field] = field_counts
+        return counts
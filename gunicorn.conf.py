@@ -0,0 +1,24 @@
+"""Production server settings: gunicorn -c gunicorn.conf.py app:app
+
+Runs WEB_WORKERS processes with WEB_THREADS threads each. Progress, jobs and
+the active user are shared between them through shared_state.py; the
+scheduler, stream proxy and library scan run in one of them.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_WORKERS', min(4, multiprocessing.cpu_count())))
+# Workers inherit this and split the upstream concurrency limits between them
+os.environ['WEB_WORKERS'] = str(workers)
+# Threads keep long-lived progress streams and proxied playback from tying up a worker
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+timeout = 120
+graceful_timeout = 30
+accesslog = '-'
+
+def post_worker_init(worker):
+    # Start background services in the first worker to claim them rather than on its first request
+    from app import start_background_services
+    start_background_services()
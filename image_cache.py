@@ -0,0 +1,204 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import requests
+
+from cache_manager import CACHE_DIR
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is in requirements.txt; without it originals are served unresized
+    Image = None
+    print("Pillow is not installed: cover thumbnails are disabled and /img serves full-size originals")
+
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR') or os.path.join(CACHE_DIR, 'images')
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Widths thumbnails are rendered at (grid cards and their 2x variants); others round up
+THUMBNAIL_WIDTHS = (150, 300, 600)
+THUMBNAIL_QUALITY = 85
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+# Broken cover URLs are not retried for this long
+NEGATIVE_TTL = int(os.environ.get('IMAGE_NEGATIVE_TTL', 24 * 3600))
+IMAGE_FETCH_TIMEOUT = (5, 15)
+
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+def sniff_image_type(data):
+    """Returns the MIME type of JPEG/PNG/GIF/WebP bytes, or None if it is not an image."""
+    for signature, mimetype in _SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def thumbnail_width(width):
+    """Rounds a requested width up to a supported thumbnail width (None means the original)."""
+    if not width:
+        return None
+    for candidate in THUMBNAIL_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return None
+
+class ImageCache:
+    """Disk cache of cover images: originals, resized thumbnails and misses, evicted LRU by size."""
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, http_session=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.session = http_session or requests.Session()
+        self.size = None
+        self.stats = {'hits': 0, 'fetched': 0, 'failed': 0, 'negative_hits': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        # Striped locks so concurrent requests for one cover fetch it once
+        self._url_locks = [threading.Lock() for _ in range(64)]
+
+    def _base_path(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _url_lock(self, url):
+        return self._url_locks[hash(url) % len(self._url_locks)]
+
+    def _scan_size(self):
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self.size is None:
+                self.size = self._scan_size()
+            else:
+                self.size += len(data)
+            over = self.size > self.max_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        """Deletes least recently used files until the cache is back under 90% of its limit."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats['evicted'] += 1
+            except OSError:
+                pass
+        with self._lock:
+            self.size = total
+
+    def _touch(self, path):
+        # mtime doubles as the LRU clock
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def is_missing(self, url):
+        """True while a recent fetch of this URL failed."""
+        miss_path = self._base_path(url) + '.miss'
+        try:
+            return time.time() - os.path.getmtime(miss_path) < NEGATIVE_TTL
+        except OSError:
+            return False
+
+    def has(self, url):
+        return os.path.exists(self._base_path(url) + '.orig') or self.is_missing(url)
+
+    def _fetch_original(self, url):
+        base = self._base_path(url)
+        original_path = base + '.orig'
+        if os.path.exists(original_path):
+            self._touch(original_path)
+            self.stats['hits'] += 1
+            return original_path
+        if self.is_missing(url):
+            self.stats['negative_hits'] += 1
+            return None
+        try:
+            response = self.session.get(url, timeout=IMAGE_FETCH_TIMEOUT, stream=True)
+            response.raise_for_status()
+            data = response.raw.read(MAX_IMAGE_BYTES + 1, decode_content=True)
+            if len(data) > MAX_IMAGE_BYTES or not sniff_image_type(data):
+                raise ValueError("not an image or too large")
+        except Exception as e:
+            print(f"Error fetching cover {url}: {str(e)}")
+            self.stats['failed'] += 1
+            self._write(base + '.miss', b'')
+            return None
+        self._write(original_path, data)
+        self.stats['fetched'] += 1
+        return original_path
+
+    def _thumbnail(self, url, original_path, width):
+        path = f"{self._base_path(url)}.w{width}"
+        if os.path.exists(path):
+            self._touch(path)
+            return path
+        try:
+            with Image.open(original_path) as image:
+                if image.width <= width:
+                    return original_path
+                image = image.convert('RGB')
+                image.thumbnail((width, width * 4))
+                output = io.BytesIO()
+                image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        except Exception as e:
+            print(f"Error resizing cover {url}: {str(e)}")
+            return original_path
+        self._write(path, output.getvalue())
+        return path
+
+    def get(self, url, width=None):
+        """Returns (bytes, mimetype) of the cached image, resized when possible, or None for a broken URL."""
+        with self._url_lock(url):
+            original_path = self._fetch_original(url)
+            if original_path is None:
+                return None
+            width = thumbnail_width(width)
+            path = original_path
+            if width is not None and Image is not None:
+                path = self._thumbnail(url, original_path, width)
+            with open(path, 'rb') as f:
+                data = f.read()
+        return data, sniff_image_type(data)
+
+    def status(self):
+        with self._lock:
+            size = self.size
+        return dict(self.stats, bytes=size, max_bytes=self.max_bytes, resizing=Image is not None)
+
+image_cache = ImageCache()
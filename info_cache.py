@@ -0,0 +1,220 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from cache_manager import get_cache_dir
+
+# Payloads older than this are still served, but refreshed in the background
+SERIES_INFO_TTL = int(os.environ.get('SERIES_INFO_TTL', 6 * 3600))
+MOVIE_INFO_TTL = int(os.environ.get('MOVIE_INFO_TTL', 6 * 3600))
+INFO_MEMORY_SIZE = 512
+EPISODE_INDEX_FILE = 'episode_index.jsonl'
+
+_UNSAFE_ID = re.compile(r'[^0-9A-Za-z_-]')
+
+class InfoCache:
+    """Persistent per-title cache of player_api info payloads, with stale-while-revalidate."""
+
+    def __init__(self, name, ttl, memory_size=INFO_MEMORY_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.memory_size = memory_size
+        # {(partition, item_id): (fetched_at, payload)}
+        self._memory = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _path(self, partition, item_id):
+        return os.path.join(partition, self.name, f"{_UNSAFE_ID.sub('_', str(item_id))}.json")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            if len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def peek(self, item_id, partition=None):
+        """Returns (payload, fetched_at) without contacting upstream, or (None, None)."""
+        partition = get_cache_dir() if partition is None else partition
+        key = (partition, str(item_id))
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry[1], entry[0]
+        try:
+            with open(self._path(partition, item_id), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        entry = (stored['fetched_at'], stored['payload'])
+        self._remember(key, entry)
+        return entry[1], entry[0]
+
+    def is_fresh(self, item_id, partition=None):
+        _, fetched_at = self.peek(item_id, partition)
+        return fetched_at is not None and time.time() - fetched_at <= self.ttl
+
+    def store(self, item_id, payload, partition=None):
+        """Persists a payload atomically and keeps it in memory."""
+        partition = get_cache_dir() if partition is None else partition
+        path = self._path(partition, item_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fetched_at = time.time()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': fetched_at, 'payload': payload}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self._remember((partition, str(item_id)), (fetched_at, payload))
+
+    def get(self, item_id, fetch):
+        """Returns the cached payload (revalidating it if expired) or fetches it."""
+        partition = get_cache_dir()
+        payload, fetched_at = self.peek(item_id, partition)
+        if payload is None:
+            return self.refresh(item_id, fetch, partition)
+        if time.time() - fetched_at > self.ttl:
+            self._revalidate(item_id, fetch, partition)
+        return payload
+
+    def refresh(self, item_id, fetch, partition=None):
+        """Fetches a payload upstream and stores it; returns None if the fetch fails."""
+        partition = get_cache_dir() if partition is None else partition
+        payload = fetch(item_id)
+        if payload:
+            self.store(item_id, payload, partition)
+        return payload
+
+    def _revalidate(self, item_id, fetch, partition):
+        key = (partition, str(item_id))
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def worker():
+            try:
+                self.refresh(item_id, fetch, partition)
+            except Exception as e:
+                print(f"Error revalidating {self.name} {item_id}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+class EpisodeIndex:
+    """episode_id -> (series_id, season, position), persisted as an append-only log."""
+
+    def __init__(self, path):
+        self.path = path
+        self.episodes = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        lines = 0
+        series_ids = set()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn final line after a crash
+                    lines += 1
+                    series_ids.add(entry['series_id'])
+                    self._apply(entry)
+        except OSError:
+            return
+        # Every refresh of a series appends a line; compact once most lines are superseded
+        if lines > 2 * len(series_ids) + 100:
+            self._compact()
+
+    def _apply(self, entry):
+        series_id = entry['series_id']
+        for episode_id, (season, position) in entry['episodes'].items():
+            self.episodes[episode_id] = (series_id, season, position)
+
+    def _compact(self):
+        by_series = {}
+        for episode_id, (series_id, season, position) in self.episodes.items():
+            by_series.setdefault(series_id, {})[episode_id] = [season, position]
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for series_id, episodes in by_series.items():
+                f.write(json.dumps({'series_id': series_id, 'episodes': episodes}) + '\n')
+        os.replace(temp_path, self.path)
+
+    def add_series(self, series_id, series_data):
+        """Indexes every episode of a get_series_info payload."""
+        episodes = {}
+        for season, season_episodes in (series_data.get('episodes') or {}).items():
+            for position, episode in enumerate(season_episodes):
+                if episode.get('id') is not None:
+                    episodes[str(episode['id'])] = [str(season), position]
+        if not episodes:
+            return
+        entry = {'series_id': str(series_id), 'episodes': episodes}
+        with self._lock:
+            self._apply(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def find(self, episode_id):
+        return self.episodes.get(str(episode_id))
+
+class SeriesInfoCache(InfoCache):
+    """get_series_info cache that also maintains the partition's episode index."""
+
+    def __init__(self, ttl=SERIES_INFO_TTL):
+        super().__init__('series_info', ttl)
+        self._indexes = {}
+
+    def episode_index(self, partition=None):
+        partition = get_cache_dir() if partition is None else partition
+        with self._lock:
+            index = self._indexes.get(partition)
+            if index is None:
+                os.makedirs(partition or '.', exist_ok=True)
+                index = self._indexes[partition] = EpisodeIndex(os.path.join(partition, EPISODE_INDEX_FILE))
+            return index
+
+    def store(self, item_id, payload, partition=None):
+        partition = get_cache_dir() if partition is None else partition
+        super().store(item_id, payload, partition)
+        if isinstance(payload, dict):
+            self.episode_index(partition).add_series(item_id, payload)
+
+    def find_episode(self, episode_id, fetch, series_id=None):
+        """Returns (series_data, season, episode) for an episode id, or (series_data, None, None)."""
+        located = self.episode_index().find(episode_id)
+        if located is not None and (series_id is None or located[0] == str(series_id)):
+            located_series, season, position = located
+            series_data = self.get(located_series, fetch)
+            try:
+                episode = series_data['episodes'][season][position]
+                if str(episode.get('id')) == str(episode_id):
+                    return series_data, season, episode
+            except (KeyError, IndexError, TypeError):
+                pass  # Index predates the latest payload; fall back to a scan
+
+        if series_id is None:
+            return None, None, None
+        series_data = self.get(series_id, fetch)
+        if not series_data:
+            return None, None, None
+        for season, episodes in (series_data.get('episodes') or {}).items():
+            for episode in episodes:
+                if str(episode.get('id')) == str(episode_id):
+                    return series_data, season, episode
+        return series_data, None, None
+
+series_info_cache = SeriesInfoCache()
+movie_info_cache = InfoCache('movie_info', MOVIE_INFO_TTL)
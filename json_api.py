@@ -0,0 +1,81 @@
+import hashlib
+import json
+import zlib
+
+from flask import Response, request
+
+API_VERSION = 'v1'
+# Encoder output is batched into chunks of about this size before compressing
+STREAM_CHUNK_SIZE = 16 * 1024
+GZIP_LEVEL = 6
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+def make_etag(*parts):
+    """Strong ETag for a response derived from the data versions it was built from."""
+    return hashlib.sha1(repr((API_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+def _encoded_chunks(payload):
+    buffer = []
+    size = 0
+    for piece in _encoder.iterencode(payload):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _representation_etag(etag, use_gzip):
+    # Each encoding is a different representation, so it gets its own strong tag
+    return f"{etag}-gz" if use_gzip else etag
+
+def not_modified(etag):
+    """A 304 response if the client already has this ETag's representation, else None."""
+    etag = _representation_etag(etag, 'gzip' in request.accept_encodings)
+    if not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def json_response(payload, etag=None, status=200):
+    """Streams payload as JSON, gzipped when accepted, answering If-None-Match with 304.
+
+    payload may be a callable, so work is skipped entirely when the client
+    already has the current version.
+    """
+    use_gzip = 'gzip' in request.accept_encodings
+    if etag is not None:
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        etag = _representation_etag(etag, use_gzip)
+
+    if callable(payload):
+        payload = payload()
+    chunks = _encoded_chunks(payload)
+    if use_gzip:
+        chunks = _gzipped(chunks)
+    response = Response(chunks, status=status, mimetype='application/json')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    if etag is not None:
+        response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def api_error(message, status):
+    return json_response({'error': message}, status=status)
@@ -0,0 +1,423 @@
+import filecmp
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from shared_state import ProcessLock
+
+DOWNLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
+MOVIES_DIR = os.path.join(DOWNLOADS_DIR, "Movies")
+# Downloads are written here and renamed into place once complete
+PARTIAL_SUFFIX = '.part'
+LIBRARY_INDEX_FILE = os.path.join(DOWNLOADS_DIR, '.library.json')
+# Seconds between scans that reconcile the index with files added or removed by hand
+LIBRARY_SCAN_INTERVAL = int(os.environ.get('LIBRARY_SCAN_INTERVAL', 300))
+# Hash samples of each download so identical files from other servers are hardlinked (after a full compare)
+LIBRARY_FAST_HASH = os.environ.get('LIBRARY_FAST_HASH', 'false').lower() == 'true'
+LIBRARY_VERIFY_WORKERS = int(os.environ.get('LIBRARY_VERIFY_WORKERS', 8))
+FAST_HASH_SAMPLE = 64 * 1024
+
+def movie_download_info(movie_data, vod_id):
+    """Returns (stream_id, name, container_extension) for a get_vod_info payload."""
+    movie_info = movie_data.get('info', {}) or {}
+    movie_data_info = movie_data.get('movie_data', {}) or {}
+    stream_id = (movie_data_info.get('stream_id') or
+                 movie_info.get('stream_id') or
+                 movie_info.get('id') or
+                 movie_data.get('stream_id') or
+                 movie_data.get('id') or
+                 vod_id)
+    name = movie_data_info.get('name') or movie_info.get('name') or 'Unknown Movie'
+    container_extension = (movie_data_info.get('container_extension') or
+                           movie_info.get('container_extension') or
+                           'mp4')
+    return stream_id, name, container_extension
+
+def movie_path(movie_data, vod_id):
+    _, name, container_extension = movie_download_info(movie_data, vod_id)
+    return os.path.join(MOVIES_DIR, f"{name}.{container_extension}")
+
+def season_dir(series_data, season):
+    return os.path.join(DOWNLOADS_DIR, f"{series_data['info']['name']} - S{season}")
+
+def episode_path(series_data, season, episode):
+    return os.path.join(season_dir(series_data, season),
+                        f"{episode['title']}.{episode.get('container_extension', 'mp4')}")
+
+def partial_path(path):
+    return f"{path}{PARTIAL_SUFFIX}"
+
+def fast_hash(path):
+    """SHA-1 of a file's size and 64KB samples from its start, middle and end."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode('utf-8'))
+    with open(path, 'rb') as f:
+        for offset in (0, max(0, size // 2 - FAST_HASH_SAMPLE // 2), max(0, size - FAST_HASH_SAMPLE)):
+            f.seek(offset)
+            digest.update(f.read(FAST_HASH_SAMPLE))
+    return digest.hexdigest()
+
+def hardlink(source, path):
+    """Atomically replaces (or creates) path with a hardlink to source; False if the filesystem refuses."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.link"
+    try:
+        os.link(source, temp_path)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+class LibraryIndex:
+    """Persistent index of completed downloads, keyed by provider stream id.
+
+    Downloads are recorded as they finish; a background scan reconciles the
+    index with DOWNLOADS_DIR, re-listing only directories whose mtime changed.
+    Entries carry size and, with LIBRARY_FAST_HASH, a sampled hash, so the
+    index doubles as the manifest for deduplication and verify().
+
+    Every worker process holds its own copy. Changes are made under a lock on
+    the index file, on top of whatever another process saved last, and
+    refresh() picks up other processes' changes.
+    """
+
+    def __init__(self, root=DOWNLOADS_DIR, path=LIBRARY_INDEX_FILE, scan_interval=LIBRARY_SCAN_INTERVAL):
+        self.root = root
+        self.path = path
+        self.scan_interval = scan_interval
+        # relative path -> {size, mtime, kind, stream_id, server, series_id, hash}; files found
+        # by the scan alone have no stream id until a watch page links them
+        self.files = {}
+        self.dir_mtimes = {}
+        self.version = 0
+        self.last_scan = None
+        self._streams = {}
+        self._series = {}
+        self._hashes = {}
+        self.stats = {'skipped': 0, 'linked': 0, 'saved_bytes': 0}
+        self._lock = threading.RLock()
+        self._file_lock = ProcessLock(f"{path}.lock")
+        # (inode, mtime) of the index file this copy was loaded from or saved as
+        self._loaded = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.refresh()
+
+    @staticmethod
+    def stream_key(server, kind, stream_id):
+        return f"{(server or '').rstrip('/')}|{kind}|{stream_id}"
+
+    def _relative(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def _file_version(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def refresh(self):
+        """Reloads the index if another process saved it since; returns the current version."""
+        file_version = self._file_version()
+        with self._lock:
+            if file_version is not None and file_version != self._loaded:
+                self._load(file_version)
+            return self.version
+
+    def _load(self, file_version):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.files = stored.get('files', {})
+        self.dir_mtimes = stored.get('dirs', {})
+        self._streams, self._series, self._hashes = {}, {}, {}
+        for relative_path, entry in self.files.items():
+            self._link(relative_path, entry)
+        self._loaded = file_version
+        self.version += 1
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        data = json.dumps({'files': self.files, 'dirs': self.dir_mtimes}, ensure_ascii=False)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+        self._loaded = self._file_version()
+
+    @contextmanager
+    def _updating(self):
+        """Applies a change to the latest saved index and saves it if the version moved.
+
+        The index file lock keeps other processes from saving in between, so
+        neither side's changes are lost.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        self._file_lock.acquire()
+        try:
+            with self._lock:
+                self.refresh()
+                version = self.version
+                yield
+                if self.version != version:
+                    self._save()
+        finally:
+            self._file_lock.release()
+
+    def _link(self, relative_path, entry):
+        if entry.get('hash'):
+            self._hashes.setdefault(entry['hash'], relative_path)
+        if entry.get('stream_id') is None:
+            return
+        key = self.stream_key(entry.get('server'), entry['kind'], entry['stream_id'])
+        self._streams[key] = relative_path
+        if entry.get('series_id') is not None:
+            self._series.setdefault(self.stream_key(entry.get('server'), 'series', entry['series_id']),
+                                    set()).add(relative_path)
+
+    def _unlink(self, relative_path):
+        entry = self.files.pop(relative_path, None)
+        if entry and self._hashes.get(entry.get('hash')) == relative_path:
+            del self._hashes[entry['hash']]
+            for other_path, other in self.files.items():
+                if other.get('hash') == entry['hash']:
+                    self._hashes[entry['hash']] = other_path
+                    break
+        if not entry or entry.get('stream_id') is None:
+            return
+        key = self.stream_key(entry.get('server'), entry['kind'], entry['stream_id'])
+        if self._streams.get(key) == relative_path:
+            del self._streams[key]
+        if entry.get('series_id') is not None:
+            self._series.get(self.stream_key(entry.get('server'), 'series', entry['series_id']),
+                             set()).discard(relative_path)
+
+    def record(self, path, kind, stream_id, server, series_id=None):
+        """Adds a completed download (or links an existing file to its stream id).
+
+        With LIBRARY_FAST_HASH, a file identical to one already in the library is
+        replaced by a hardlink to it. Sampled hashes only find candidates; the
+        files are compared byte for byte before linking.
+        """
+        relative_path = self._relative(path)
+        file_hash = fast_hash(path) if LIBRARY_FAST_HASH else None
+        original = self._hashes.get(file_hash)
+        if original and original != relative_path:
+            original_path = os.path.join(self.root, original)
+            size = os.path.getsize(path)
+            if (os.path.getsize(original_path) == size and not os.path.samefile(original_path, path)
+                    and filecmp.cmp(original_path, path, shallow=False) and hardlink(original_path, path)):
+                self.stats['linked'] += 1
+                self.stats['saved_bytes'] += size
+        stat = os.stat(path)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'kind': kind, 'stream_id': str(stream_id),
+                 'server': (server or '').rstrip('/'),
+                 'series_id': str(series_id) if series_id is not None else None,
+                 'hash': file_hash}
+        with self._updating():
+            self._unlink(relative_path)
+            self.files[relative_path] = entry
+            self._link(relative_path, entry)
+            self.version += 1
+
+    def forget(self, path):
+        with self._updating():
+            self._unlink(self._relative(path))
+            self.version += 1
+
+    def reuse(self, server, kind, stream_id, size, path):
+        """Makes path a copy of an earlier download of the same stream and size, if there is one.
+
+        Returns 'skipped' when path already holds it, 'linked' after hardlinking it
+        there, and None when the stream has to be downloaded (including when the
+        filesystem refuses the hardlink).
+        """
+        self.refresh()
+        relative_path = self._streams.get(self.stream_key(server, kind, stream_id))
+        if not relative_path or not size:
+            return None
+        existing = os.path.join(self.root, relative_path)
+        try:
+            if os.path.getsize(existing) != size:
+                return None
+        except OSError:
+            return None
+        if os.path.abspath(path) == os.path.abspath(existing):
+            self.stats['skipped'] += 1
+            return 'skipped'
+        if not hardlink(existing, path):
+            return None
+        self.stats['linked'] += 1
+        self.stats['saved_bytes'] += size
+        return 'linked'
+
+    def has(self, server, kind, stream_id):
+        return self.stream_key(server, kind, stream_id) in self._streams
+
+    def series_count(self, server, series_id):
+        """Number of downloaded episodes of a series."""
+        return len(self._series.get(self.stream_key(server, 'series', series_id), ()))
+
+    def locate(self, server, kind, stream_id, expected_path=None, series_id=None):
+        """Returns the absolute path of a downloaded title, or None.
+
+        Falls back to the path the downloader would have used, which links
+        files downloaded before the index existed to their stream id.
+        """
+        self.refresh()
+        relative_path = self._streams.get(self.stream_key(server, kind, stream_id))
+        path = os.path.join(self.root, relative_path) if relative_path else None
+        if path and os.path.isfile(path):
+            return path
+        if path:
+            self.forget(path)
+        if expected_path and os.path.isfile(expected_path):
+            self.record(expected_path, kind, stream_id, server, series_id)
+            return expected_path
+        return None
+
+    def scan(self):
+        """Reconciles the index with the disk; returns the number of files added, changed or removed."""
+        with self._updating():
+            return self._scan()
+
+    def _scan(self):
+        changes = 0
+        seen_dirs = set()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            relative_dir = os.path.relpath(dirpath, self.root)
+            if relative_dir == '.':
+                relative_dir = ''
+            seen_dirs.add(relative_dir)
+            try:
+                dir_mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+            if self.dir_mtimes.get(relative_dir) == dir_mtime:
+                continue
+            present = {}
+            for name in filenames:
+                if name.startswith('.') or name.endswith(PARTIAL_SUFFIX):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                present[os.path.normpath(os.path.join(relative_dir, name))] = stat
+            with self._lock:
+                for relative_path in [p for p in self.files
+                                      if os.path.dirname(p) == relative_dir and p not in present]:
+                    self._unlink(relative_path)
+                    changes += 1
+                for relative_path, stat in present.items():
+                    entry = self.files.get(relative_path)
+                    if entry is None:
+                        self.files[relative_path] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+                        changes += 1
+                    elif entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                        # Rewritten in place: the stored hash no longer describes it
+                        self._unlink(relative_path)
+                        self.files[relative_path] = dict(entry, size=stat.st_size, mtime=stat.st_mtime, hash=None)
+                        self._link(relative_path, self.files[relative_path])
+                        changes += 1
+                self.dir_mtimes[relative_dir] = dir_mtime
+
+        with self._lock:
+            for relative_dir in [d for d in self.dir_mtimes if d not in seen_dirs]:
+                del self.dir_mtimes[relative_dir]
+                for relative_path in [p for p in self.files if os.path.dirname(p) == relative_dir]:
+                    self._unlink(relative_path)
+                    changes += 1
+            if changes:
+                self.version += 1
+            self.last_scan = datetime.now().isoformat()
+        return changes
+
+    def _verify_file(self, relative_path, entry, deep):
+        path = os.path.join(self.root, relative_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 'missing', None
+        if stat.st_size != entry['size']:
+            return 'changed', None
+        if not LIBRARY_FAST_HASH or (entry.get('hash') and not deep and stat.st_mtime == entry['mtime']):
+            return 'ok', None
+        file_hash = fast_hash(path)
+        if entry.get('hash') and file_hash != entry['hash']:
+            return 'changed', None
+        return ('ok' if entry.get('hash') else 'hashed'), file_hash
+
+    def verify(self, deep=False, workers=LIBRARY_VERIFY_WORKERS):
+        """Checks every file against the index in parallel.
+
+        Only sizes and mtimes are compared, except for files without a hash
+        (which get one) and, with deep=True, every file's sampled hash.
+        """
+        started = time.monotonic()
+        with self._lock:
+            entries = list(self.files.items())
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda item: (item[0],) + self._verify_file(item[0], item[1], deep),
+                                        entries))
+        report = {'checked': len(results), 'ok': 0, 'hashed': 0, 'missing': [], 'changed': []}
+        with self._updating():
+            for relative_path, result, file_hash in results:
+                if result in ('missing', 'changed'):
+                    report[result].append(relative_path)
+                    continue
+                report[result] += 1
+                entry = self.files.get(relative_path)
+                if file_hash and entry is not None and not entry.get('hash'):
+                    entry['hash'] = file_hash
+                    self._link(relative_path, entry)
+            if report['hashed']:
+                self.version += 1
+        report['seconds'] = round(time.monotonic() - started, 3)
+        return report
+
+    def start(self):
+        """Starts the background scan thread once."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='library-scan')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                changes = self.scan()
+                if changes:
+                    print(f"Library scan: {changes} changes")
+            except Exception as e:
+                print(f"Error scanning downloads: {str(e)}")
+            time.sleep(self.scan_interval)
+
+    def status(self):
+        self.refresh()
+        with self._lock:
+            return dict(self.stats, **{
+                'files': len(self.files),
+                'indexed_streams': len(self._streams),
+                'bytes': sum(entry['size'] for entry in self.files.values()),
+                'directories': len(self.dir_mtimes),
+                'version': self.version,
+                'last_scan': self.last_scan,
+                'scan_interval': self.scan_interval,
+                'fast_hash': LIBRARY_FAST_HASH
+            })
+
+library = LibraryIndex()
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, g, request
+
+from cache_manager import LISTING_MAX_AGE_HOURS, get_cache_dir, get_cache_version, get_catalog_age_hours
+
+PAGE_CACHE_ENTRIES = int(os.environ.get('PAGE_CACHE_ENTRIES', 500))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+class PageCache:
+    """LRU of rendered pages keyed by account, URL and catalog version."""
+
+    def __init__(self, max_entries=PAGE_CACHE_ENTRIES, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body):
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self.size -= len(old[1])
+            self._entries[key] = (etag, body)
+            self.size += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+        return etag
+
+    def status(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
+
+page_cache = PageCache()
+
+def _page_response(etag, body):
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def cached_page(content_type, get_account, get_extra_version=None):
+    """Caches a route's rendered HTML until the content type's catalog changes.
+
+    get_extra_version, if given, names other state the page shows (such as
+    the downloads library); a change in its value also invalidates the page.
+
+    The route opts in per request by setting g.page_cacheable = True, which it
+    does only when the page was built from the local catalog. Once the catalog
+    is older than LISTING_MAX_AGE_HOURS cached pages are bypassed, so listings
+    go back upstream like the route itself does.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_app.config.get('TEMPLATES_AUTO_RELOAD'):
+                return view(*args, **kwargs)
+            age = get_catalog_age_hours(content_type)
+            if age is None or age > LISTING_MAX_AGE_HOURS:
+                return view(*args, **kwargs)
+            version = get_cache_version(content_type)
+            extra_version = get_extra_version() if get_extra_version else None
+            key = (get_account(), get_cache_dir(), request.full_path, version, extra_version)
+            entry = page_cache.get(key) if version is not None else None
+            if entry:
+                return _page_response(*entry)
+
+            result = view(*args, **kwargs)
+            if not isinstance(result, str) or not g.get('page_cacheable'):
+                return result
+            body = result.encode('utf-8')
+            etag = page_cache.put(key, body)
+            return _page_response(etag, body)
+        return wrapper
+    return decorator
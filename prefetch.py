@@ -0,0 +1,236 @@
+import os
+import threading
+import time
+from queue import Queue, Full, Empty
+
+from cache_manager import cache_build_lock, get_cache_dir
+from image_cache import image_cache, THUMBNAIL_WIDTHS
+
+# Opt-in: warm series/movie info for the titles on listing pages
+PREFETCH_INFO = os.environ.get('PREFETCH_INFO', '').lower() in ('1', 'true', 'yes')
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))
+PREFETCH_QUEUE_SIZE = 200
+# Minimum spacing between prefetch requests across all workers
+PREFETCH_MIN_INTERVAL = float(os.environ.get('PREFETCH_MIN_INTERVAL', 0.25))
+PREFETCH_NICENESS = 15
+# Opt-in: warm the cover image cache with every new cover after a catalog build
+PREFETCH_COVERS = os.environ.get('PREFETCH_COVERS', '').lower() in ('1', 'true', 'yes')
+COVER_PREFETCH_WORKERS = int(os.environ.get('COVER_PREFETCH_WORKERS', 4))
+COVER_PREFETCH_QUEUE_SIZE = 2000
+COVER_PREFETCH_MIN_INTERVAL = float(os.environ.get('COVER_PREFETCH_MIN_INTERVAL', 0.05))
+COVER_PROGRESS_INTERVAL = 1.0
+
+class InfoPrefetcher:
+    """Bounded low-priority pool that fills info caches ahead of the user's clicks."""
+
+    def __init__(self, enabled=PREFETCH_INFO, workers=PREFETCH_WORKERS,
+                 queue_size=PREFETCH_QUEUE_SIZE, min_interval=PREFETCH_MIN_INTERVAL):
+        self.enabled = enabled
+        self.workers = workers
+        self.min_interval = min_interval
+        self._queue = Queue(maxsize=queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._next_request = 0.0
+        self._threads = []
+        self.stats = {'queued': 0, 'fetched': 0, 'skipped': 0, 'dropped': 0, 'failed': 0}
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'info-prefetch-{i}')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def enqueue(self, cache, item_ids, fetch):
+        """Queues titles whose cached info is missing or expired; drops work when the queue is full."""
+        if not self.enabled:
+            return 0
+        self._start()
+        partition = get_cache_dir()
+        queued = 0
+        for item_id in item_ids:
+            if item_id is None:
+                continue
+            key = (cache.name, partition, str(item_id))
+            with self._lock:
+                if key in self._pending:
+                    continue
+            if cache.is_fresh(item_id, partition):
+                continue
+            try:
+                self._queue.put_nowait((key, cache, item_id, fetch, partition))
+            except Full:
+                self.stats['dropped'] += 1
+                break
+            with self._lock:
+                self._pending.add(key)
+            queued += 1
+        self.stats['queued'] += queued
+        return queued
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _worker(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICENESS)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            try:
+                key, cache, item_id, fetch, partition = self._queue.get(timeout=60)
+            except Empty:
+                continue
+            try:
+                # Leave the provider alone during catalog builds and after account switches
+                if cache_build_lock.locked() or partition != get_cache_dir() or cache.is_fresh(item_id, partition):
+                    self.stats['skipped'] += 1
+                    continue
+                self._wait_turn()
+                if cache.refresh(item_id, fetch, partition):
+                    self.stats['fetched'] += 1
+                else:
+                    self.stats['failed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"Error prefetching {cache.name} {item_id}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def status(self):
+        return dict(self.stats, enabled=self.enabled, workers=self.workers,
+                    queue_length=self._queue.qsize(), min_interval=self.min_interval)
+
+info_prefetcher = InfoPrefetcher()
+
+class CoverBatch:
+    """Completion counter for one catalog build's covers."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def finish(self, ok):
+        with self._lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+
+class CoverPrefetcher:
+    """Bounded, rate-limited pool that downloads catalog covers into the image cache."""
+
+    def __init__(self, cache=image_cache, enabled=PREFETCH_COVERS, workers=COVER_PREFETCH_WORKERS,
+                 queue_size=COVER_PREFETCH_QUEUE_SIZE, min_interval=COVER_PREFETCH_MIN_INTERVAL):
+        self.cache = cache
+        self.enabled = enabled
+        self.workers = workers
+        self.min_interval = min_interval
+        self._queue = Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._next_request = 0.0
+        self._threads = []
+        self.stats = {'queued': 0, 'fetched': 0, 'skipped': 0, 'dropped': 0, 'failed': 0}
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'cover-prefetch-{i}')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def prefetch(self, urls, progress=None, wait=False):
+        """Queues covers missing from the image cache and returns their count.
+
+        By default the call returns at once and covers that do not fit in the
+        queue are dropped (the next build queues them again). With wait=True it
+        feeds the whole batch and waits for it, calling progress(done, total),
+        if given, about once a second.
+        """
+        if not self.enabled:
+            return 0
+        # A changed cover has a new URL, so anything cached is unchanged
+        missing = [url for url in urls if url and not self.cache.has(url)]
+        if not missing:
+            return 0
+        self._start()
+        batch = CoverBatch(len(missing))
+        last_report = time.monotonic()
+        for position, url in enumerate(missing):
+            if not wait:
+                try:
+                    self._queue.put_nowait((url, batch))
+                except Full:
+                    dropped = len(missing) - position
+                    self.stats['dropped'] += dropped
+                    batch.total -= dropped
+                    break
+            else:
+                self._queue.put((url, batch))
+                if progress is not None and time.monotonic() - last_report >= COVER_PROGRESS_INTERVAL:
+                    progress(batch.done, batch.total)
+                    last_report = time.monotonic()
+        self.stats['queued'] += batch.total
+
+        if wait:
+            while batch.done < batch.total:
+                if progress is not None:
+                    progress(batch.done, batch.total)
+                time.sleep(COVER_PROGRESS_INTERVAL)
+            if progress is not None:
+                progress(batch.done, batch.total)
+        return batch.total
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _worker(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICENESS)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            try:
+                url, batch = self._queue.get(timeout=60)
+            except Empty:
+                continue
+            ok = True
+            try:
+                if self.cache.has(url):
+                    self.stats['skipped'] += 1
+                    continue
+                self._wait_turn()
+                # Also renders the grid thumbnail so the first page view is a pure cache hit
+                ok = self.cache.get(url, THUMBNAIL_WIDTHS[0]) is not None
+                self.stats['fetched' if ok else 'failed'] += 1
+            except Exception as e:
+                ok = False
+                self.stats['failed'] += 1
+                print(f"Error prefetching cover {url}: {str(e)}")
+            finally:
+                batch.finish(ok)
+
+    def status(self):
+        return dict(self.stats, enabled=self.enabled, workers=self.workers,
+                    queue_length=self._queue.qsize(), min_interval=self.min_interval)
+
+cover_prefetcher = CoverPrefetcher()
@@ -0,0 +1,220 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+
+# Bytes kept cached ahead of each viewer's position (0 disables read-ahead)
+STREAM_READAHEAD_BYTES = int(os.environ.get('STREAM_READAHEAD_BYTES', 32 * 1024 * 1024))
+# Viewers of one stream within this distance of each other share an upstream connection
+STREAM_FANOUT_WINDOW = int(os.environ.get('STREAM_FANOUT_WINDOW', 64 * 1024 * 1024))
+READAHEAD_CHUNK_SIZE = 256 * 1024
+READAHEAD_RETRIES = 3
+# How long a viewer waits for a block before fetching it itself
+READAHEAD_BLOCK_TIMEOUT = 30
+# A full read-ahead closes its upstream connection once no viewer has read for this many seconds (0 = never)
+READAHEAD_IDLE_TIMEOUT = float(os.environ.get('READAHEAD_IDLE_TIMEOUT', 60))
+
+class ReadAhead:
+    """Fills the block cache ahead of a stream's viewers, independently of how fast they read.
+
+    Uses a single open-ended upstream request and stops reading it (leaving TCP
+    to push back on the provider) once it is `window` bytes ahead of the leading
+    viewer, closing it if they stay paused for idle_timeout seconds. Viewers close to each other share one ReadAhead, and with it one
+    upstream connection; the block cache is their shared buffer.
+    """
+
+    def __init__(self, session, blocks, stream_url, key, size, window=STREAM_READAHEAD_BYTES,
+                 idle_timeout=READAHEAD_IDLE_TIMEOUT):
+        self.session = session
+        self.blocks = blocks
+        self.stream_url = stream_url
+        self.key = key
+        self.size = size
+        self.window = max(window, blocks.block_size)
+        self.idle_timeout = idle_timeout
+        self.positions = {}
+        self.last_read = time.monotonic()
+        self.connections = 0
+        self.idle_closes = 0
+        self.fetched_bytes = 0
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.failed = False
+        # Next block the running upstream request will store (None while idle)
+        self.fetching = None
+        self._task = None
+        self._advanced = asyncio.Event()
+        self._stored = asyncio.Condition()
+
+    def attach(self, viewer, position):
+        self.positions[viewer] = position
+        self.last_read = time.monotonic()
+        self._advanced.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def detach(self, viewer):
+        """Removes a viewer; returns True when none are left."""
+        self.positions.pop(viewer, None)
+        self._advanced.set()
+        return not self.positions
+
+    def accepts(self, position, exclude=None):
+        """True if a viewer at `position` is close enough to the others to share this read-ahead."""
+        others = [p for viewer, p in self.positions.items() if viewer is not exclude]
+        if not others:
+            return True
+        return min(others) - STREAM_FANOUT_WINDOW <= position <= max(others) + STREAM_FANOUT_WINDOW
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def advance(self, viewer, position):
+        """Called as a viewer consumes bytes; moves the read-ahead window."""
+        self.positions[viewer] = position
+        self.last_read = time.monotonic()
+        self._advanced.set()
+
+    def _window_end(self):
+        """Index of the last block the read-ahead may fill right now."""
+        if not self.positions:
+            return -1
+        last_block = self.blocks.block_count(self.size) - 1
+        return min(last_block, (max(self.positions.values()) + self.window - 1) // self.blocks.block_size)
+
+    def ahead_bytes(self):
+        """Contiguous cached bytes past the leading viewer's position."""
+        positions = list(self.positions.values())
+        if not positions:
+            return 0
+        lead = max(positions)
+        block_size = self.blocks.block_size
+        index = lead // block_size
+        while index <= self._window_end() and self.blocks.has_block(self.key, index):
+            index += 1
+        return max(0, min(index * block_size, self.size) - lead)
+
+    async def wait_for(self, index):
+        """Waits until the read-ahead has stored block `index`; False if the viewer should fetch it itself."""
+        if self.failed or self._task is None or self._task.done():
+            return False
+        if self.fetching is not None and index < self.fetching:
+            # Behind the running request (a viewer joined behind the others); quicker to fetch directly
+            return False
+        started = time.monotonic()
+        self.stalls += 1
+        try:
+            async with self._stored:
+                await asyncio.wait_for(
+                    self._stored.wait_for(lambda: self.failed or self.blocks.has_block(self.key, index)),
+                    READAHEAD_BLOCK_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.stall_seconds += time.monotonic() - started
+        return not self.failed
+
+    async def _notify(self):
+        async with self._stored:
+            self._stored.notify_all()
+
+    async def _next_missing(self):
+        """First uncached block between the trailing viewer and the window end, waiting when there is none."""
+        while True:
+            positions = list(self.positions.values())
+            index = min(positions) // self.blocks.block_size if positions else 0
+            while index <= self._window_end():
+                if not self.blocks.has_block(self.key, index):
+                    return index
+                index += 1
+            self._advanced.clear()
+            await self._advanced.wait()
+
+    async def _run(self):
+        failures = 0
+        while True:
+            index = await self._next_missing()
+            try:
+                await self._fetch_from(index)
+                failures = 0
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failures += 1
+                print(f"Read-ahead error for {self.key}: {str(e)}")
+                if failures >= READAHEAD_RETRIES:
+                    self.failed = True
+                    await self._notify()
+                    return
+                await asyncio.sleep(failures)
+
+    async def _fetch_from(self, index):
+        block_size = self.blocks.block_size
+        headers = {'Range': f'bytes={index * block_size}-'}
+        self.connections += 1
+        self.fetching = index
+        try:
+            await self._read_blocks(headers, index)
+        finally:
+            self.fetching = None
+
+    async def _wait_for_reader(self):
+        """Waits for a viewer to advance; False once none has read for idle_timeout seconds."""
+        self._advanced.clear()
+        if not self.idle_timeout:
+            await self._advanced.wait()
+            return True
+        remaining = self.last_read + self.idle_timeout - time.monotonic()
+        try:
+            await asyncio.wait_for(self._advanced.wait(), max(remaining, 0))
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _read_blocks(self, headers, index):
+        async with self.session.get(self.stream_url, headers=headers) as upstream:
+            if upstream.status != 206:
+                raise aiohttp.ClientPayloadError(f"Range request refused (HTTP {upstream.status})")
+            block = bytearray()
+            while True:
+                # Window full: stop reading until the viewer catches up
+                while index > self._window_end():
+                    if not await self._wait_for_reader():
+                        # Nobody is reading; _next_missing reopens the stream once a viewer resumes
+                        self.idle_closes += 1
+                        return
+                chunk = await upstream.content.read(READAHEAD_CHUNK_SIZE)
+                if not chunk:
+                    return
+                self.fetched_bytes += len(chunk)
+                block += chunk
+                while len(block) >= self.blocks.block_length(index, self.size):
+                    length = self.blocks.block_length(index, self.size)
+                    await asyncio.to_thread(self.blocks.store_block, self.key, index, bytes(block[:length]))
+                    del block[:length]
+                    index += 1
+                    self.fetching = index
+                    await self._notify()
+                    # Reached blocks cached earlier; rescan for the next gap instead
+                    if index >= self.blocks.block_count(self.size) or self.blocks.has_block(self.key, index):
+                        return
+
+    def status(self):
+        ahead = self.ahead_bytes()
+        return {
+            'stream': self.key,
+            'viewers': len(self.positions),
+            'positions': sorted(self.positions.values()),
+            'connections': self.connections,
+            'idle_closes': self.idle_closes,
+            'ahead_bytes': ahead,
+            'fill': round(ahead / self.window, 3) if self.window else None,
+            'fetched_bytes': self.fetched_bytes,
+            'stalls': self.stalls,
+            'stall_seconds': round(self.stall_seconds, 3),
+            'failed': self.failed
+        }
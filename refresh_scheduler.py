@@ -0,0 +1,195 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from cache_manager import (
+    cache_build_lock, get_cache_dir, get_catalog, get_catalog_age_hours,
+    process_and_cache_series_data, process_and_cache_movies_data
+)
+
+# Refresh a catalog once its last full fetch is older than this (0 disables the scheduler)
+REFRESH_MAX_AGE_HOURS = float(os.environ.get('REFRESH_MAX_AGE_HOURS', 24))
+# Off-peak window in local time, "HH:MM-HH:MM" (may wrap midnight); empty means any time
+REFRESH_WINDOW = os.environ.get('REFRESH_WINDOW', '02:00-06:00')
+REFRESH_CHECK_INTERVAL = int(os.environ.get('REFRESH_CHECK_INTERVAL', 600))
+# Pause between category requests so scheduled refreshes stay gentle on the provider
+REFRESH_CATEGORY_DELAY = float(os.environ.get('REFRESH_CATEGORY_DELAY', 0.5))
+REFRESH_NICENESS = 10
+REFRESH_HISTORY_FILE = 'refresh_history.json'
+REFRESH_HISTORY_SIZE = 50
+
+def parse_window(window):
+    """Parses "HH:MM-HH:MM" into (start, end) minutes after midnight, or None."""
+    if not window:
+        return None
+    start, end = window.split('-')
+    to_minutes = lambda hhmm: int(hhmm.split(':')[0]) * 60 + int(hhmm.split(':')[1])
+    return to_minutes(start.strip()), to_minutes(end.strip())
+
+def in_window(window, now=None):
+    if window is None:
+        return True
+    now = now or datetime.now()
+    minutes = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minutes < end
+    return minutes >= start or minutes < end
+
+def _catalog_ids(content_type):
+    catalog = get_catalog(content_type)
+    if not catalog:
+        return set()
+    return {catalog.ids[i] for i in range(len(catalog))}
+
+def _lower_thread_priority():
+    """Lowers this thread's CPU priority where the OS supports per-thread niceness."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), REFRESH_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+def load_history(partition=None):
+    partition = get_cache_dir() if partition is None else partition
+    try:
+        with open(os.path.join(partition, REFRESH_HISTORY_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def _append_history(partition, run):
+    history = (load_history(partition) + [run])[-REFRESH_HISTORY_SIZE:]
+    path = os.path.join(partition, REFRESH_HISTORY_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=4)
+    os.replace(temp_path, path)
+
+class RefreshScheduler:
+    """Daemon that rebuilds stale catalogs off-peak, one run at a time."""
+
+    def __init__(self, get_user, fetchers, max_age_hours=REFRESH_MAX_AGE_HOURS,
+                 window=REFRESH_WINDOW, check_interval=REFRESH_CHECK_INTERVAL,
+                 category_delay=REFRESH_CATEGORY_DELAY, cover_prefetcher=None, select_account=None):
+        # fetchers: {content_type: (get_categories_func, get_items_by_category_func)}
+        self.get_user = get_user
+        # Called before each check to load the saved account and select its cache partition;
+        # the scheduler may run before (or without) any request having done so
+        self.select_account = select_account
+        self.fetchers = fetchers
+        self.cover_prefetcher = cover_prefetcher
+        self.max_age_hours = max_age_hours
+        self.window_spec = window
+        self.window = parse_window(window)
+        self.check_interval = check_interval
+        self.category_delay = category_delay
+        self.running = None
+        self.last_check = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the daemon thread once; safe to call on every request."""
+        if self.max_age_hours <= 0 or self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='refresh-scheduler')
+                self._thread.daemon = True
+                self._thread.start()
+                print(f"Refresh scheduler started (max age {self.max_age_hours}h, window {self.window_spec or 'any time'})")
+
+    def due(self):
+        """Content types whose catalog is older than the staleness threshold."""
+        due = []
+        for content_type in self.fetchers:
+            age = get_catalog_age_hours(content_type)
+            if age is None or age >= self.max_age_hours:
+                due.append(content_type)
+        return due
+
+    def _loop(self):
+        _lower_thread_priority()
+        while True:
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"Scheduled refresh failed: {str(e)}")
+            time.sleep(self.check_interval)
+
+    def run_pending(self):
+        """Refreshes every stale catalog if inside the off-peak window; returns the run records."""
+        self.last_check = datetime.now().isoformat()
+        if self.select_account:
+            self.select_account()
+        user = self.get_user()
+        if not user or not in_window(self.window):
+            return []
+        runs = []
+        for content_type in self.due():
+            # Never overlap with another scheduled or manual build
+            if not cache_build_lock.acquire(blocking=False):
+                print("Skipping scheduled refresh: a cache build is already running")
+                break
+            try:
+                runs.append(self._refresh(content_type, user))
+            finally:
+                cache_build_lock.release()
+        return runs
+
+    def _paced(self, fetch, user):
+        account = (user.get('server'), user.get('username'))
+        def paced_fetch(category_id):
+            current = self.get_user() or {}
+            if (current.get('server'), current.get('username')) != account:
+                raise RuntimeError("Account switched during scheduled refresh")
+            time.sleep(self.category_delay)
+            return fetch(category_id)
+        return paced_fetch
+
+    def _refresh(self, content_type, user):
+        partition = get_cache_dir()
+        get_categories_func, get_items_func = self.fetchers[content_type]
+        build = process_and_cache_series_data if content_type == 'series' else process_and_cache_movies_data
+        self.running = {'content_type': content_type, 'started': datetime.now().isoformat()}
+        print(f"Scheduled refresh of {content_type} started")
+
+        before = _catalog_ids(content_type)
+        start_time = time.time()
+        run = {'content_type': content_type, 'started': self.running['started'], 'account': user.get('username')}
+        try:
+            run['success'] = bool(build(get_categories_func, self._paced(get_items_func, user),
+                                        cover_prefetcher=self.cover_prefetcher))
+        except Exception as e:
+            run['success'] = False
+            run['error'] = str(e)
+        finally:
+            self.running = None
+        run['duration_seconds'] = round(time.time() - start_time, 2)
+
+        if run['success']:
+            after = _catalog_ids(content_type)
+            run.update({
+                'items_before': len(before),
+                'items_after': len(after),
+                'added': len(after - before),
+                'removed': len(before - after)
+            })
+        _append_history(partition, run)
+        print(f"Scheduled refresh of {content_type} finished: {run}")
+        return run
+
+    def status(self):
+        return {
+            'enabled': self.max_age_hours > 0,
+            'max_age_hours': self.max_age_hours,
+            'window': self.window_spec or None,
+            'in_window': in_window(self.window),
+            'check_interval_seconds': self.check_interval,
+            'last_check': self.last_check,
+            'running': self.running,
+            'catalog_age_hours': {content_type: get_catalog_age_hours(content_type) for content_type in self.fetchers},
+            'history': load_history()[-10:]
+        }
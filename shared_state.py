@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from queue import Empty
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; it only runs the single-process development server
+    fcntl = None
+
+# SQLite database the worker processes share: progress events, jobs and settings
+STATE_DB = os.environ.get('STATE_DB') or os.path.join(os.environ.get('CACHE_DIR', ''), 'state.db')
+# Progress events nobody consumed within this many seconds are dropped
+EVENT_TTL = 600
+EVENT_POLL_INTERVAL = 0.1
+# Finished jobs kept for /api/jobs
+JOB_HISTORY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_channel ON events (channel, id);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    title TEXT,
+    status TEXT NOT NULL,
+    message TEXT,
+    pid INTEGER,
+    started REAL,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def _process_alive(pid):
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+class SharedState:
+    """Per-process handle on the SQLite database shared by every worker process."""
+
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self._local = threading.local()
+
+    def connect(self):
+        """Returns this thread's connection, creating the database on first use."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Autocommit; every statement below is atomic on its own
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key, default=None):
+        row = self.connect().execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        self.connect().execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
+                               (key, json.dumps(value)))
+
+    def setdefault(self, key, value):
+        """Stores value unless the key is already set; returns whichever value every worker now sees."""
+        self.connect().execute('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)',
+                               (key, json.dumps(value)))
+        return self.get(key)
+
+class SharedQueue:
+    """Queue-compatible FIFO of JSON messages that any worker process can put to or get from.
+
+    Each message is delivered once, like queue.Queue, so a download running in
+    one worker reports progress to an SSE stream served by another.
+    """
+
+    def __init__(self, state, channel):
+        self.state = state
+        self.channel = channel
+
+    def put(self, item):
+        now = time.time()
+        connection = self.state.connect()
+        connection.execute('DELETE FROM events WHERE created < ?', (now - EVENT_TTL,))
+        connection.execute('INSERT INTO events (channel, payload, created) VALUES (?, ?, ?)',
+                           (self.channel, json.dumps(item), now))
+
+    def get(self, timeout=None):
+        """Removes and returns the oldest message, raising queue.Empty after `timeout` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        connection = self.state.connect()
+        while True:
+            row = connection.execute(
+                'DELETE FROM events WHERE id = (SELECT id FROM events WHERE channel = ? ORDER BY id LIMIT 1) '
+                'RETURNING payload', (self.channel,)).fetchone()
+            if row:
+                return json.loads(row[0])
+            if deadline is not None and time.monotonic() >= deadline:
+                raise Empty
+            time.sleep(EVENT_POLL_INTERVAL)
+
+    def empty(self):
+        return self.state.connect().execute(
+            'SELECT 1 FROM events WHERE channel = ? LIMIT 1', (self.channel,)).fetchone() is None
+
+class JobRegistry:
+    """Downloads and cache builds running in any worker process."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def start(self, kind, title=None):
+        """Records a running job; returns its id."""
+        now = time.time()
+        cursor = self.state.connect().execute(
+            'INSERT INTO jobs (kind, title, status, pid, started, updated) VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, title, 'running', os.getpid(), now, now))
+        return cursor.lastrowid
+
+    def finish(self, job_id, status='complete', message=None):
+        connection = self.state.connect()
+        connection.execute('UPDATE jobs SET status = ?, message = ?, updated = ? WHERE id = ?',
+                           (status, message, time.time(), job_id))
+        connection.execute('DELETE FROM jobs WHERE id <= (SELECT MAX(id) FROM jobs) - ?', (JOB_HISTORY,))
+
+    def list(self):
+        """Jobs newest first; running jobs of a worker that has exited are reported as 'lost'."""
+        rows = self.state.connect().execute(
+            'SELECT id, kind, title, status, message, pid, started, updated FROM jobs ORDER BY id DESC').fetchall()
+        jobs = []
+        for job_id, kind, title, status, message, pid, started, updated in rows:
+            if status == 'running' and not _process_alive(pid):
+                status = 'lost'
+            jobs.append({'id': job_id, 'kind': kind, 'title': title, 'status': status, 'message': message,
+                         'pid': pid, 'started': started, 'updated': updated})
+        return jobs
+
+class ProcessLock:
+    """Non-blocking-friendly lock held across threads and worker processes (flock on a file).
+
+    Offers the acquire/release/locked subset of threading.Lock. Without fcntl
+    it is a plain thread lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            lock_file.close()
+            self._thread_lock.release()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def locked(self):
+        if self._thread_lock.locked():
+            return True
+        if fcntl is None:
+            return False
+        try:
+            with open(self.path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except OSError:
+            return True
+        return False
+
+# Held for life by the one worker that runs the scheduler, stream proxy and library scan
+_services_lock = ProcessLock(f"{STATE_DB}.services.lock")
+_owns_services = False
+
+def claim_services():
+    """True in the process that runs background services; other workers take over if it exits."""
+    global _owns_services
+    if not _owns_services:
+        _owns_services = _services_lock.acquire(blocking=False)
+    return _owns_services
+
+shared_state = SharedState()
+jobs = JobRegistry(shared_state)
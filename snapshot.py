@@ -0,0 +1,223 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+from catalog import CompactCatalog, TextColumn, InternedColumn, ActorsColumn
+
+# File layout:
+#   MAGIC
+#   records       u32 length + compact JSON, one per item, in cache order
+#   index         u64 offset of every record
+#   sections      ids and catalog columns (raw arrays, UTF-8 blobs, JSON tables)
+#   manifest      JSON describing where everything lives
+#   footer        u64 manifest offset, u64 manifest length, MAGIC
+MAGIC = b'IPTVSNP1'
+RECORD_LENGTH = struct.Struct('<I')
+FOOTER = struct.Struct('<QQ8s')
+
+def _encode(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class SnapshotWriter:
+    """Writes a snapshot record by record to a temp file; the caller moves it into place."""
+
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self._file = open(self.temp_path, 'wb')
+        self._file.write(MAGIC)
+        self._offsets = array('Q')
+        self._ids = []
+
+    def add(self, item_id, record):
+        data = _encode(record)
+        self._offsets.append(self._file.tell())
+        self._file.write(RECORD_LENGTH.pack(len(data)))
+        self._file.write(data)
+        self._ids.append(str(item_id))
+
+    def _write_section(self, data):
+        offset = self._file.tell()
+        self._file.write(data)
+        return [offset, len(data)]
+
+    def _write_array(self, values):
+        section = self._write_section(values.tobytes())
+        return section + [values.typecode]
+
+    def _write_text_column(self, column):
+        return {
+            'blob': self._write_section(column.blob.encode('utf-8')),
+            'offsets': self._write_array(column.offsets)
+        }
+
+    def _write_catalog(self, catalog):
+        columns = {}
+        for name, kind, _ in catalog.fields:
+            column = catalog.columns[name]
+            if kind == 'text':
+                columns[name] = self._write_text_column(column)
+            elif kind == 'interned':
+                columns[name] = {
+                    'table': self._write_section(_encode(column.table)),
+                    'codes': self._write_array(column.codes)
+                }
+            else:
+                columns[name] = {
+                    'names': self._write_section(_encode(column.names)),
+                    'ranges': self._write_array(column.ranges),
+                    'refs': self._write_array(column.refs),
+                    'search_text': self._write_text_column(column.search_text)
+                }
+        return {
+            'ids': self._write_text_column(catalog.ids),
+            'columns': columns,
+            'search_columns': {name: self._write_text_column(column)
+                               for name, column in catalog.search_columns.items()}
+        }
+
+    def finish(self, metadata, catalog=None):
+        """Writes the index, catalog and manifest, then fsyncs and closes the temp file."""
+        manifest = {
+            'metadata': metadata,
+            'count': len(self._ids),
+            'byteorder': sys.byteorder,
+            'index': self._write_array(self._offsets),
+            'ids': self._write_section(_encode(self._ids)),
+            'catalog': self._write_catalog(catalog) if catalog is not None else None
+        }
+        manifest_data = _encode(manifest)
+        manifest_offset = self._file.tell()
+        self._file.write(manifest_data)
+        self._file.write(FOOTER.pack(manifest_offset, len(manifest_data), MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def abort(self):
+        """Discards the partially written snapshot."""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+class SnapshotReader:
+    """Memory-mapped snapshot; records are decoded only when accessed."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < len(MAGIC) + FOOTER.size or self._mm[:len(MAGIC)] != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a catalog snapshot")
+        manifest_offset, manifest_length, magic = FOOTER.unpack_from(self._mm, len(self._mm) - FOOTER.size)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is truncated")
+        self.manifest = json.loads(self._mm[manifest_offset:manifest_offset + manifest_length])
+        self.metadata = self.manifest['metadata']
+        self._index = self._read_array(self.manifest['index'])
+        self._ids = None
+        self._positions = None
+
+    def _read_bytes(self, section):
+        offset, length = section[0], section[1]
+        return self._mm[offset:offset + length]
+
+    def _read_array(self, section):
+        values = array(section[2])
+        values.frombytes(self._read_bytes(section))
+        if self.manifest['byteorder'] != sys.byteorder:
+            values.byteswap()
+        return values
+
+    def _read_text_column(self, descriptor):
+        column = TextColumn()
+        column.blob = self._read_bytes(descriptor['blob']).decode('utf-8')
+        column.offsets = self._read_array(descriptor['offsets'])
+        return column
+
+    def __len__(self):
+        return self.manifest['count']
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = json.loads(self._read_bytes(self.manifest['ids']))
+        return self._ids
+
+    def record_at(self, index):
+        """Decodes the record stored at a position."""
+        offset = self._index[index]
+        (length,) = RECORD_LENGTH.unpack_from(self._mm, offset)
+        start = offset + RECORD_LENGTH.size
+        return json.loads(self._mm[start:start + length])
+
+    def get(self, item_id, default=None):
+        if self._positions is None:
+            self._positions = {item_id: i for i, item_id in enumerate(self.ids)}
+        index = self._positions.get(str(item_id))
+        return self.record_at(index) if index is not None else default
+
+    def load_catalog(self, content_type):
+        """Rebuilds the compact catalog from its stored columns, or None if absent."""
+        descriptor = self.manifest.get('catalog')
+        if not descriptor:
+            return None
+        catalog = CompactCatalog(content_type, self.metadata.get('last_fetch_date'))
+        if any(name not in descriptor['columns'] for name, _, _ in catalog.fields):
+            # Written with an older column layout; rebuild from the records instead
+            return None
+        catalog.ids = self._read_text_column(descriptor['ids'])
+        for name, kind, _ in catalog.fields:
+            parts = descriptor['columns'][name]
+            if kind == 'text':
+                column = self._read_text_column(parts)
+            elif kind == 'interned':
+                column = InternedColumn()
+                column.table = json.loads(self._read_bytes(parts['table']))
+                column.codes = self._read_array(parts['codes'])
+            else:
+                column = ActorsColumn()
+                column.names = json.loads(self._read_bytes(parts['names']))
+                column.ranges = self._read_array(parts['ranges'])
+                column.refs = self._read_array(parts['refs'])
+                column.search_text = self._read_text_column(parts['search_text'])
+            catalog.columns[name] = column
+        for name, parts in descriptor['search_columns'].items():
+            catalog.search_columns[name] = self._read_text_column(parts)
+        return catalog
+
+    def close(self):
+        self._mm.close()
+
+class SnapshotMapping(Mapping):
+    """Read-only {item_id: record} view over a snapshot, decoding lazily."""
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def __getitem__(self, item_id):
+        record = self._reader.get(item_id)
+        if record is None:
+            raise KeyError(item_id)
+        return record
+
+    def __iter__(self):
+        return iter(self._reader.ids)
+
+    def __len__(self):
+        return len(self._reader)
+
+    def items(self):
+        for index, item_id in enumerate(self._reader.ids):
+            yield item_id, self._reader.record_at(index)
+
+    def values(self):
+        for index in range(len(self._reader)):
+            yield self._reader.record_at(index)
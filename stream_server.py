@@ -0,0 +1,316 @@
+import asyncio
+import hmac
+import os
+import threading
+from urllib.parse import quote
+
+import aiohttp
+from aiohttp import web
+
+from block_cache import block_cache, stream_cache_key, parse_range, resolve_range
+from readahead import ReadAhead, STREAM_READAHEAD_BYTES
+
+# Opt-in: serve /stream_proxy from an asyncio server on this port (0 keeps the Flask route)
+STREAM_PROXY_PORT = int(os.environ.get('STREAM_PROXY_PORT') or 0)
+STREAM_PROXY_HOST = os.environ.get('STREAM_PROXY_HOST', '0.0.0.0')
+# Base URL browsers use to reach the proxy when it sits behind a reverse proxy
+# (default: the page's host on STREAM_PROXY_PORT)
+STREAM_PROXY_PUBLIC_URL = os.environ.get('STREAM_PROXY_PUBLIC_URL', '').rstrip('/')
+STREAM_MAX_UPSTREAM = int(os.environ.get('STREAM_MAX_UPSTREAM', 256))
+STREAM_BUFFER_SIZE = 256 * 1024
+STREAM_CONNECT_TIMEOUT = 10
+# An upstream that sends nothing for this long is treated as dead
+STREAM_READ_TIMEOUT = 60
+
+PASSTHROUGH_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Last-Modified', 'ETag')
+
+def content_range_size(header):
+    """Total size from a 'bytes a-b/total' Content-Range header, or None if unknown."""
+    if not header or '/' not in header:
+        return None
+    total = header.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+class StreamProxyServer:
+    """aiohttp server for /stream_proxy, run on its own event loop thread beside Flask.
+
+    Each viewer costs a coroutine instead of a worker thread, and upstream
+    connections come from a dedicated pool instead of the shared requests session.
+    """
+
+    def __init__(self, port=STREAM_PROXY_PORT, host=STREAM_PROXY_HOST, headers=None, blocks=block_cache,
+                 signer=None):
+        self.port = port
+        self.host = host
+        self.headers = dict(headers or {})
+        self.blocks = blocks
+        # signer(url) -> signature; only URLs signed by the app are proxied (none without a signer)
+        self.signer = signer
+        self.readahead_bytes = STREAM_READAHEAD_BYTES
+        # {stream key: [ReadAhead]}; more than one only when viewers are far apart
+        self.readaheads = {}
+        self._uncacheable = set()
+        self.running = False
+        self.loop = None
+        self.session = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {'streams': 0, 'active': 0, 'bytes': 0, 'cached_bytes': 0, 'upstream_bytes': 0,
+                      'readahead_bytes': 0, 'readahead_connections': 0, 'readahead_idle_closes': 0,
+                      'shared_viewers': 0, 'stalls': 0, 'stall_seconds': 0.0, 'disconnects': 0, 'errors': 0}
+
+    def start(self):
+        """Starts the server thread once; returns True while the server is running."""
+        if not self.port:
+            return False
+        with self._start_lock:
+            if self._thread is None:
+                started = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(started,), name='stream-proxy')
+                self._thread.daemon = True
+                self._thread.start()
+                started.wait(10)
+        return self.running
+
+    def _run(self, started):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+            self.running = True
+            print(f"Async stream proxy listening on {self.host}:{self.port}")
+        except Exception as e:
+            print(f"Async stream proxy failed to start, using the Flask route: {str(e)}")
+            return
+        finally:
+            started.set()
+        self.loop.run_forever()
+
+    async def _serve(self):
+        connector = aiohttp.TCPConnector(limit=STREAM_MAX_UPSTREAM, limit_per_host=0)
+        timeout = aiohttp.ClientTimeout(total=None, connect=STREAM_CONNECT_TIMEOUT, sock_read=STREAM_READ_TIMEOUT)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers,
+                                             auto_decompress=False, read_bufsize=STREAM_BUFFER_SIZE)
+        proxy_app = web.Application()
+        proxy_app.router.add_get('/stream_proxy', self.handle_stream)
+        runner = web.AppRunner(proxy_app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+
+    def public_url(self, stream_url, scheme, host):
+        """URL of the async proxy for stream_url, as seen from the page at scheme://host."""
+        base = STREAM_PROXY_PUBLIC_URL
+        if not base:
+            hostname = host.rsplit(':', 1)[0] if not host.endswith(']') else host
+            base = f"{scheme}://{hostname}:{self.port}"
+        return f"{base}/stream_proxy?url={quote(stream_url, safe='')}&sig={self.signer(stream_url)}"
+
+    async def handle_stream(self, request):
+        stream_url = request.query.get('url')
+        if not stream_url:
+            return web.Response(status=400, text="No stream URL provided")
+        if self.signer is None or not hmac.compare_digest(request.query.get('sig', ''), self.signer(stream_url)):
+            return web.Response(status=403, text="Invalid stream signature")
+        self.stats['streams'] += 1
+        try:
+            key = stream_cache_key(stream_url) if self.blocks.enabled else None
+            # Multi-range requests are rare for video; they go straight upstream
+            if key is not None and ('Range' not in request.headers or parse_range(request.headers['Range'])):
+                meta = await self._stream_meta(key, stream_url)
+                if meta is not None:
+                    return await self._serve_blocks(request, stream_url, key, meta)
+            return await self._passthrough(request, stream_url)
+        except ConnectionError:
+            # The viewer closed the stream (seek, pause or tab closed)
+            self.stats['disconnects'] += 1
+            return request.get('proxy_response') or web.Response()
+        except asyncio.CancelledError:
+            self.stats['disconnects'] += 1
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.stats['errors'] += 1
+            print(f"Streaming proxy error: {str(e)}")
+            response = request.get('proxy_response')
+            if response is not None and response.prepared:
+                raise
+            return web.Response(status=502, text=f"Streaming error: {str(e)}")
+
+    async def _passthrough(self, request, stream_url):
+        headers = {}
+        if 'Range' in request.headers:
+            headers['Range'] = request.headers['Range']
+        # Leaving the block returns (or closes) the upstream connection, including on disconnect
+        async with self.session.get(stream_url, headers=headers) as upstream:
+            response = request['proxy_response'] = web.StreamResponse(status=upstream.status)
+            for name in PASSTHROUGH_HEADERS:
+                if name in upstream.headers:
+                    response.headers[name] = upstream.headers[name]
+            response.headers.setdefault('Content-Type', 'video/mp4')
+            response.headers['Accept-Ranges'] = 'bytes'
+            response.headers['Cache-Control'] = 'no-cache'
+            await response.prepare(request)
+
+            self.stats['active'] += 1
+            try:
+                async for chunk in upstream.content.iter_chunked(STREAM_BUFFER_SIZE):
+                    # write() waits while the client's socket buffer is full, so a
+                    # slow viewer slows its upstream read instead of growing memory
+                    await response.write(chunk)
+                    self.stats['bytes'] += len(chunk)
+                    self.stats['upstream_bytes'] += len(chunk)
+            finally:
+                self.stats['active'] -= 1
+            await response.write_eof()
+            return response
+
+    async def _stream_meta(self, key, stream_url):
+        """Returns the block cache's {size, content_type} for a stream, probing upstream the first time."""
+        meta = await asyncio.to_thread(self.blocks.meta, key)
+        if meta is not None and meta.get('block_size') == self.blocks.block_size:
+            return meta
+        if key in self._uncacheable:
+            return None
+        async with self.session.get(stream_url, headers={'Range': 'bytes=0-0'}) as probe:
+            size = content_range_size(probe.headers.get('Content-Range')) if probe.status == 206 else None
+            content_type = probe.headers.get('Content-Type', 'video/mp4')
+        if size is None:
+            # No byte-range support upstream, so blocks could never be filled
+            self._uncacheable.add(key)
+            return None
+        return await asyncio.to_thread(self.blocks.set_meta, key, size, content_type)
+
+    async def _serve_blocks(self, request, stream_url, key, meta):
+        """Answers a request from cached blocks, fetching only the missing ones."""
+        size = meta['size']
+        block_size = self.blocks.block_size
+        if 'Range' in request.headers:
+            byte_range = resolve_range(parse_range(request.headers['Range']), size)
+            if byte_range is None:
+                return web.Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+            start, end = byte_range
+            response = web.StreamResponse(status=206)
+            response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            start, end = 0, size - 1
+            response = web.StreamResponse(status=200)
+        request['proxy_response'] = response
+        response.headers['Content-Type'] = meta.get('content_type') or 'video/mp4'
+        response.headers['Content-Length'] = str(end - start + 1)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = 'no-cache'
+        await response.prepare(request)
+
+        viewer = object()
+        # STREAM_READAHEAD_BYTES=0 serves each missing block from its own request, without a read-ahead
+        readahead = None
+        if self.readahead_bytes:
+            readahead = await self._join_readahead(viewer, stream_url, key, size, start)
+        self.stats['active'] += 1
+        try:
+            position = start
+            while position <= end:
+                index = position // block_size
+                data = await asyncio.to_thread(self.blocks.read_block, key, index)
+                if data is None and readahead is not None:
+                    # Viewers that drifted apart (one paused, say) stop sharing a connection here
+                    readahead = await self._join_readahead(viewer, stream_url, key, size, position, readahead)
+                    if await readahead.wait_for(index):
+                        data = await asyncio.to_thread(self.blocks.read_block, key, index)
+                if data is not None and len(data) == self.blocks.block_length(index, size):
+                    piece = data[position - index * block_size:end + 1 - index * block_size]
+                    await response.write(piece)
+                    position += len(piece)
+                    self.stats['bytes'] += len(piece)
+                    self.stats['cached_bytes'] += len(piece)
+                    if readahead is not None:
+                        readahead.advance(viewer, position)
+                    continue
+                # The read-ahead gave up: fetch the gap in line with the response
+                filled = await self._fill_blocks(response, stream_url, key, size, index, position, end)
+                if filled == position:
+                    raise aiohttp.ClientPayloadError(f"Upstream sent no data at byte {position}")
+                position = filled
+        finally:
+            self.stats['active'] -= 1
+            if readahead is not None:
+                await self._leave_readahead(viewer, key, readahead)
+        await response.write_eof()
+        return response
+
+    async def _join_readahead(self, viewer, stream_url, key, size, position, current=None):
+        """Attaches a viewer to a read-ahead of its stream near `position`, starting one if none is.
+
+        Keeps the viewer on `current` while it is still close to the others there.
+        """
+        if current is not None:
+            if current.accepts(position, exclude=viewer):
+                return current
+            await self._leave_readahead(viewer, key, current)
+        for readahead in self.readaheads.get(key, []):
+            if not readahead.failed and readahead.accepts(position):
+                self.stats['shared_viewers'] += 1
+                break
+        else:
+            readahead = ReadAhead(self.session, self.blocks, stream_url, key, size, self.readahead_bytes)
+            self.readaheads.setdefault(key, []).append(readahead)
+        readahead.attach(viewer, position)
+        return readahead
+
+    async def _leave_readahead(self, viewer, key, readahead):
+        if not readahead.detach(viewer):
+            return
+        readaheads = self.readaheads.get(key, [])
+        if readahead in readaheads:
+            readaheads.remove(readahead)
+        if not readaheads:
+            self.readaheads.pop(key, None)
+        await readahead.stop()
+        self.stats['readahead_bytes'] += readahead.fetched_bytes
+        self.stats['upstream_bytes'] += readahead.fetched_bytes
+        self.stats['readahead_connections'] += readahead.connections
+        self.stats['readahead_idle_closes'] += readahead.idle_closes
+        self.stats['stalls'] += readahead.stalls
+        self.stats['stall_seconds'] += readahead.stall_seconds
+
+    async def _fill_blocks(self, response, stream_url, key, size, index, position, end):
+        """Streams blocks from `index` on to the client while storing them.
+
+        Stops at `end` or at the next block that is already cached, and returns
+        the client position reached.
+        """
+        block_size = self.blocks.block_size
+        last = end // block_size
+        upstream_end = min((last + 1) * block_size, size) - 1
+        headers = {'Range': f'bytes={index * block_size}-{upstream_end}'}
+        async with self.session.get(stream_url, headers=headers) as upstream:
+            if upstream.status != 206 or content_range_size(upstream.headers.get('Content-Range')) != size:
+                # The file changed (or lost range support) since its blocks were cached
+                await asyncio.to_thread(self.blocks.invalidate, key)
+                raise aiohttp.ClientPayloadError(f"Stream changed upstream (HTTP {upstream.status})")
+            offset = index * block_size
+            block = bytearray()
+            async for chunk in upstream.content.iter_chunked(STREAM_BUFFER_SIZE):
+                chunk_start = offset
+                offset += len(chunk)
+                self.stats['upstream_bytes'] += len(chunk)
+                low, high = max(position, chunk_start), min(end + 1, offset)
+                if low < high:
+                    await response.write(chunk[low - chunk_start:high - chunk_start])
+                    self.stats['bytes'] += high - low
+                    position = high
+                block += chunk
+                while index <= last and len(block) >= self.blocks.block_length(index, size):
+                    length = self.blocks.block_length(index, size)
+                    await asyncio.to_thread(self.blocks.store_block, key, index, bytes(block[:length]))
+                    del block[:length]
+                    index += 1
+                    if position > end or self.blocks.has_block(key, index):
+                        return position
+        return position
+
+    def status(self):
+        return dict(self.stats, running=self.running, port=self.port, max_upstream=STREAM_MAX_UPSTREAM,
+                    buffer_size=STREAM_BUFFER_SIZE, block_cache=self.blocks.status(),
+                    stall_seconds=round(self.stats['stall_seconds'], 3), readahead_window=self.readahead_bytes,
+                    readaheads=[readahead.status() for readaheads in list(self.readaheads.values())
+                                for readahead in list(readaheads)])
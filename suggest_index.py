@@ -0,0 +1,217 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+from cache_manager import get_catalog, get_cache_version, get_cache_dir
+
+SUGGEST_LIMIT = 10
+SUGGEST_LRU_SIZE = 256
+# Prefixes up to this length match too many keys to rank per request,
+# so their top suggestions are computed once when the index is built.
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+def normalize_text(text):
+    """Lowercases, strips accents and collapses punctuation to single spaces."""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+def parse_rating(value):
+    """Converts a provider rating ("7.5", 7, "", None) to a float."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+class SuggestIndex:
+    """Prefix index over titles and actor names backed by a sorted key array."""
+
+    def __init__(self, entries, limit=SUGGEST_LIMIT, lru_size=SUGGEST_LRU_SIZE):
+        # entries: iterable of (label, kind, item_id, content_type, weight)
+        self.limit = limit
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.suggestions = []
+        keyed = []
+        for label, kind, item_id, content_type, weight in entries:
+            normalized = normalize_text(label)
+            if not normalized:
+                continue
+            suggestion_index = len(self.suggestions)
+            self.suggestions.append({
+                'label': label,
+                'type': kind,
+                'id': item_id,
+                'content_type': content_type,
+                'rating': weight
+            })
+            # Index the full label plus every word start so "wars" finds "Star Wars"
+            words = normalized.split(' ')
+            for i in range(len(words)):
+                keyed.append((' '.join(words[i:]), suggestion_index))
+
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.targets = [target for _, target in keyed]
+
+        self._precomputed = {}
+        self._precompute_short_prefixes()
+
+    def _rank(self, candidates):
+        """Returns the top suggestions among candidate indexes, best rated first."""
+        best = heapq.nlargest(self.limit, set(candidates),
+                              key=lambda i: (self.suggestions[i]['rating'], -i))
+        return [self.suggestions[i] for i in best]
+
+    def _precompute_short_prefixes(self):
+        buckets = {}
+        for key, target in zip(self.keys, self.targets):
+            for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+                if len(key) >= length:
+                    buckets.setdefault(key[:length], set()).add(target)
+        for prefix, candidates in buckets.items():
+            self._precomputed[prefix] = self._rank(candidates)
+
+    def suggest(self, query):
+        """Returns up to `limit` suggestions whose key starts with the query."""
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+
+        with self._lock:
+            cached = self._lru.get(prefix)
+            if cached is not None:
+                self._lru.move_to_end(prefix)
+                return cached
+
+        if prefix in self._precomputed:
+            results = self._precomputed[prefix]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '\uffff', start)
+            results = self._rank(self.targets[start:end])
+
+        with self._lock:
+            self._lru[prefix] = results
+            if len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+        return results
+
+def build_entries(series_catalog, movies_catalog):
+    """Yields index entries for series, movies and the actors appearing in them."""
+    actor_weights = {}
+
+    for content_type, catalog, name_key in (
+            ('series', series_catalog, 'series_name'),
+            ('movie', movies_catalog, 'movie_name')):
+        if not catalog:
+            continue
+        names = catalog.columns[name_key]
+        ratings = catalog.columns['rating']
+        actors = catalog.columns['actors']
+        for index in range(len(catalog)):
+            rating = parse_rating(ratings[index])
+            yield names[index], content_type, catalog.ids[index], content_type, rating
+            for actor in actors[index]:
+                actor = actor.strip()
+                if actor:
+                    actor_weights[actor] = max(actor_weights.get(actor, 0.0), rating)
+
+    for actor, weight in actor_weights.items():
+        yield actor, 'actor', None, None, weight
+
+# {cache partition: (version, index)}
+_indexes = {}
+# Partitions whose index is being built in the background
+_building = set()
+_index_lock = threading.Lock()
+
+def _build_index(partition, version, series_catalog, movies_catalog):
+    try:
+        index = SuggestIndex(build_entries(series_catalog, movies_catalog))
+    except Exception as e:
+        print(f"Error building suggestion index: {str(e)}")
+        index = None
+    with _index_lock:
+        _building.discard(partition)
+        if index is not None:
+            _indexes[partition] = (version, index)
+
+def get_suggest_index():
+    """Returns the active partition's suggestion index, or None before its first build finishes.
+
+    Builds run in a background thread whenever either cache file changes;
+    the previous index keeps answering until the new one is ready.
+    """
+    partition = get_cache_dir()
+    version = (get_cache_version('series'), get_cache_version('movies'))
+    with _index_lock:
+        loaded = _indexes.get(partition)
+        stale = (loaded is None or loaded[0] != version) and partition not in _building
+        if stale:
+            _building.add(partition)
+    if stale:
+        thread = threading.Thread(target=_build_index, name='suggest-index',
+                                  args=(partition, version, get_catalog('series'), get_catalog('movies')))
+        thread.daemon = True
+        thread.start()
+    return loaded[1] if loaded else None
+
+def get_suggestions(query):
+    """Returns typeahead suggestions for the query from the cached catalog (none while it is built)."""
+    index = get_suggest_index()
+    return index.suggest(query) if index else []
+
+if __name__ == '__main__':
+    # Microbenchmark: build a synthetic catalog and check lookups stay under budget.
+    import random
+    import string
+
+    from catalog import CompactCatalog
+
+    LATENCY_BUDGET_MS = 10.0
+    random.seed(42)
+
+    def random_words(count):
+        return ' '.join(''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9)))
+                        for _ in range(count))
+
+    actors = [random_words(2).title() for _ in range(20000)]
+    series = {str(i): {'series_name': random_words(random.randint(1, 4)).title(),
+                       'actors': random.sample(actors, 4),
+                       'rating': str(round(random.uniform(0, 10), 1))}
+              for i in range(20000)}
+    movies = {str(i): {'movie_name': random_words(random.randint(1, 4)).title(),
+                       'actors': random.sample(actors, 4),
+                       'rating': str(round(random.uniform(0, 10), 1))}
+              for i in range(80000)}
+
+    build_start = time.perf_counter()
+    index = SuggestIndex(build_entries(CompactCatalog.from_cache('series', {'series': series}),
+                                       CompactCatalog.from_cache('movies', {'movies': movies})),
+                         lru_size=0)
+    print(f"Built index: {len(index.keys)} keys in {time.perf_counter() - build_start:.2f}s")
+
+    queries = [random_words(1)[:random.randint(1, 6)] for _ in range(2000)]
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.suggest(query)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99)]
+    print(f"Lookups: p50={p50:.3f}ms p99={p99:.3f}ms max={timings[-1]:.3f}ms (budget {LATENCY_BUDGET_MS}ms)")
+    if p99 > LATENCY_BUDGET_MS:
+        raise SystemExit(f"p99 latency {p99:.3f}ms exceeds budget of {LATENCY_BUDGET_MS}ms")
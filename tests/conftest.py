@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+
+# Keep shared state and caches out of the working tree while the modules are imported
+_data_dir = tempfile.mkdtemp(prefix='iptv-tests-')
+os.environ.setdefault('CACHE_DIR', _data_dir)
+os.environ.setdefault('STATE_DB', os.path.join(_data_dir, 'state.db'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import cache_manager
+from cache_manager import build_movie_record, save_cached_data
+
+@pytest.fixture
+def partition(tmp_path, monkeypatch):
+    """An empty cache partition selected for the test."""
+    monkeypatch.setattr(cache_manager, '_partition_dir', str(tmp_path))
+    return tmp_path
+
+def sample_movies(count=200):
+    movies = {}
+    for index in range(count):
+        movie_id, record = build_movie_record({
+            'stream_id': 1000 + index,
+            'name': f"Movie {index}",
+            'genre': ('Drama', 'Comedy', 'Action')[index % 3],
+            'rating': str(index % 10),
+            'year': str(1990 + index % 30),
+            'stream_icon': f"http://img.example/{index}.jpg",
+            'cast': 'A Person, B Person'
+        }, str(index % 5))
+        movies[movie_id] = record
+    return {'last_fetch_date': '2026-01-01T00:00:00', 'movies': movies}
+
+@pytest.fixture
+def movies_cache(partition):
+    save_cached_data(sample_movies(), 'movies')
+    return partition
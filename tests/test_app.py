@@ -0,0 +1,186 @@
+import pytest
+
+import cache_manager
+
+# app.py needs the user's config.py, which is not part of the repository
+app_module = pytest.importorskip('app', reason='config.py is required to import app')
+
+@pytest.fixture
+def client(partition, monkeypatch):
+    """Test client bound to the temporary partition, with background services off."""
+    monkeypatch.setattr(app_module, 'set_cache_partition', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'start_background_services', lambda: False)
+    return app_module.app.test_client()
+
+def test_movie_search_without_a_catalog(client):
+    response = client.get('/search?content_type=movies')
+    assert response.status_code == 200
+
+def test_movie_search_shows_facets(client, movies_cache):
+    response = client.get('/search?content_type=movies&q=movie')
+    assert response.status_code == 200
+    assert b'Drama (' in response.data
+
+class FailingGuard:
+    def __init__(self, error):
+        self.error = error
+
+    def get(self, *args, **kwargs):
+        raise self.error
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Makes player_api calls raise the given error."""
+    monkeypatch.setattr(app_module, 'get_current_user',
+                        lambda: {'server': 'http://provider.example/', 'username': 'u', 'password': 'p'})
+    def fail_with(error):
+        monkeypatch.setattr(app_module, 'guard_for', lambda user: FailingGuard(error))
+    return fail_with
+
+def test_category_items_fall_back_to_cache_on_upstream_errors(movies_cache, upstream):
+    upstream(app_module.requests.exceptions.ConnectionError('refused'))
+    items = app_module.get_movies_by_category('0')
+    assert len(items) == 40
+
+def test_category_items_do_not_hide_programming_errors(movies_cache, upstream):
+    upstream(KeyError('stream_id'))
+    with pytest.raises(KeyError):
+        app_module.get_movies_by_category('0')
+
+def test_item_not_modified_is_answered_before_fetching(client, movies_cache, monkeypatch):
+    fetches = []
+    monkeypatch.setattr(app_module, 'fetch_movie_info', lambda vod_id: fetches.append(vod_id))
+    response = client.get('/api/v1/movies/1000')
+    assert response.status_code == 200 and fetches == ['1000']
+    response = client.get('/api/v1/movies/1000', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert fetches == ['1000']
+
+def test_image_proxy_only_serves_signed_cover_urls(client, monkeypatch):
+    monkeypatch.setattr(app_module.image_cache, 'get', lambda url, width: (b'\xff\xd8\xff', 'image/jpeg'))
+    with app_module.app.test_request_context():
+        signed = app_module.cover_src('http://img.example/1.jpg')
+    assert client.get(signed).status_code == 200
+    assert client.get('/img?url=http://169.254.169.254/latest/&w=150').status_code == 403
+    assert client.get(signed.replace('1.jpg', '2.jpg')).status_code == 403
+
+def test_cache_data_busy_leaves_the_progress_stream_alone(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'sse_queue', app_module.SharedQueue(app_module.shared_state, 'test-progress'))
+    assert app_module.cache_build_lock.acquire(blocking=False)
+    try:
+        response = client.get('/cache_data?cache_type=movies')
+    finally:
+        app_module.cache_build_lock.release()
+    assert response.status_code == 409
+    assert app_module.sse_queue.empty()
+
+def test_cache_build_aborts_instead_of_rebuilding_from_the_cache(movies_cache, upstream):
+    upstream(app_module.requests.exceptions.ConnectionError('refused'))
+    age_before = app_module.get_catalog_age_hours('movies')
+    with pytest.raises(app_module.UpstreamUnavailable):
+        app_module.process_and_cache_movies_data(app_module.from_upstream(app_module.fetch_movie_categories),
+                                                 app_module.from_upstream(app_module.fetch_movies_list))
+    assert app_module.get_catalog_age_hours('movies') == pytest.approx(age_before, abs=0.01)
+
+def test_cache_build_aborts_on_a_single_failed_category(movies_cache, upstream):
+    upstream(app_module.requests.exceptions.HTTPError('502 Bad Gateway'))
+    categories = lambda: [{'category_id': '0', 'category_name': 'Zero'}]
+    with pytest.raises(app_module.UpstreamUnavailable):
+        app_module.process_and_cache_movies_data(categories, app_module.from_upstream(app_module.fetch_movies_list))
+    assert len(app_module.get_catalog('movies')) == 200
+
+def test_cache_build_fetches_covers_after_releasing_the_lock(client, monkeypatch):
+    import time
+    monkeypatch.setattr(app_module, 'sse_queue', app_module.SharedQueue(app_module.shared_state, 'test-build'))
+
+    def build(get_categories, get_items, progress_callback=None, cover_prefetcher=None):
+        progress_callback(100, 'Movies caching completed!', 'complete', {})
+        return True
+
+    class Prefetcher:
+        enabled = True
+        lock_held = None
+
+        def prefetch(self, urls, progress=None, wait=False):
+            self.lock_held = app_module.cache_build_lock.locked()
+            progress(len(urls), len(urls))
+            return len(urls)
+
+    prefetcher = Prefetcher()
+    monkeypatch.setattr(app_module, 'process_and_cache_movies_data', build)
+    monkeypatch.setattr(app_module, 'catalog_cover_urls', lambda content_type: ['http://img.example/1.jpg'])
+    monkeypatch.setattr(app_module, 'cover_prefetcher', prefetcher)
+    monkeypatch.setattr(app_module, 'get_suggest_index', lambda: None)
+
+    assert client.get('/cache_data?cache_type=movies').status_code == 200
+    updates = []
+    deadline = time.monotonic() + 5
+    while (not updates or updates[-1] is not None) and time.monotonic() < deadline:
+        updates.append(app_module.sse_queue.get(timeout=5))
+    assert prefetcher.lock_held is False
+    statuses = [update['status'] for update in updates[:-1]]
+    assert statuses == ['in_progress', 'complete']
+    assert updates[0]['covers_done'] == 1
+
+def page_through(client, url, cursor_param):
+    """Follows next_cursor until it runs out; returns the pages' JSON."""
+    pages = [client.get(url).get_json()]
+    while pages[-1]['next_cursor']:
+        pages.append(client.get(f"{url}&{cursor_param}={pages[-1]['next_cursor']}").get_json())
+        assert len(pages) < 100
+    return pages
+
+def test_search_cursor_round_trip(client, movies_cache):
+    pages = page_through(client, '/api/v1/search?q=movie&type=movies&limit=30', 'cursor')
+    ids = [result['movie_id'] for page in pages for result in page['results']]
+    assert len(pages) == 7 and len(pages[-1]['results']) == 20
+    assert len(ids) == len(set(ids)) == pages[0]['total'] == 200
+
+def test_search_cursor_encoding_round_trips():
+    key = (3, 7.5, -1, -42)
+    assert cache_manager._decode_search_cursor(cache_manager._encode_search_cursor(key)) == key
+
+@pytest.mark.parametrize('cursor', ['', 'garbage', '1:2:3', '1:x:0:0', '1:2:3:4:5', None])
+def test_invalid_search_cursors_are_ignored(cursor):
+    assert cache_manager._decode_search_cursor(cursor) is None
+
+def test_search_with_a_tampered_cursor_starts_over(client, movies_cache):
+    first = client.get('/api/v1/search?q=movie&type=movies&limit=30').get_json()
+    for cursor in ('garbage', '1:x:0:0', '%00'):
+        response = client.get(f'/api/v1/search?q=movie&type=movies&limit=30&cursor={cursor}')
+        assert response.status_code == 200
+        assert response.get_json()['results'] == first['results']
+
+def test_listing_cursor_pages_end_without_a_next_cursor():
+    keys = [(index, index) for index in range(25)]
+    start, cursor = cache_manager.paginate_listing(keys, 10)
+    assert (start, cache_manager.decode_listing_cursor(cursor)) == (0, (9, 9))
+    start, cursor = cache_manager.paginate_listing(keys, 10, cursor=cursor)
+    start, cursor = cache_manager.paginate_listing(keys, 10, cursor=cursor)
+    assert (start, cursor) == (20, None)
+    assert cache_manager.paginate_listing(keys, 5, page=5) == (20, None)
+
+@pytest.mark.parametrize('cursor', ['garbage', '!!!', 'WyJhIiwgMV0', 'bnVsbA'])
+def test_listing_ignores_invalid_cursors(cursor):
+    keys = [(index, index) for index in range(25)]
+    assert cache_manager.paginate_listing(keys, 10, cursor=cursor)[0] == 0
+
+def test_category_items_cursor_pages_through_the_category(client, movies_cache, monkeypatch):
+    monkeypatch.setattr(cache_manager, 'LISTING_MAX_AGE_HOURS', float('inf'))
+    pages = page_through(client, '/api/v1/categories/0/items?type=movies&limit=15', 'after')
+    ids = [item['stream_id'] for page in pages for item in page['items']]
+    assert [len(page['items']) for page in pages] == [15, 15, 10]
+    assert len(set(ids)) == 40
+
+def test_category_page_hides_next_on_the_last_page(client, movies_cache, monkeypatch):
+    monkeypatch.setattr(cache_manager, 'LISTING_MAX_AGE_HOURS', float('inf'))
+    assert b'>Next</a>' in client.get('/movies/0?per_page=20').data
+    assert b'>Next</a>' not in client.get('/movies/0/page/2?per_page=20').data
+
+def test_stream_proxy_only_serves_signed_urls(client, monkeypatch):
+    monkeypatch.setattr(app_module.stream_server, 'port', 0)
+    with app_module.app.test_request_context():
+        signed = app_module.proxied_stream('http://provider.example/movie/u/p/7.mp4')
+    assert 'sig=' in signed
+    assert client.get('/stream_proxy?url=http://169.254.169.254/latest/').status_code == 403
+    assert client.get(signed.replace('7.mp4', '8.mp4')).status_code == 403
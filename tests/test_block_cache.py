@@ -0,0 +1,33 @@
+import pytest
+
+from block_cache import parse_range, resolve_range
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, None)),
+    ('bytes=-500', (None, 500)),
+    (' bytes=5-5 ', (5, 5)),
+    (None, None),
+    ('', None),
+    ('bytes=-', None),
+    ('bytes=9-3', None),
+    ('bytes=0-1,5-9', None),
+    ('items=0-9', None),
+    ('bytes=a-b', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header) == expected
+
+@pytest.mark.parametrize('byte_range, expected', [
+    ((0, 99), (0, 99)),
+    ((100, None), (100, 999)),
+    ((None, 200), (800, 999)),
+    ((None, 5000), (0, 999)),
+    ((900, 5000), (900, 999)),
+    ((999, None), (999, 999)),
+    ((1000, None), None),
+    ((1500, 2000), None),
+    ((None, 0), None),
+])
+def test_resolve_range_for_a_1000_byte_file(byte_range, expected):
+    assert resolve_range(byte_range, 1000) == expected
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import cache_manager
+from cache_manager import get_cached_json, get_catalog, refresh_cached_category, save_cached_data
+from prefetch import CoverPrefetcher
+from conftest import sample_movies
+
+def test_refresh_cached_category_replaces_only_that_category(movies_cache):
+    before = get_cached_json('movies')['movies']
+    untouched = {item_id for item_id, record in before.items() if record['category_ID'] != '0'}
+    fresh = [{'stream_id': 1000, 'name': 'Renamed'}, {'stream_id': 5000, 'name': 'New arrival'}]
+
+    delta = refresh_cached_category('movies', '0', 'Zero', lambda category_id: fresh)
+
+    after = get_cached_json('movies')['movies']
+    assert delta == {'added': 1, 'removed': 39, 'kept': 1}
+    assert after['1000']['movie_name'] == 'Renamed'
+    assert after['5000']['category_ID'] == '0'
+    assert untouched <= set(after)
+    assert len(get_catalog('movies')) == len(untouched) + 2
+
+def test_refresh_cached_category_without_a_cache(partition):
+    assert refresh_cached_category('movies', '0', None, lambda category_id: []) is None
+
+def test_catalog_cover_urls_are_distinct(movies_cache):
+    urls = cache_manager.catalog_cover_urls('movies')
+    assert len(urls) == len(set(urls)) == 200
+
+def test_waiting_cover_prefetch_reports_progress(tmp_path):
+    class Images:
+        def has(self, url):
+            return False
+
+        def get(self, url, width=None):
+            return b'', 'image/jpeg'
+
+    prefetcher = CoverPrefetcher(cache=Images(), enabled=True, workers=2, min_interval=0)
+    updates = []
+    queued = cache_manager.prefetch_catalog_covers(
+        prefetcher, [f"http://img.example/{index}.jpg" for index in range(5)], 'movie',
+        lambda progress, message, status, details=None: updates.append(details), wait=True)
+    assert queued == 5
+    assert (updates[-1]['covers_done'], updates[-1]['covers_total']) == (5, 5)
+
+@pytest.fixture
+def cache_root(tmp_path, monkeypatch):
+    """A fresh CACHE_DIR with the default partition selected."""
+    monkeypatch.setattr(cache_manager, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(cache_manager, '_partition_dir', str(tmp_path))
+    monkeypatch.setattr(cache_manager, '_partition_account', None)
+    return tmp_path
+
+def test_same_username_on_two_servers_gets_two_partitions(cache_root):
+    first = cache_manager.set_cache_partition('http://one.example:8080', 'alice')
+    assert cache_manager.get_cache_dir() == first
+    save_cached_data(sample_movies(10), 'movies')
+
+    second = cache_manager.set_cache_partition('http://two.example:8080', 'alice')
+    assert second != first and cache_manager.get_cache_dir() == second
+    assert os.path.dirname(first) == os.path.dirname(second) == str(cache_root)
+    assert get_cached_json('movies') is None
+
+    assert cache_manager.set_cache_partition('HTTP://ONE.example:8080/', 'bob') == first
+    assert len(get_cached_json('movies')['movies']) == 10
+
+def test_clearing_the_server_returns_to_the_default_partition(cache_root):
+    cache_manager.set_cache_partition('http://one.example:8080', 'alice')
+    assert cache_manager.set_cache_partition(None) == str(cache_root)
+    assert cache_manager.get_cache_dir() == str(cache_root)
+    assert cache_manager._partition_account is None
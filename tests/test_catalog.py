@@ -0,0 +1,13 @@
+from cache_manager import get_cached_data, get_cached_json
+from catalog import memory_report
+from snapshot import SnapshotMapping
+
+def test_memory_report_measures_json_dicts_when_snapshot_is_current(movies_cache):
+    # get_cached_data prefers the snapshot, whose mapping is a thin proxy
+    assert isinstance(get_cached_data('movies')['movies'], SnapshotMapping)
+
+    report = memory_report('movies', get_cached_json('movies'))
+
+    assert report['items'] == 200
+    assert report['dict_bytes'] > report['compact_bytes'] > 0
+    assert report['ratio'] > 1
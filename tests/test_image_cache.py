@@ -0,0 +1,36 @@
+import io
+
+import pytest
+
+from image_cache import ImageCache
+
+Image = pytest.importorskip('PIL.Image')
+
+class Response:
+    def __init__(self, data):
+        self.raw = self
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def read(self, size, decode_content=True):
+        return self.data[:size]
+
+class Session:
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, url, timeout=None, stream=False):
+        return Response(self.data)
+
+def poster(width, height):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(output, 'PNG')
+    return output.getvalue()
+
+def test_covers_are_served_as_thumbnails(tmp_path):
+    cache = ImageCache(str(tmp_path), http_session=Session(poster(1000, 1500)))
+    data, mimetype = cache.get('http://img.example/1.png', 150)
+    assert mimetype == 'image/jpeg'
+    assert Image.open(io.BytesIO(data)).size == (150, 225)
@@ -0,0 +1,62 @@
+import os
+
+import library
+from library import LibraryIndex
+
+SERVER = 'http://provider.example'
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def test_reuse_downloads_when_the_hardlink_fails(tmp_path, monkeypatch):
+    index = LibraryIndex(root=str(tmp_path), path=str(tmp_path / '.library.json'))
+    first = write(str(tmp_path / 'Movies' / 'A.mp4'), b'movie')
+    index.record(first, 'movie', '7', SERVER)
+    monkeypatch.setattr(library, 'hardlink', lambda source, path: False)
+
+    target = str(tmp_path / 'Other' / 'A.mp4')
+    assert index.reuse(SERVER, 'movie', '7', 5, target) is None
+    assert not os.path.exists(target)
+
+def test_reuse_links_an_earlier_download(tmp_path):
+    index = LibraryIndex(root=str(tmp_path), path=str(tmp_path / '.library.json'))
+    first = write(str(tmp_path / 'Movies' / 'A.mp4'), b'movie')
+    index.record(first, 'movie', '7', SERVER)
+
+    target = str(tmp_path / 'Other' / 'A.mp4')
+    assert index.reuse(SERVER, 'movie', '7', 5, target) == 'linked'
+    index.record(target, 'movie', '7', SERVER)
+    assert os.path.samefile(first, target)
+
+def test_status_keeps_link_count_apart_from_indexed_streams(tmp_path):
+    index = LibraryIndex(root=str(tmp_path), path=str(tmp_path / '.library.json'))
+    index.record(write(str(tmp_path / 'Movies' / 'A.mp4'), b'movie'), 'movie', '7', SERVER)
+    status = index.status()
+    assert status['linked'] == 0 and status['indexed_streams'] == 1
+
+def test_sampled_hash_collisions_are_not_linked(tmp_path, monkeypatch):
+    monkeypatch.setattr(library, 'LIBRARY_FAST_HASH', True)
+    monkeypatch.setattr(library, 'fast_hash', lambda path: 'same')
+    index = LibraryIndex(root=str(tmp_path), path=str(tmp_path / '.library.json'))
+    first = write(str(tmp_path / 'a' / 'A.mp4'), b'first')
+    second = write(str(tmp_path / 'b' / 'B.mp4'), b'other')
+    index.record(first, 'movie', '1', SERVER)
+    index.record(second, 'movie', '2', 'http://other.example')
+    assert not os.path.samefile(first, second)
+    with open(second, 'rb') as f:
+        assert f.read() == b'other'
+
+def test_indexes_in_two_processes_keep_each_others_downloads(tmp_path):
+    # Two copies of the index stand in for two worker processes
+    first_worker = LibraryIndex(root=str(tmp_path), path=str(tmp_path / '.library.json'))
+    second_worker = LibraryIndex(root=str(tmp_path), path=str(tmp_path / '.library.json'))
+    first_worker.record(write(str(tmp_path / 'Movies' / 'A.mp4'), b'a'), 'movie', '1', SERVER)
+    second_worker.record(write(str(tmp_path / 'Movies' / 'B.mp4'), b'b'), 'movie', '2', SERVER)
+
+    reloaded = LibraryIndex(root=str(tmp_path), path=str(tmp_path / '.library.json'))
+    assert reloaded.has(SERVER, 'movie', '1') and reloaded.has(SERVER, 'movie', '2')
+    first_worker.refresh()
+    assert first_worker.has(SERVER, 'movie', '2')
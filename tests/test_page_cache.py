@@ -0,0 +1,34 @@
+from flask import Flask, g
+
+import page_cache
+from page_cache import cached_page
+
+def make_app(monkeypatch, age_hours):
+    """A one-route app whose movies catalog is `age_hours` old."""
+    monkeypatch.setattr(page_cache, 'get_catalog_age_hours', lambda content_type: age_hours())
+    monkeypatch.setattr(page_cache, 'get_cache_version', lambda content_type: 'v1')
+    monkeypatch.setattr(page_cache, 'page_cache', page_cache.PageCache())
+    app = Flask(__name__)
+    renders = []
+
+    @app.route('/movies')
+    @cached_page('movies', lambda: 'u1')
+    def movies():
+        renders.append(1)
+        g.page_cacheable = True
+        return f"render {len(renders)}"
+    return app.test_client(), renders
+
+def test_fresh_catalog_pages_are_cached(monkeypatch):
+    client, renders = make_app(monkeypatch, lambda: 1)
+    client.get('/movies')
+    assert client.get('/movies').data == b'render 1'
+    assert len(renders) == 1
+
+def test_stale_catalog_bypasses_cached_pages(monkeypatch):
+    age = [1]
+    client, renders = make_app(monkeypatch, lambda: age[0])
+    client.get('/movies')
+    age[0] = page_cache.LISTING_MAX_AGE_HOURS + 1
+    assert client.get('/movies').data == b'render 2'
+    assert len(renders) == 2
@@ -0,0 +1,51 @@
+import asyncio
+
+from block_cache import BlockCache
+from readahead import ReadAhead
+
+BLOCK = 1024
+
+class Upstream:
+    """Endless 206 body that records whether the connection is still open."""
+    status = 206
+
+    def __init__(self, connections):
+        self.connections = connections
+        self.content = self
+
+    async def read(self, size):
+        await asyncio.sleep(0)
+        return b'x' * min(size, BLOCK // 2)
+
+    async def __aenter__(self):
+        self.connections.append(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.connections.remove(self)
+
+class Session:
+    def __init__(self):
+        self.open = []
+
+    def get(self, url, headers=None):
+        return Upstream(self.open)
+
+def test_paused_viewers_release_the_upstream_connection(tmp_path):
+    async def scenario():
+        session = Session()
+        blocks = BlockCache(str(tmp_path), max_bytes=1024 * BLOCK, block_size=BLOCK)
+        readahead = ReadAhead(session, blocks, 'http://provider.example/1.mp4', 'k', 100 * BLOCK,
+                              window=4 * BLOCK, idle_timeout=0.2)
+        viewer = object()
+        readahead.attach(viewer, 0)
+        await asyncio.sleep(0.05)
+        assert len(session.open) == 1  # Window full, connection held open
+        await asyncio.sleep(0.3)
+        assert session.open == [] and readahead.idle_closes == 1
+
+        readahead.advance(viewer, 2 * BLOCK)
+        await asyncio.sleep(0.05)
+        assert readahead.connections == 2 and blocks.has_block('k', 5)
+        await readahead.stop()
+    asyncio.run(scenario())
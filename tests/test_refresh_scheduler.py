@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import cache_manager
+from cache_manager import save_cached_data, set_cache_partition
+from refresh_scheduler import RefreshScheduler
+
+from conftest import sample_movies
+
+def test_scheduler_checks_the_saved_accounts_partition(partition, monkeypatch):
+    monkeypatch.setattr(cache_manager, 'CACHE_DIR', str(partition))
+    monkeypatch.setattr(cache_manager, '_partition_account', None)
+    set_cache_partition('http://provider.example', 'u1')
+    fresh = dict(sample_movies(10), last_fetch_date=datetime.now().isoformat())
+    save_cached_data(fresh, 'movies')
+    set_cache_partition(None)
+
+    builds = []
+    fetchers = {'movies': (lambda: builds.append('movies') or [], lambda category_id: [])}
+    scheduler = RefreshScheduler(lambda: {'username': 'u1'}, fetchers, window='',
+                                 select_account=lambda: set_cache_partition('http://provider.example', 'u1'))
+    assert scheduler.run_pending() == []
+    assert builds == []
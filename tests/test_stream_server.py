@@ -0,0 +1,82 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from block_cache import BlockCache, parse_range, resolve_range
+from stream_server import StreamProxyServer
+
+VIDEO = bytes(range(256)) * 40
+
+def sign(url):
+    return f"sig-{len(url)}"
+
+def upstream_app(requests):
+    """A provider serving VIDEO with byte-range support."""
+    async def video(request):
+        requests.append(request.headers.get('Range'))
+        if 'Range' not in request.headers:
+            return web.Response(body=VIDEO, content_type='video/mp4')
+        start, end = resolve_range(parse_range(request.headers['Range']), len(VIDEO))
+        return web.Response(status=206, body=VIDEO[start:end + 1], content_type='video/mp4',
+                            headers={'Content-Range': f'bytes {start}-{end}/{len(VIDEO)}'})
+    app = web.Application()
+    app.router.add_get('/movie/{username}/{password}/{name}', video)
+    return app
+
+async def fetch_through_proxy(proxy, path='/movie/u/p/7.mp4', headers=None, signer=sign):
+    """Runs the provider and the proxy; returns (status, body, provider Range headers)."""
+    requests = []
+    async with TestServer(upstream_app(requests)) as upstream:
+        proxy.session = aiohttp.ClientSession()
+        proxy_app = web.Application()
+        proxy_app.router.add_get('/stream_proxy', proxy.handle_stream)
+        try:
+            async with TestClient(TestServer(proxy_app)) as client:
+                url = str(upstream.make_url(path))
+                response = await client.get('/stream_proxy', params={'url': url, 'sig': signer(url)},
+                                            headers=headers)
+                return response.status, await response.read(), requests
+        finally:
+            await proxy.session.close()
+
+def test_zero_readahead_serves_blocks_without_a_readahead(tmp_path):
+    proxy = StreamProxyServer(port=0, blocks=BlockCache(str(tmp_path), max_bytes=1 << 20, block_size=1024),
+                              signer=sign)
+    proxy.readahead_bytes = 0
+    status, body, requests = asyncio.run(fetch_through_proxy(proxy))
+    assert status == 200 and body == VIDEO
+    assert proxy.stats['readahead_connections'] == 0 and not proxy.readaheads
+    # The size probe, then one in-line fetch of every block
+    assert requests == ['bytes=0-0', f'bytes=0-{len(VIDEO) - 1}']
+
+def test_ranges_past_the_end_are_unsatisfiable(tmp_path):
+    proxy = StreamProxyServer(port=0, blocks=BlockCache(str(tmp_path), max_bytes=1 << 20, block_size=1024),
+                              signer=sign)
+    status, body, _ = asyncio.run(fetch_through_proxy(proxy, headers={'Range': f'bytes={len(VIDEO)}-'}))
+    assert status == 416
+
+def test_suffix_ranges_are_served_from_blocks(tmp_path):
+    proxy = StreamProxyServer(port=0, blocks=BlockCache(str(tmp_path), max_bytes=1 << 20, block_size=1024),
+                              signer=sign)
+    proxy.readahead_bytes = 0
+    status, body, _ = asyncio.run(fetch_through_proxy(proxy, headers={'Range': 'bytes=-100'}))
+    assert status == 206 and body == VIDEO[-100:]
+
+def test_unsigned_stream_urls_are_refused(tmp_path):
+    proxy = StreamProxyServer(port=0, blocks=BlockCache(str(tmp_path), max_bytes=1 << 20, block_size=1024),
+                              signer=sign)
+    status, _, requests = asyncio.run(fetch_through_proxy(proxy, signer=lambda url: 'forged'))
+    assert status == 403 and requests == []
+
+def test_a_proxy_without_a_signer_refuses_everything(tmp_path):
+    proxy = StreamProxyServer(port=0, blocks=BlockCache(str(tmp_path), max_bytes=1 << 20, block_size=1024))
+    status, _, requests = asyncio.run(fetch_through_proxy(proxy))
+    assert status == 403 and requests == []
+
+def test_public_url_carries_the_signature():
+    proxy = StreamProxyServer(port=5001, signer=sign)
+    url = proxy.public_url('http://provider.example/movie/u/p/7.mp4', 'http', 'tv.example:5000')
+    assert url == ('http://tv.example:5001/stream_proxy?url=http%3A%2F%2Fprovider.example%2Fmovie%2Fu%2Fp%2F7.mp4'
+                   '&sig=sig-39')
@@ -0,0 +1,21 @@
+import time
+
+from suggest_index import get_suggestions
+
+def wait_for_suggestions(query, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        suggestions = get_suggestions(query)
+        if suggestions:
+            return suggestions
+        time.sleep(0.01)
+    return []
+
+def test_index_is_built_in_the_background(movies_cache):
+    # The first request does not wait for the build
+    assert get_suggestions('movie 1') == []
+    suggestions = wait_for_suggestions('movie 1')
+    assert suggestions and all(s['label'].startswith('Movie 1') for s in suggestions)
+
+def test_no_suggestions_without_a_catalog(partition):
+    assert get_suggestions('anything') == []
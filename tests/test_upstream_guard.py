@@ -0,0 +1,6 @@
+import upstream_guard
+
+def test_workers_split_the_concurrency_limits(monkeypatch):
+    monkeypatch.setattr(upstream_guard, 'WEB_WORKERS', 4)
+    assert upstream_guard.worker_share(16) == 4
+    assert upstream_guard.worker_share(3) == 1
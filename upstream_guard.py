@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+import requests
+
+# Adaptive concurrency: grow by one slot per window of successes, halve on throttling
+API_INITIAL_CONCURRENCY = int(os.environ.get('API_INITIAL_CONCURRENCY', 4))
+API_MAX_CONCURRENCY = int(os.environ.get('API_MAX_CONCURRENCY', 16))
+API_MIN_CONCURRENCY = 1
+# Each worker process limits its own calls, so it gets an equal share of the limits (set by gunicorn.conf.py)
+WEB_WORKERS = max(1, int(os.environ.get('WEB_WORKERS', 1)))
+
+def worker_share(limit):
+    """This process's part of an account-wide concurrency limit."""
+    return max(API_MIN_CONCURRENCY, limit // WEB_WORKERS)
+API_ACQUIRE_TIMEOUT = 30
+# Consecutive failures that open the breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', 30))
+
+THROTTLE_STATUSES = (429, 503)
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    """Raised instead of calling the provider while its circuit breaker is open."""
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: +1/limit per success, halved on throttling."""
+
+    def __init__(self, initial=worker_share(API_INITIAL_CONCURRENCY), minimum=API_MIN_CONCURRENCY,
+                 maximum=worker_share(API_MAX_CONCURRENCY)):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=API_ACQUIRE_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise UpstreamUnavailable("Timed out waiting for an upstream request slot")
+                self._condition.wait(remaining)
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                # Requests already in flight saw the same overload; decrease once per burst
+                now = time.monotonic()
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through after a cool-down."""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def cancel_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"Circuit breaker opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def is_open(self):
+        with self._lock:
+            return self.state == 'open' and time.monotonic() - self.opened_at < self.reset_seconds
+
+class UpstreamGuard:
+    """Limiter and breaker for one account's player_api calls."""
+
+    def __init__(self):
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def get(self, http_session, url, **kwargs):
+        """session.get() under the concurrency limit; raises UpstreamUnavailable while the breaker is open."""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable("Provider is unavailable (circuit breaker open)")
+        try:
+            self.limiter.acquire()
+        except UpstreamUnavailable:
+            self.rejected += 1
+            self.breaker.cancel_probe()
+            raise
+        throttled = failed = False
+        try:
+            self.calls += 1
+            response = http_session.get(url, **kwargs)
+            throttled = response.status_code in THROTTLE_STATUSES
+            failed = throttled or response.status_code >= 500
+            return response
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            throttled = failed = True
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.limiter.release(throttled)
+            if failed:
+                self.failures += 1
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+
+    def status(self):
+        return {
+            'breaker': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'concurrency_limit': round(self.limiter.limit, 2),
+            'in_flight': self.limiter.in_flight,
+            'throttled': self.limiter.throttled,
+            'calls': self.calls,
+            'failures': self.failures,
+            'rejected': self.rejected
+        }
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+def guard_for(user):
+    """Returns the guard for an account (server + username)."""
+    key = (user['server'].rstrip('/'), user['username'])
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            guard = _guards[key] = UpstreamGuard()
+        return guard
+
+def guards_status():
+    with _guards_lock:
+        return [dict(guard.status(), server=server, username=username)
+                for (server, username), guard in _guards.items()]